@@ -4,8 +4,10 @@ from .models import (
     Achat,
     Commande,
     Facture,
+    Job,
     LigneAchat,
     LigneCommande,
+    MouvementStock,
     Paiement,
     Person,
     Produit,
@@ -59,6 +61,18 @@ class PaiementAdmin(admin.ModelAdmin):
     search_fields = ("facture__id",)
 
 
+class MouvementStockAdmin(admin.ModelAdmin):
+    list_display = ("produit", "type", "quantite", "date_mouvement")
+    list_filter = ("type",)
+    search_fields = ("produit__nom",)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "type", "statut", "cree_le", "fin")
+    list_filter = ("type", "statut")
+    search_fields = ("id",)
+
+
 class VenteHistoriqueAdmin(admin.ModelAdmin):
     list_display = ("produit", "mois", "quantite")
     search_fields = ("produit__nom",)
@@ -72,4 +86,6 @@ admin.site.register(Commande, CommandeAdmin)
 admin.site.register(LigneCommande, LigneCommandeAdmin)
 admin.site.register(Facture, FactureAdmin)
 admin.site.register(Paiement, PaiementAdmin)
-admin.site.register(VenteHistorique, VenteHistoriqueAdmin)
\ No newline at end of file
+admin.site.register(VenteHistorique, VenteHistoriqueAdmin)
+admin.site.register(MouvementStock, MouvementStockAdmin)
+admin.site.register(Job, JobAdmin)
\ No newline at end of file
@@ -5,4 +5,8 @@ class ErpAppConfig(AppConfig):
     name = 'erp_app'
 
     def ready(self):
+        import erp_app.checks
         import erp_app.signals
+        from erp_app.mise_en_page import configurer_reportlab
+
+        configurer_reportlab()
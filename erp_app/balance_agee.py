@@ -0,0 +1,80 @@
+# erp_app/balance_agee.py
+"""
+Balance âgée des créances clients : reste dû des factures de commande non
+soldées, réparti par ancienneté du retard (à échoir, 0–30, 31–60, 61–90 et
+plus de 90 jours).
+
+L'échéance d'une facture est `date_echeance_restant`, à défaut sa date. Les
+tranches sont des sommes conditionnelles sur des bornes de dates calculées
+une fois : une seule requête groupée par client ; le total général est la
+somme des lignes.
+
+À la date du jour, le reste dû se lit dans `montant_paye` et la requête est
+servie par l'index partiel des factures ouvertes. À une date d'arrêté passée,
+seules les factures émises ce jour-là ou avant sont retenues, et le montant
+payé est la somme de leurs paiements datés de ce jour ou avant (sous-requête
+corrélée). L'échéance reste celle d'aujourd'hui : une facture soldée depuis,
+dont l'échéance restante a été effacée, est datée par sa date de facture.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localdate
+
+from .models import Facture, Paiement
+from .unite_travail import MONTANT, somme_correlee
+
+TRANCHES = ("a_echoir", "0_30", "31_60", "61_90", "plus_90")
+
+
+def _conditions(jour):
+    """Q de chaque tranche, sur l'échéance annotée `echeance`."""
+    j30, j60, j90 = (jour - timedelta(days=n) for n in (30, 60, 90))
+    return {
+        "a_echoir": Q(echeance__gt=jour),
+        "0_30": Q(echeance__lte=jour, echeance__gte=j30),
+        "31_60": Q(echeance__lt=j30, echeance__gte=j60),
+        "61_90": Q(echeance__lt=j60, echeance__gte=j90),
+        "plus_90": Q(echeance__lt=j90),
+    }
+
+
+def balance_agee(jour=None):
+    """
+    {"date", "clients": [{client_id, client_nom, <tranches>, total}], "total": {<tranches>, total}},
+    clients triés par nom. `jour` : date d'arrêté, aujourd'hui par défaut.
+    """
+    aujourdhui = localdate()
+    jour = jour or aujourdhui
+    factures = Facture.objects.filter(commande__isnull=False)
+    if jour >= aujourdhui:
+        factures = factures.exclude(statut="payée").annotate(reste=F("montant_total") - F("montant_paye"))
+    else:
+        paye = somme_correlee(Paiement.objects.filter(date_paiement__lte=jour), "facture", "pk", F("montant"))
+        factures = factures.filter(date_facture__lte=jour).annotate(reste=F("montant_total") - paye).filter(reste__gt=0)
+    sommes = {
+        tranche: Coalesce(Sum("reste", filter=condition), Value(Decimal(0)), output_field=MONTANT)
+        for tranche, condition in _conditions(jour).items()
+    }
+    lignes = (
+        factures
+        .annotate(echeance=Coalesce("date_echeance_restant", "date_facture"))
+        .values(client_id=F("commande__client_id"), client_nom=F("commande__client__nom"))
+        .annotate(**sommes)
+        .order_by("client_nom", "client_id")
+    )
+
+    clients = []
+    total = dict.fromkeys(TRANCHES, Decimal(0))
+    for ligne in lignes:
+        ligne["total"] = sum(ligne[tranche] for tranche in TRANCHES)
+        if not ligne["total"]:
+            continue
+        for tranche in TRANCHES:
+            total[tranche] += ligne[tranche]
+        clients.append(ligne)
+    total["total"] = sum(total.values())
+    return {"date": jour, "clients": clients, "total": total}
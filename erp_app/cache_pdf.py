@@ -0,0 +1,167 @@
+# erp_app/cache_pdf.py
+"""
+Cache disque des PDF de factures, adressé par contenu.
+
+Un PDF est rangé sous l'empreinte (SHA-256) des `DonneesFacture` dont il est
+le rendu : totaux, statut, tiers, lignes, paiements et relances. Une facture
+inchangée retrouve donc son fichier sans être redessinée, et toute
+modification donne une autre empreinte : une entrée ne peut pas être périmée,
+seulement orpheline. L'empreinte sert aussi d'ETag.
+
+Les orphelins sont supprimés de deux façons : à la modification d'un paiement
+ou d'une relance (signaux, voir erp_app.signals), le fichier de la facture est
+retiré après le commit ; et la taille totale du dossier est bornée
+(`PDF_CACHE_TAILLE_MAX`), les fichiers les moins récemment servis étant
+évincés en premier (la date de modification est rafraîchie à chaque lecture).
+Les fichiers temporaires d'écriture sont comptés dans cette taille ; ceux
+qu'un processus arrêté en cours d'écriture a laissés sont supprimés par
+l'éviction.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import astuple
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .pdf_factures import rendre_facture
+
+# À changer avec la mise en page : les anciens rendus ne sont plus retrouvés
+VERSION_RENDU = 2
+
+_CLE_TAILLE = "cache_pdf:taille"
+TEMPORAIRE_AGE_MAX = 600  # secondes : au-delà, un .tmp n'est plus en cours d'écriture
+
+
+def empreinte(donnees):
+    return hashlib.sha256(repr((VERSION_RENDU, astuple(donnees))).encode()).hexdigest()
+
+
+def _dossier():
+    return settings.PDF_CACHE_DIR
+
+
+def _chemin(empreinte):
+    return os.path.join(_dossier(), empreinte[:2], f"{empreinte}.pdf")
+
+
+def _cle(facture_id):
+    return f"cache_pdf:facture:{facture_id}"
+
+
+def _supprimer_fichier(chemin):
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+
+def ouvrir_pdf(donnees, empreinte_calculee=None):
+    """
+    PDF de `donnees` ouvert en lecture binaire, rendu et rangé s'il n'est pas
+    déjà en cache. Le fichier reste lisible s'il est évincé entre-temps.
+    """
+    cle = empreinte_calculee or empreinte(donnees)
+    chemin = _chemin(cle)
+    try:
+        fichier = open(chemin, "rb")
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            os.utime(chemin)  # succès : plus récemment servi
+        except FileNotFoundError:
+            pass  # évincé entre-temps, le fichier ouvert reste lisible
+        return fichier
+
+    pdf = rendre_facture(donnees)
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    # Écriture dans un fichier temporaire puis renommage : un lecteur
+    # concurrent ne voit jamais un PDF partiel
+    descripteur, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".tmp")
+    try:
+        with os.fdopen(descripteur, "wb") as fichier:
+            fichier.write(pdf)
+        os.replace(temporaire, chemin)
+    except BaseException:
+        _supprimer_fichier(temporaire)
+        raise
+    fichier = open(chemin, "rb")
+
+    # Le rendu précédent de cette facture est désormais orphelin
+    precedente = cache.get(_cle(donnees.id))
+    if precedente and precedente != cle:
+        _supprimer_fichier(_chemin(precedente))
+    cache.set(_cle(donnees.id), cle, None)
+    if _ajouter_taille(len(pdf)) > settings.PDF_CACHE_TAILLE_MAX:
+        evincer()
+    return fichier
+
+
+def _ajouter_taille(octets):
+    """
+    Taille cumulée des écritures depuis le dernier inventaire : une majoration
+    de la taille du dossier (les suppressions n'en sont pas déduites), qui
+    évite de le parcourir à chaque rendu.
+    """
+    try:
+        return cache.incr(_CLE_TAILLE, octets)
+    except ValueError:
+        # Inconnue (premier rendu, cache vidé) : inventaire au prochain dépassement possible
+        cache.add(_CLE_TAILLE, octets, None)
+        return settings.PDF_CACHE_TAILLE_MAX + 1
+
+
+def invalider(facture_ids):
+    """Retire le dernier rendu de chacune des factures (appelé après le commit)."""
+    cles = cache.get_many([_cle(pk) for pk in facture_ids])
+    for cle, valeur in cles.items():
+        _supprimer_fichier(_chemin(valeur))
+    cache.delete_many(list(cles))
+
+
+def invalider_apres_commit(facture_ids, using=None):
+    transaction.on_commit(partial(invalider, list(facture_ids)), using=using)
+
+
+def evincer(taille_max=None):
+    """
+    Supprime les temporaires abandonnés, puis les PDF les moins récemment
+    servis jusqu'à repasser sous `taille_max` octets.
+    """
+    taille_max = settings.PDF_CACHE_TAILLE_MAX if taille_max is None else taille_max
+    fichiers, total, supprimes = [], 0, 0
+    if not os.path.isdir(_dossier()):
+        return 0
+    abandon = time.time() - TEMPORAIRE_AGE_MAX
+    for sous_dossier in os.scandir(_dossier()):
+        if not sous_dossier.is_dir():
+            continue
+        for entree in os.scandir(sous_dossier.path):
+            try:
+                infos = entree.stat()
+            except FileNotFoundError:
+                continue  # renommé ou supprimé entre-temps
+            if entree.name.endswith(".tmp"):
+                if infos.st_mtime < abandon:
+                    _supprimer_fichier(entree.path)
+                    supprimes += 1
+                else:
+                    total += infos.st_size  # écriture en cours
+            elif entree.name.endswith(".pdf"):
+                fichiers.append((infos.st_mtime, infos.st_size, entree.path))
+                total += infos.st_size
+    if total > taille_max:
+        for _, taille, chemin in sorted(fichiers):
+            _supprimer_fichier(chemin)
+            supprimes += 1
+            total -= taille
+            if total <= taille_max:
+                break
+    cache.set(_CLE_TAILLE, total, None)
+    return supprimes
@@ -0,0 +1,89 @@
+# erp_app/cache_reponses.py
+"""
+Cache des réponses des listes et fiches de référentiel (produits, personnes).
+
+La représentation sérialisée est rangée dans le cache Django sous l'ETag de la
+requête (voir erp_app.versions) : l'URL complète avec ses paramètres, le format
+accepté et les versions des modèles concernés. Une écriture sur un produit ou
+une personne incrémente ces versions par les signaux, et la clé suivante ne
+correspond plus à l'ancienne entrée : l'invalidation suit exactement les
+objets modifiés. Les entrées orphelines expirent d'elles-mêmes (`duree_cache`).
+
+Les succès et échecs sont comptés dans le cache, par ressource, pour être
+partagés entre processus ; `statistiques()` les restitue. La liste des
+ressources ne vient pas du cache : c'est le premier modèle de `modeles_etag`
+de chaque vue qui utilise le mixin, connue de tous les processus.
+
+Comme les ETag, le cache des réponses n'est actif que sur un cache partagé
+(voir erp_app.versions.versions_partagees) : sinon chaque processus servirait
+ses propres réponses, sans voir les écritures des autres.
+"""
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from .versions import VersionEtagMixin
+
+# Ressources des vues qui utilisent ReponseCacheMixin, à la définition des classes
+RESSOURCES = set()
+
+
+def _compter(ressource, evenement):
+    cle = f"cache_reponses:{ressource}:{evenement}"
+    try:
+        cache.incr(cle)
+    except ValueError:
+        # Absente : créée à 1, ou incrémentée si un autre processus vient de la créer
+        if not cache.add(cle, 1, None):
+            cache.incr(cle)
+
+
+def statistiques():
+    """Succès, échecs et taux de succès par ressource mise en cache."""
+    ressources = sorted(RESSOURCES)
+    cles = [f"cache_reponses:{r}:{e}" for r in ressources for e in ("succes", "echecs")]
+    valeurs = cache.get_many(cles)
+    resultat = {}
+    for ressource in ressources:
+        succes = valeurs.get(f"cache_reponses:{ressource}:succes", 0)
+        echecs = valeurs.get(f"cache_reponses:{ressource}:echecs", 0)
+        total = succes + echecs
+        resultat[ressource] = {
+            "succes": succes,
+            "echecs": echecs,
+            "taux_succes": round(succes / total, 3) if total else None,
+        }
+    return resultat
+
+
+class ReponseCacheMixin(VersionEtagMixin):
+    """
+    Lecture au travers du cache pour `list` et `retrieve` : en cas de succès,
+    ni requête SQL ni sérialisation. Seules les réponses 200 non streamées
+    (hors `?page_size=all`) sont conservées.
+    """
+    duree_cache = 300
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.modeles_etag:
+            RESSOURCES.add(cls.ressource_cache())
+
+    @classmethod
+    def ressource_cache(cls):
+        return cls.modeles_etag[0]._meta.model_name
+
+    def _repondre(self, handler, request, etag, *args, **kwargs):
+        ressource = self.ressource_cache()
+        cle = f"reponse:{request.get_host()}:{etag}"
+        donnees = cache.get(cle)
+        if donnees is not None:
+            _compter(ressource, "succes")
+            return Response(donnees)
+
+        _compter(ressource, "echecs")
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and not response.streaming:
+            cache.set(cle, response.data, self.duree_cache)
+        return response
@@ -0,0 +1,19 @@
+# erp_app/checks.py
+"""Contrôles de configuration de l'application (`python manage.py check`)."""
+
+from django.core.checks import Tags, Warning, register
+
+from .versions import versions_partagees
+
+
+@register(Tags.caches)
+def verifier_cache_versions(app_configs, **kwargs):
+    if versions_partagees():
+        return []
+    return [Warning(
+        "Le cache par défaut est propre à chaque processus : les ETag et le cache des réponses "
+        "de l'API sont désactivés.",
+        hint="Définir CACHE_URL vers un cache partagé par tous les workers (Redis, memcached, fichiers), "
+             "ou VERSIONS_CACHE_PARTAGE = True si l'API ne tourne que dans un seul processus.",
+        id="erp_app.W001",
+    )]
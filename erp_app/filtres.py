@@ -0,0 +1,141 @@
+# erp_app/filtres.py
+"""
+Filtres déclaratifs des listes de l'API : les paramètres de requête sont
+validés par un serializer propre à chaque vue (`filtre_class`), puis traduits
+en filtres ORM sur des champs indexés. Un paramètre invalide renvoie une 400
+au lieu d'être ignoré.
+"""
+
+from django.utils.timezone import localdate
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Facture, Paiement, TransactionTresorerie
+
+
+class ListeChoixField(serializers.MultipleChoiceField):
+    """Choix multiples passés séparés par des virgules : ?statut=impayée,partielle"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [v.strip() for v in data.split(",") if v.strip()]
+        return super().to_internal_value(data)
+
+
+class FiltreSerializer(serializers.Serializer):
+    """
+    Paramètres acceptés par une liste. `correspondances` associe chaque
+    paramètre validé à son lookup ORM ; `filtrer` peut être surchargée pour
+    les filtres qui ne sont pas de simples lookups.
+    """
+    correspondances = {}
+    bornes = ()  # couples (minimum, maximum) à contrôler
+
+    def validate(self, data):
+        for minimum, maximum in self.bornes:
+            if minimum in data and maximum in data and data[minimum] > data[maximum]:
+                raise serializers.ValidationError({minimum: f"Doit être inférieur ou égal à '{maximum}'."})
+        return data
+
+    def filtrer(self, queryset, donnees):
+        lookups = {
+            self.correspondances[nom]: valeur
+            for nom, valeur in donnees.items()
+            if nom in self.correspondances
+        }
+        return queryset.filter(**lookups) if lookups else queryset
+
+
+class FiltreParametresBackend(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        filtre_class = getattr(view, "filtre_class", None)
+        if filtre_class is None:
+            return queryset
+        noms = set(filtre_class().fields)
+        filtre = filtre_class(data={k: v for k, v in request.query_params.items() if k in noms})
+        if not filtre.is_valid():
+            raise ValidationError(filtre.errors)
+        return filtre.filtrer(queryset, filtre.validated_data)
+
+
+# ---------------------------------------------------------------------------
+# Filtres par ressource
+# ---------------------------------------------------------------------------
+
+# Statuts calculés, plus le statut initial posé à la création de la facture
+STATUTS_FACTURE = [c for c, _ in Facture.STATUT_CHOICES] + ["en attente"]
+
+
+class FiltreFactureSerializer(FiltreSerializer):
+    statut = ListeChoixField(choices=STATUTS_FACTURE, required=False)
+    client = serializers.IntegerField(min_value=1, required=False)
+    fournisseur = serializers.IntegerField(min_value=1, required=False)
+    date_min = serializers.DateField(required=False)
+    date_max = serializers.DateField(required=False)
+    montant_min = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    montant_max = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    en_retard = serializers.BooleanField(required=False, help_text="Échéance restante dépassée")
+
+    correspondances = {
+        "statut": "statut__in",
+        "client": "commande__client_id",
+        "fournisseur": "achat__fournisseur_id",
+        "date_min": "date_facture__gte",
+        "date_max": "date_facture__lte",
+        "montant_min": "montant_total__gte",
+        "montant_max": "montant_total__lte",
+    }
+    bornes = (("date_min", "date_max"), ("montant_min", "montant_max"))
+
+    def filtrer(self, queryset, donnees):
+        queryset = super().filtrer(queryset, donnees)
+        if "en_retard" in donnees:
+            # Seules les factures non soldées ont une échéance restante (index partiel)
+            retard = {"date_echeance_restant__lt": localdate()}
+            queryset = queryset.filter(**retard) if donnees["en_retard"] else queryset.exclude(**retard)
+        return queryset
+
+
+class FiltrePaiementSerializer(FiltreSerializer):
+    facture = serializers.IntegerField(min_value=1, required=False)
+    client = serializers.IntegerField(min_value=1, required=False)
+    methode = ListeChoixField(choices=Paiement.METHODE_CHOICES, required=False)
+    compte = serializers.IntegerField(min_value=1, required=False)
+    date_min = serializers.DateField(required=False)
+    date_max = serializers.DateField(required=False)
+    montant_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    montant_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    correspondances = {
+        "facture": "facture_id",
+        "client": "facture__commande__client_id",
+        "methode": "methode__in",
+        "compte": "compte_bancaire_id",
+        "date_min": "date_paiement__gte",
+        "date_max": "date_paiement__lte",
+        "montant_min": "montant__gte",
+        "montant_max": "montant__lte",
+    }
+    bornes = (("date_min", "date_max"), ("montant_min", "montant_max"))
+
+
+class FiltreTransactionSerializer(FiltreSerializer):
+    type = serializers.ChoiceField(choices=TransactionTresorerie.TYPE_CHOICES, required=False)
+    compte = serializers.IntegerField(min_value=1, required=False)
+    facture = serializers.IntegerField(min_value=1, required=False)
+    date_min = serializers.DateField(required=False)
+    date_max = serializers.DateField(required=False)
+    montant_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    montant_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    correspondances = {
+        "type": "type",
+        "compte": "compte_id",
+        "facture": "facture_id",
+        "date_min": "date_transaction__gte",
+        "date_max": "date_transaction__lte",
+        "montant_min": "montant__gte",
+        "montant_max": "montant__lte",
+    }
+    bornes = (("date_min", "date_max"), ("montant_min", "montant_max"))
@@ -0,0 +1,44 @@
+# erp_app/graphiques.py
+"""
+Graphiques PNG de l'API. Les figures sont construites avec l'API objet de
+matplotlib (Figure), sans l'état global de pyplot : elles peuvent être
+produites en parallèle par les threads du worker (voir erp_app.jobs).
+"""
+
+import io
+
+import numpy as np
+from matplotlib.figure import Figure
+from sklearn.linear_model import LinearRegression
+
+from .models import VenteHistorique
+
+
+def prevision_ventes_png(produit_id):
+    """Ventes mensuelles, régression et prévision du mois suivant ; None sans historique."""
+    quantites = list(
+        VenteHistorique.objects.filter(produit_id=produit_id).order_by('mois').values_list('quantite', flat=True)
+    )
+    if not quantites:
+        return None
+
+    X = np.array(range(len(quantites))).reshape(-1, 1)
+    y = np.array(quantites)
+    model = LinearRegression().fit(X, y)
+    y_pred = model.predict(X)
+    next_month = model.predict([[len(X)]])
+
+    figure = Figure(figsize=(8, 4))
+    axes = figure.subplots()
+    axes.plot(X, y, 'bo-', label='Ventes réelles')
+    axes.plot(X, y_pred, 'r--', label='Régression')
+    axes.plot(len(X), next_month, 'go', label='Prévision')
+    axes.set_title(f"Prévision des ventes - Produit ID {produit_id}")
+    axes.set_xlabel("Mois (index)")
+    axes.set_ylabel("Quantité vendue")
+    axes.legend()
+    axes.grid(True)
+
+    buf = io.BytesIO()
+    figure.savefig(buf, format='png')
+    return buf.getvalue()
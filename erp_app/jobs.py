@@ -0,0 +1,290 @@
+# erp_app/jobs.py
+"""
+Tâches de fond : les traitements longs (PDF, archives, exports, graphiques)
+sont enregistrés comme `Job` par l'API, qui répond aussitôt 202, puis
+exécutés par le worker (`python manage.py worker_jobs`) hors des processus
+web. Le client suit l'avancement sur /api/jobs/{id}/ et télécharge le
+résultat sur /api/jobs/{id}/resultat/.
+
+Un job est réservé par un UPDATE conditionnel (`statut = en attente`) : deux
+threads ou deux workers ne peuvent pas prendre le même, sans verrou de ligne
+ni dépendance au moteur. Les fichiers produits sont écrits sous `JOBS_DIR`.
+
+Chaque job en cours porte son worker (`proprietaire`, hôte:pid) et un
+`battement` rafraîchi par le thread de surveillance de ce worker : seuls les
+jobs dont le battement est trop ancien (worker arrêté ou planté) sont remis
+en attente. Un worker n'enregistre l'issue d'un job que s'il en détient
+toujours la réservation. Les jobs finis sont purgés, fichiers compris, après
+`JOBS_CONSERVATION_JOURS`.
+Une tâche est une fonction `f(job)` enregistrée par `@tache(nom)`, qui
+renvoie le résultat JSON du job (ou None) et écrit son éventuel fichier par
+`fichier_resultat`.
+"""
+
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache_pdf import ouvrir_pdf
+from .filtres import FiltreFactureSerializer, FiltreTransactionSerializer
+from .graphiques import prevision_ventes_png
+from .models import Facture, Job, Person, TransactionTresorerie
+from .pdf_factures import donnees_facture, ecrire_zip, factures_pour_pdf
+from .releve import flux_releve, periode_du_mois
+from .renderers import JSONFluxRenderer, NDJSONRenderer
+from .serializers import FactureSerializer, TransactionTresorerieSerializer
+
+logger = logging.getLogger(__name__)
+
+TACHES = {}
+
+
+def tache(nom):
+    def enregistrer(fonction):
+        TACHES[nom] = fonction
+        return fonction
+    return enregistrer
+
+
+def soumettre(type, **parametres):
+    if type not in TACHES:
+        raise ValueError(f"Tâche inconnue : {type}")
+    return Job.objects.create(type=type, parametres=parametres)
+
+
+@contextmanager
+def fichier_resultat(job, nom_fichier, type_contenu):
+    """Fichier binaire du résultat de `job`, enregistré sur le job à la fermeture."""
+    # Un dossier par réservation : un worker évincé n'écrase pas le fichier
+    # de celui qui a repris le job
+    tentative = f"{job.debut:%Y%m%d%H%M%S%f}" if job.debut else ""
+    dossier = os.path.join(settings.JOBS_DIR, str(job.pk), tentative)
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, nom_fichier)
+    try:
+        with open(chemin, "wb") as sortie:
+            yield sortie
+    except BaseException:
+        # Pas de fichier partiel : le job échoue sans résultat
+        os.remove(chemin)
+        raise
+    job.fichier, job.nom_fichier, job.type_contenu = chemin, nom_fichier, type_contenu
+
+
+# ---------------------------------------------------------------------------
+# Exécution
+# ---------------------------------------------------------------------------
+
+def identifiant_worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def reserver(proprietaire="", candidats=20):
+    """Prochain job en attente, passé « en cours » pour `proprietaire` ; None si la file est vide."""
+    attente = Job.objects.filter(statut="en attente")
+    for pk in attente.order_by("id").values_list("pk", flat=True)[:candidats]:
+        maintenant = timezone.now()
+        # Pris entre-temps par un autre worker : 0 ligne modifiée, on passe au suivant
+        if attente.filter(pk=pk).update(
+            statut="en cours", debut=maintenant, battement=maintenant, proprietaire=proprietaire,
+        ):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def executer(job):
+    """
+    Exécute `job` et enregistre son issue, si le job est toujours à cette
+    réservation : repris entre-temps par un autre worker (battement manqué),
+    le résultat est abandonné et son fichier supprimé.
+    """
+    reservation = Job.objects.filter(pk=job.pk, statut="en cours", proprietaire=job.proprietaire, debut=job.debut)
+    try:
+        job.resultat = TACHES[job.type](job)
+    except Exception as e:
+        logger.exception("Job #%s (%s) en échec", job.pk, job.type)
+        if not reservation.update(statut="échoué", erreur=f"{type(e).__name__} : {e}", fin=timezone.now()):
+            logger.warning("Job #%s repris par un autre worker : échec ignoré", job.pk)
+        return False
+    job.statut, job.fin = "terminé", timezone.now()
+    if not reservation.update(
+        statut=job.statut, resultat=job.resultat, fichier=job.fichier, nom_fichier=job.nom_fichier,
+        type_contenu=job.type_contenu, fin=job.fin,
+    ):
+        logger.warning("Job #%s repris par un autre worker : résultat abandonné", job.pk)
+        if job.fichier:
+            os.remove(job.fichier)
+        return False
+    return True
+
+
+def traiter_en_attente(proprietaire=""):
+    """Exécute les jobs en attente jusqu'à vider la file ; renvoie le nombre traité."""
+    n = 0
+    while (job := reserver(proprietaire)) is not None:
+        executer(job)
+        n += 1
+    return n
+
+
+def travailler(arret, attente=1.0, proprietaire=""):
+    """Boucle d'un thread du worker, jusqu'à `arret` (threading.Event)."""
+    while not arret.is_set():
+        close_old_connections()
+        job = reserver(proprietaire)
+        if job is None:
+            arret.wait(attente)
+            continue
+        executer(job)
+
+
+def battre(proprietaire):
+    """Signale que les jobs en cours de `proprietaire` sont toujours exécutés."""
+    return Job.objects.filter(statut="en cours", proprietaire=proprietaire).update(battement=timezone.now())
+
+
+def reprendre_interrompus(delai=timedelta(minutes=5)):
+    """Remet en attente les jobs « en cours » sans battement depuis plus de `delai` (worker arrêté)."""
+    limite = timezone.now() - delai
+    # Sans battement : job réservé avant l'ajout de la colonne, daté par son début
+    abandonnes = Q(battement__lt=limite) | Q(battement__isnull=True, debut__lt=limite)
+    return Job.objects.filter(abandonnes, statut="en cours").update(
+        statut="en attente", debut=None, battement=None, proprietaire="",
+    )
+
+
+def purger(delai=None):
+    """Supprime les jobs finis depuis plus de `delai` et leurs fichiers ; renvoie le nombre supprimé."""
+    if delai is None:
+        delai = timedelta(days=settings.JOBS_CONSERVATION_JOURS)
+    anciens = Job.objects.filter(statut__in=("terminé", "échoué"), fin__lt=timezone.now() - delai)
+    pks = list(anciens.values_list("pk", flat=True))
+    for pk in pks:
+        shutil.rmtree(os.path.join(settings.JOBS_DIR, str(pk)), ignore_errors=True)
+    return Job.objects.filter(pk__in=pks).delete()[0]
+
+
+@contextmanager
+def surveillance(proprietaire, intervalle=30.0, delai=timedelta(minutes=5), conservation=None,
+                 purge=timedelta(hours=1)):
+    """
+    Thread de fond du worker : battement de ses jobs toutes les `intervalle`
+    secondes, reprise des jobs abandonnés par les autres et, toutes les
+    `purge`, suppression des jobs finis depuis plus de `conservation`.
+    """
+    arret = threading.Event()
+
+    def surveiller():
+        derniere_purge = time.monotonic()
+        try:
+            while not arret.wait(intervalle):
+                close_old_connections()
+                battre(proprietaire)
+                if repris := reprendre_interrompus(delai):
+                    logger.warning("%s job(s) interrompu(s) remis en attente", repris)
+                if time.monotonic() - derniere_purge >= purge.total_seconds():
+                    purger(conservation)
+                    derniere_purge = time.monotonic()
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=surveiller, name="job-surveillance", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        arret.set()
+        thread.join()
+
+
+# ---------------------------------------------------------------------------
+# Tâches
+# ---------------------------------------------------------------------------
+
+def _filtrer(filtre_class, queryset, parametres):
+    filtre = filtre_class(data={k: v for k, v in parametres.items() if k in filtre_class().fields})
+    filtre.is_valid(raise_exception=True)
+    return filtre.filtrer(queryset, filtre.validated_data)
+
+
+@tache("facture_pdf")
+def facture_pdf(job):
+    facture = factures_pour_pdf(Facture.objects.filter(pk=job.parametres["facture"])).get()
+    donnees = donnees_facture(facture)
+    with ouvrir_pdf(donnees) as pdf, fichier_resultat(job, donnees.nom_fichier, "application/pdf") as sortie:
+        shutil.copyfileobj(pdf, sortie)
+
+
+@tache("factures_zip")
+def factures_zip(job):
+    factures = _filtrer(
+        FiltreFactureSerializer, Facture.objects.order_by("date_facture", "id"), job.parametres.get("filtres", {}),
+    )
+    with fichier_resultat(job, "factures.zip", "application/zip") as sortie:
+        # Processus de rendu par job : le worker en exécute plusieurs à la fois
+        n = ecrire_zip(sortie, factures, processus=settings.JOBS_PROCESSUS_PDF)
+    return {"factures": n}
+
+
+# ressource : (modèle, serializer, filtre, ordre)
+EXPORTS = {
+    "factures": (Facture, FactureSerializer, FiltreFactureSerializer, ("-date_facture", "-id")),
+    "transactions": (
+        TransactionTresorerie, TransactionTresorerieSerializer, FiltreTransactionSerializer,
+        ("-date_transaction", "-id"),
+    ),
+}
+TAILLE_LOT_EXPORT = 500
+
+
+@tache("export")
+def export(job):
+    ressource = job.parametres["ressource"]
+    modele, serializer_class, filtre_class, ordre = EXPORTS[ressource]
+    renderer = NDJSONRenderer() if job.parametres.get("format") == "ndjson" else JSONFluxRenderer()
+    queryset = serializer_class.optimiser_queryset(
+        _filtrer(filtre_class, modele.objects.order_by(*ordre), job.parametres.get("filtres", {})), None,
+    )
+
+    def lots():
+        lot = []
+        for objet in queryset.iterator(chunk_size=TAILLE_LOT_EXPORT):
+            lot.append(objet)
+            if len(lot) == TAILLE_LOT_EXPORT:
+                yield serializer_class(lot, many=True).data
+                lot = []
+        if lot:
+            yield serializer_class(lot, many=True).data
+
+    with fichier_resultat(job, f"{ressource}.{renderer.format}", renderer.media_type) as sortie:
+        for morceau in renderer.flux(lots()):
+            sortie.write(morceau)
+
+
+@tache("prevision_ventes")
+def prevision_ventes(job):
+    produit_id = job.parametres["produit"]
+    png = prevision_ventes_png(produit_id)
+    if png is None:
+        raise ValueError("Pas de données")
+    with fichier_resultat(job, f"prevision_{produit_id}.png", "image/png") as sortie:
+        sortie.write(png)
+
+
+@tache("releve")
+def releve(job):
+    client = Person.objects.get(pk=job.parametres["client"], type="client")
+    debut, fin = periode_du_mois(datetime.strptime(job.parametres["mois"], "%Y-%m").date())
+    with fichier_resultat(job, f"releve_{client.pk}_{debut:%Y-%m}.pdf", "application/pdf") as sortie:
+        for morceau in flux_releve(client, debut, fin):
+            sortie.write(morceau)
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app.balance_agee import TRANCHES, balance_agee
+
+ENTETES = ("À échoir", "0-30 j", "31-60 j", "61-90 j", "+90 j", "Total")
+
+
+class Command(BaseCommand):
+    help = "Balance âgée des créances clients : reste dû par tranche de retard, par client et au total"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Date d'arrêté (AAAA-MM-JJ), aujourd'hui par défaut")
+
+    def handle(self, *args, **options):
+        jour = None
+        if options['date']:
+            try:
+                jour = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Format de date attendu : AAAA-MM-JJ.")
+
+        balance = balance_agee(jour)
+        colonnes = (*TRANCHES, 'total')
+        self.stdout.write(f"{'Client':<30}" + "".join(f"{e:>14}" for e in ENTETES))
+        for ligne in balance['clients']:
+            nom = f"{ligne['client_nom']} (#{ligne['client_id']})"[:30]
+            self.stdout.write(f"{nom:<30}" + "".join(f"{ligne[c]:>14.2f}" for c in colonnes))
+        self.stdout.write(f"{'TOTAL':<30}" + "".join(f"{balance['total'][c]:>14.2f}" for c in colonnes))
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Balance âgée au {balance['date']:%d/%m/%Y} : {len(balance['clients'])} clients."
+        ))
@@ -0,0 +1,50 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from erp_app.mise_en_page import rendre_document
+from erp_app.pdf_factures import DonneesFacture, rendre_facture
+
+
+def facture_fictive(n, nb_lignes):
+    jour = date(2025, 1, 31)
+    return DonneesFacture(
+        id=n, tiers="Client", tiers_nom=f"Client {n}", date_facture=jour, statut="partielle",
+        montant_total=Decimal("1000.00"), montant_paye=Decimal("400.00"),
+        date_echeance_restant=jour + timedelta(days=30),
+        lignes=[(f"Produit {i}", i % 7 + 1, Decimal("12.50")) for i in range(nb_lignes)],
+        paiements=[(jour, Decimal("200.00"), "virement", f"PAI-20250131-{i:04d}") for i in range(2)],
+        relances=[(1, jour, "envoyée", "Premier rappel")],
+    )
+
+
+class Command(BaseCommand):
+    help = "Benchmark du rendu PDF des factures (sans base) : temps par facture selon le nombre de lignes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lignes', type=int, nargs='+', default=[1, 10, 100, 500, 2000])
+        parser.add_argument('--repetitions', type=int, default=20, help='Rendus par taille (au moins 1)')
+        parser.add_argument('--document', type=int, default=100, help='Factures de 10 lignes rendues dans un seul PDF')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'Lignes':>8}{'ms / facture':>16}{'Ko':>10}")
+        for nb_lignes in options['lignes']:
+            donnees = facture_fictive(1, nb_lignes)
+            repetitions = max(1, options['repetitions'] if nb_lignes < 500 else options['repetitions'] // 5)
+            debut = time.perf_counter()
+            for _ in range(repetitions):
+                pdf = rendre_facture(donnees)
+            duree = (time.perf_counter() - debut) / repetitions
+            self.stdout.write(f"{nb_lignes:>8}{duree * 1000:>16.1f}{len(pdf) / 1024:>10.1f}")
+
+        if options['document']:
+            factures = [facture_fictive(n, 10) for n in range(options['document'])]
+            debut = time.perf_counter()
+            pdf = rendre_document(factures)
+            duree = (time.perf_counter() - debut) / len(factures)
+            self.stdout.write(
+                f"{len(factures)} factures en un document : {duree * 1000:.1f} ms / facture, {len(pdf) / 1024:.1f} Ko"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark terminé."))
@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Sum
+
+from erp_app.models import Produit
+from erp_app.stock import StockInsuffisant, reserver
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark multithread des sorties de stock concurrentes sur quelques produits très demandés : "
+        "vérifie le stock final et mesure le débit (à lancer sur PostgreSQL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--commandes', type=int, default=2000, help='Nombre de commandes à passer')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--produits', type=int, default=3, help='Nombre de produits "chauds"')
+        parser.add_argument('--stock', type=int, default=1000, help='Stock initial par produit')
+        parser.add_argument('--lignes', type=int, default=2, help='Lignes par commande')
+        parser.add_argument('--naif', action='store_true', help='Lecture-modification-écriture (ancien comportement)')
+
+    def handle(self, *args, **options):
+        produit_ids = [
+            Produit.objects.create(
+                nom=f"bench-stock-{i}", prix_achat=1, prix_vente=1, stock=options['stock']
+            ).pk
+            for i in range(options['produits'])
+        ]
+        servies = []
+        refusees = [0]
+        erreurs = [0]
+        verrou = threading.Lock()
+        sortir = self._naif if options['naif'] else reserver
+
+        def passer_commande(n):
+            rng = random.Random(n)
+            lignes = [(rng.choice(produit_ids), rng.randint(1, 3)) for _ in range(options['lignes'])]
+            try:
+                sortir(lignes)
+            except StockInsuffisant:
+                with verrou:
+                    refusees[0] += 1
+            except Exception:
+                with verrou:
+                    erreurs[0] += 1
+            else:
+                with verrou:
+                    servies.append(lignes)
+            finally:
+                connections.close_all()  # connexions du thread courant
+
+        debut = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(passer_commande, range(options['commandes'])))
+        duree = time.perf_counter() - debut
+
+        initial = options['stock'] * len(produit_ids)
+        sorti = sum(q for lignes in servies for _, q in lignes)
+        final = Produit.objects.filter(pk__in=produit_ids).aggregate(total=Sum('stock'))['total']
+        negatif = Produit.objects.filter(pk__in=produit_ids, stock__lt=0).exists()
+        Produit.objects.filter(pk__in=produit_ids).delete()
+
+        self.stdout.write(
+            f"{options['commandes']} commandes en {duree:.2f}s "
+            f"({options['commandes'] / duree:.0f} commandes/s, {options['threads']} threads)"
+        )
+        self.stdout.write(f"Servies : {len(servies)} — refusées : {refusees[0]} — erreurs : {erreurs[0]}")
+        self.stdout.write(f"Stock final : {final} (attendu {initial - sorti})")
+
+        if final == initial - sorti and not negatif:
+            self.stdout.write(self.style.SUCCESS("✅ Stock final cohérent"))
+        else:
+            self.stdout.write(self.style.ERROR("❌ Mises à jour perdues ou stock négatif"))
+
+    @staticmethod
+    def _naif(lignes):
+        with transaction.atomic():
+            for produit_id, quantite in lignes:
+                produit = Produit.objects.get(pk=produit_id)
+                if produit.stock < quantite:
+                    raise StockInsuffisant([])
+                produit.stock -= quantite
+                produit.save()
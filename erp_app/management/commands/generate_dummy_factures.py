@@ -15,16 +15,16 @@ class Command(BaseCommand):
 
         clients = []
         for i in range(nb_clients):
-            client = Person.objects.create(
+            # (type, email) et nom sont uniques : une nouvelle exécution réutilise les données
+            client, _ = Person.objects.get_or_create(
                 type="client",
-                nom=f"Client {i}",
                 email=f"client{i}@test.com",
-                telephone="0600000000"
+                defaults={"nom": f"Client {i}", "telephone": "0600000000"},
             )
             clients.append(client)
 
-        produit = Produit.objects.create(
-            nom="Produit X", prix_achat=100, prix_vente=200, stock=1000000
+        produit, _ = Produit.objects.get_or_create(
+            nom="Produit X", defaults={"prix_achat": 100, "prix_vente": 200, "stock": 1000000}
         )
 
         today = timezone.now().date()
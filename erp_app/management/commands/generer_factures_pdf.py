@@ -0,0 +1,36 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app.filtres import FiltreFactureSerializer
+from erp_app.models import Facture
+from erp_app.pdf_factures import ecrire_zip
+
+
+class Command(BaseCommand):
+    help = "Génère les PDF des factures filtrées dans une archive ZIP, en répartissant le rendu sur plusieurs processus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('sortie', help='Fichier ZIP à écrire')
+        parser.add_argument('--date-min', type=date.fromisoformat, help='Factures à partir de cette date (AAAA-MM-JJ)')
+        parser.add_argument('--date-max', type=date.fromisoformat, help="Factures jusqu'à cette date (AAAA-MM-JJ)")
+        parser.add_argument('--client', type=int, help='Id du client')
+        parser.add_argument('--statut', action='append', help='Statut (option répétable)')
+        parser.add_argument('--processus', type=int, default=None, help='Processus de rendu (défaut : nombre de cœurs)')
+
+    def handle(self, *args, **options):
+        criteres = {
+            nom: options[nom] for nom in ('date_min', 'date_max', 'client', 'statut') if options[nom]
+        }
+        filtre = FiltreFactureSerializer(data=criteres)
+        if not filtre.is_valid():
+            raise CommandError(filtre.errors)
+        factures = filtre.filtrer(Facture.objects.order_by('date_facture', 'id'), filtre.validated_data)
+
+        debut = time.perf_counter()
+        with open(options['sortie'], 'wb') as sortie:
+            n = ecrire_zip(sortie, factures, processus=options['processus'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {n} factures écrites dans {options['sortie']} en {time.perf_counter() - debut:.1f} s"
+        ))
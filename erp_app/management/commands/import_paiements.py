@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app.models import CompteBancaire
+from erp_app.rapprochement import ReleveInvalide, importer_releve
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe un relevé bancaire (CSV date,montant,libelle ou OFX) : rapproche chaque ligne "
+        "d'une facture ouverte et enregistre les paiements en lot"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help='Chemin du relevé')
+        parser.add_argument('--compte', type=int, default=None, help='Id du compte bancaire crédité / débité')
+        parser.add_argument('--simulation', action='store_true', help='Rapprocher sans rien enregistrer')
+        parser.add_argument('--details', action='store_true', help='Lister les lignes ambiguës et non rapprochées')
+
+    def handle(self, *args, **options):
+        compte = None
+        if options['compte']:
+            compte = CompteBancaire.objects.filter(pk=options['compte']).first()
+            if compte is None:
+                raise CommandError(f"Compte bancaire {options['compte']} introuvable.")
+
+        try:
+            with open(options['fichier'], 'rb') as fichier:
+                rapport = importer_releve(fichier, compte=compte, simulation=options['simulation'])
+        except (OSError, ReleveInvalide) as e:
+            raise CommandError(str(e))
+
+        if options['details']:
+            for ligne, candidates in rapport.ambigues:
+                self.stdout.write(
+                    f"Ligne {ligne.numero} ({ligne.montant} — {ligne.libelle}) : ambiguë, "
+                    f"factures {', '.join(f'#{pk}' for pk in candidates)}"
+                )
+            for ligne in rapport.non_rapprochees:
+                self.stdout.write(f"Ligne {ligne.numero} ({ligne.montant} — {ligne.libelle}) : non rapprochée")
+
+        resume = rapport.resume()
+        self.stdout.write(
+            f"Rapprochées : {resume['rapprochees']} — ambiguës : {resume['ambigues']} — "
+            f"non rapprochées : {resume['non_rapprochees']}"
+        )
+        if options['simulation']:
+            self.stdout.write(self.style.WARNING("⚠️ Simulation : aucun paiement enregistré."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {resume['rapprochees']} paiements enregistrés."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from erp_app.models import CompteBancaire
+from erp_app.tresorerie import reconstruire_soldes
+
+
+class Command(BaseCommand):
+    help = "Recalcule les soldes journaliers des comptes bancaires depuis les transactions de trésorerie"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compte', type=int, action='append', help='Id du compte (répétable, défaut : tous)')
+
+    def handle(self, *args, **options):
+        comptes = CompteBancaire.objects.all()
+        if options['compte']:
+            comptes = comptes.filter(pk__in=options['compte'])
+        n = reconstruire_soldes(comptes)
+        self.stdout.write(self.style.SUCCESS(f"✅ {n} soldes journaliers reconstruits"))
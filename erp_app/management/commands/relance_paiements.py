@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from erp_app.models import Facture, RelancePaiement
+from erp_app.models import RelancePaiement
+from erp_app.services import factures_a_relancer_le
 
 class Command(BaseCommand):
     help = 'Crée des relances automatiques pour les factures impayées à échéance proche'
@@ -10,12 +11,7 @@ class Command(BaseCommand):
         aujourd_hui = timezone.now().date()
         dans_3_jours = aujourd_hui + timedelta(days=3)
 
-        factures_a_relancer = Facture.objects.filter(
-            montant_total__gt=0,
-            statut__in=['en attente', 'en cours'],
-        ).exclude(
-            relances__date_relance__gte=aujourd_hui
-        )
+        factures_a_relancer = factures_a_relancer_le(aujourd_hui)
 
         nb_relances = 0
 
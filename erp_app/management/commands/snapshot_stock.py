@@ -0,0 +1,20 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from erp_app.stock import prendre_snapshots
+
+
+class Command(BaseCommand):
+    help = "Enregistre le stock de fin de journée de chaque produit (à planifier chaque nuit)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', type=date.fromisoformat, default=None,
+            help='Journée à figer (AAAA-MM-JJ, défaut : hier)'
+        )
+
+    def handle(self, *args, **options):
+        jour = options['date'] or date.today() - timedelta(days=1)
+        n = prendre_snapshots(jour)
+        self.stdout.write(self.style.SUCCESS(f"✅ {n} snapshots de stock enregistrés au {jour}"))
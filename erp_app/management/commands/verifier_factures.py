@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from erp_app.services import corriger_factures, ecarts_factures
+
+
+class Command(BaseCommand):
+    help = "Recalcule les totaux des factures depuis les lignes et paiements et signale les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corriger', action='store_true', help='Réécrire les factures en écart')
+
+    def handle(self, *args, **options):
+        ecarts = list(
+            ecarts_factures().values_list('id', 'montant_total', 'total_calcule', 'montant_paye', 'paye_calcule')
+        )
+
+        for facture_id, total, total_calcule, paye, paye_calcule in ecarts:
+            self.stdout.write(
+                f"Facture #{facture_id} : total {total} (attendu {total_calcule}), "
+                f"payé {paye} (attendu {paye_calcule})"
+            )
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS("✅ Aucun écart sur les factures."))
+            return
+
+        if options['corriger']:
+            n = corriger_factures([e[0] for e in ecarts])
+            self.stdout.write(self.style.SUCCESS(f"✅ {n} factures corrigées."))
+        else:
+            self.stdout.write(self.style.WARNING(f"⚠️ {len(ecarts)} factures en écart (relancer avec --corriger)."))
@@ -0,0 +1,69 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from erp_app.jobs import (
+    identifiant_worker, purger, reprendre_interrompus, surveillance, traiter_en_attente, travailler,
+)
+
+
+class Command(BaseCommand):
+    help = "Worker des tâches de fond : exécute les jobs en attente (PDF, archives, exports, graphiques)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help="Jobs exécutés en parallèle (défaut : 2)")
+        parser.add_argument('--attente', type=float, default=1.0,
+                            help="Secondes entre deux consultations de la file vide (défaut : 1)")
+        parser.add_argument('--battement', type=float, default=30.0,
+                            help="Secondes entre deux signes de vie des jobs en cours (défaut : 30)")
+        parser.add_argument('--reprendre', type=int, default=5,
+                            help="Remet en attente les jobs en cours sans signe de vie depuis N minutes (défaut : 5)")
+        parser.add_argument('--conserver', type=int, default=settings.JOBS_CONSERVATION_JOURS,
+                            help="Supprime les jobs finis depuis plus de N jours, fichiers compris "
+                                 "(défaut : JOBS_CONSERVATION_JOURS)")
+        parser.add_argument('--une-fois', action='store_true',
+                            help="Vide la file dans le thread courant puis s'arrête")
+
+    def handle(self, *args, **options):
+        delai = timedelta(minutes=options['reprendre'])
+        repris = reprendre_interrompus(delai)
+        if repris:
+            self.stdout.write(f"{repris} job(s) interrompu(s) remis en attente")
+        conservation = timedelta(days=options['conserver'])
+        purges = purger(conservation)
+        if purges:
+            self.stdout.write(f"{purges} job(s) ancien(s) supprimé(s)")
+
+        proprietaire = identifiant_worker()
+        with surveillance(proprietaire, options['battement'], delai, conservation):
+            if options['une_fois']:
+                n = traiter_en_attente(proprietaire)
+                self.stdout.write(self.style.SUCCESS(f"✅ {n} job(s) traité(s)"))
+                return
+            self.boucle(proprietaire, options)
+
+    def boucle(self, proprietaire, options):
+        arret = threading.Event()
+
+        def boucle():
+            try:
+                travailler(arret, options['attente'], proprietaire)
+            finally:
+                connection.close()  # connexion propre à chaque thread
+
+        threads = [threading.Thread(target=boucle, name=f"job-{i}") for i in range(max(options['threads'], 1))]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(self.style.SUCCESS(f"✅ Worker démarré : {len(threads)} thread(s)"))
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt demandé : fin des jobs en cours…")
+            arret.set()
+            for thread in threads:
+                thread.join()
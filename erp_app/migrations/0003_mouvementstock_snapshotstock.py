@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:15
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def ouvrir_journal(apps, schema_editor):
+    """Le stock actuel de chaque produit devient son mouvement initial."""
+    Produit = apps.get_model("erp_app", "Produit")
+    MouvementStock = apps.get_model("erp_app", "MouvementStock")
+    MouvementStock.objects.bulk_create(
+        MouvementStock(produit_id=pk, type="initial", quantite=stock)
+        for pk, stock in Produit.objects.filter(stock__gt=0).values_list("pk", "stock").iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0002_ventehistorique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MouvementStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('initial', 'Stock initial'), ('entrée', 'Entrée'), ('sortie', 'Sortie'), ('ajustement', 'Ajustement')], max_length=20)),
+                ('quantite', models.IntegerField()),
+                ('date_mouvement', models.DateField(default=datetime.date.today)),
+                ('ligne_achat', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='erp_app.ligneachat')),
+                ('ligne_commande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='erp_app.lignecommande')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements', to='erp_app.produit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['produit', 'date_mouvement'], name='erp_app_mou_produit_fa29d6_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('stock', models.IntegerField()),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='erp_app.produit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('produit', 'date'), name='unique_snapshot_stock_jour')],
+            },
+        ),
+        migrations.RunPython(ouvrir_journal, migrations.RunPython.noop),
+    ]
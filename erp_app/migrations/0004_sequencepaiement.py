@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:17
+
+import re
+from datetime import date
+
+from django.db import migrations, models
+
+
+def initialiser_sequences(apps, schema_editor):
+    """
+    Les références en double (générées par l'ancien comptage concurrent) sont
+    suffixées par l'id du paiement, puis chaque compteur journalier repart du
+    plus grand numéro PAI-YYYYMMDD-NNNN déjà attribué.
+    """
+    Paiement = apps.get_model("erp_app", "Paiement")
+    SequencePaiement = apps.get_model("erp_app", "SequencePaiement")
+
+    vues, doublons, derniers = set(), [], {}
+    for paiement in Paiement.objects.exclude(reference_paiement="").order_by("pk").iterator():
+        reference = paiement.reference_paiement
+        if reference in vues:
+            paiement.reference_paiement = f"{reference}-{paiement.pk}"
+            doublons.append(paiement)
+        vues.add(reference)
+        m = re.fullmatch(r"PAI-(\d{4})(\d{2})(\d{2})-(\d+)", reference)
+        if m:
+            jour = date(int(m[1]), int(m[2]), int(m[3]))
+            derniers[jour] = max(derniers.get(jour, 0), int(m[4]))
+
+    Paiement.objects.bulk_update(doublons, ["reference_paiement"])
+    SequencePaiement.objects.bulk_create(
+        SequencePaiement(jour=jour, dernier=dernier) for jour, dernier in derniers.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0003_mouvementstock_snapshotstock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequencePaiement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField(unique=True)),
+                ('dernier', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(initialiser_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='paiement',
+            constraint=models.UniqueConstraint(condition=models.Q(('reference_paiement', ''), _negated=True), fields=('reference_paiement',), name='unique_reference_paiement'),
+        ),
+    ]
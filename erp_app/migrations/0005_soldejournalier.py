@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:22
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def reconstruire_soldes(apps, schema_editor):
+    """Soldes journaliers depuis les transactions, en remontant depuis le solde actuel."""
+    CompteBancaire = apps.get_model("erp_app", "CompteBancaire")
+    SoldeJournalier = apps.get_model("erp_app", "SoldeJournalier")
+    TransactionTresorerie = apps.get_model("erp_app", "TransactionTresorerie")
+
+    signe = {"entrée": 1, "sortie": -1}
+    variations = defaultdict(lambda: defaultdict(Decimal))
+    for compte_id, jour, type, total in (
+        TransactionTresorerie.objects.filter(compte__isnull=False)
+        .values_list("compte_id", "date_transaction", "type")
+        .annotate(total=Sum("montant")).order_by()
+    ):
+        variations[compte_id][jour] += signe.get(type, 0) * total
+
+    a_creer = []
+    for compte_id, solde in CompteBancaire.objects.values_list("pk", "solde"):
+        for jour in sorted(variations[compte_id], reverse=True):
+            variation = variations[compte_id][jour]
+            a_creer.append(SoldeJournalier(compte_id=compte_id, date=jour, variation=variation, solde=solde))
+            solde -= variation
+    SoldeJournalier.objects.bulk_create(a_creer, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0004_sequencepaiement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SoldeJournalier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('variation', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('solde', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('compte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='soldes_journaliers', to='erp_app.comptebancaire')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('compte', 'date'), name='unique_solde_compte_jour')],
+            },
+        ),
+        migrations.RunPython(reconstruire_soldes, migrations.RunPython.noop),
+    ]
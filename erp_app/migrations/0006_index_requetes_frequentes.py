@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:24
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionner_ventes(apps, schema_editor):
+    """Cumule les lignes VenteHistorique en double (produit, mois) dans la plus ancienne."""
+    VenteHistorique = apps.get_model("erp_app", "VenteHistorique")
+    doublons = (
+        VenteHistorique.objects.values("produit_id", "mois")
+        .annotate(n=Count("id"), premier=Min("id"), total=Sum("quantite"))
+        .filter(n__gt=1)
+    )
+    for d in doublons.iterator():
+        VenteHistorique.objects.filter(pk=d["premier"]).update(quantite=d["total"])
+        VenteHistorique.objects.filter(produit_id=d["produit_id"], mois=d["mois"]).exclude(
+            pk=d["premier"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0005_soldejournalier'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(condition=models.Q(('statut', 'payée'), _negated=True), fields=['date_facture'], name='facture_ouverte_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(condition=models.Q(('date_echeance_restant__isnull', False)), fields=['date_echeance_restant'], name='facture_echeance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paiement',
+            index=models.Index(fields=['date_paiement'], name='paiement_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paiement',
+            index=models.Index(fields=['facture', 'date_paiement'], name='paiement_facture_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['type'], name='person_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relancepaiement',
+            index=models.Index(fields=['facture', 'date_relance'], name='relance_facture_date_idx'),
+        ),
+        migrations.RunPython(fusionner_ventes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ventehistorique',
+            constraint=models.UniqueConstraint(fields=('produit', 'mois'), name='unique_vente_produit_mois'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0006_index_requetes_frequentes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paiement',
+            name='paiement_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='achat',
+            index=models.Index(fields=['date_achat', 'id'], name='achat_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['date_commande', 'id'], name='commande_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facture',
+            index=models.Index(fields=['date_facture', 'id'], name='facture_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paiement',
+            index=models.Index(fields=['date_paiement', 'id'], name='paiement_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relancepaiement',
+            index=models.Index(fields=['date_relance', 'id'], name='relance_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactiontresorerie',
+            index=models.Index(fields=['date_transaction', 'id'], name='transaction_date_id_idx'),
+        ),
+    ]
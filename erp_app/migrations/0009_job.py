@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0008_index_synchronisation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=50)),
+                ('parametres', models.JSONField(blank=True, default=dict)),
+                ('statut', models.CharField(choices=[('en attente', 'En attente'), ('en cours', 'En cours'), ('terminé', 'Terminé'), ('échoué', 'Échoué')], default='en attente', max_length=20)),
+                ('resultat', models.JSONField(blank=True, null=True)),
+                ('fichier', models.CharField(blank=True, max_length=255)),
+                ('nom_fichier', models.CharField(blank=True, max_length=255)),
+                ('type_contenu', models.CharField(blank=True, max_length=100)),
+                ('erreur', models.TextField(blank=True)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+                ('debut', models.DateTimeField(blank=True, null=True)),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['statut', 'id'], name='job_statut_id_idx')],
+            },
+        ),
+    ]
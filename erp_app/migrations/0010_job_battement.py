@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='battement',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='proprietaire',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
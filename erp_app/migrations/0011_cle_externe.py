@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0010_job_battement'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='person',
+            name='person_type_email_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='produit',
+            name='produit_nom_idx',
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='cle_externe',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='cle_externe',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='person',
+            constraint=models.UniqueConstraint(fields=('type', 'cle_externe'), name='unique_person_type_cle_externe'),
+        ),
+    ]
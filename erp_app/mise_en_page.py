@@ -0,0 +1,333 @@
+# erp_app/mise_en_page.py
+"""
+Mise en page des factures PDF (ReportLab).
+
+Les éléments fixes d'un document (en-têtes de tableaux, séparateurs, pied de
+page) sont dessinés une seule fois comme form XObjects, à leur première
+utilisation, puis posés par simple référence (`doForm`) sur chaque page et
+pour chaque facture du document : une page de suite ne redessine rien à la
+main, et un document de plusieurs factures ne contient qu'un exemplaire de
+chaque élément.
+
+Le texte courant (informations et lignes de tableaux) est écrit en opérateurs
+PDF directs (`addLiteral`) : la police n'est changée que lorsqu'elle diffère,
+et chaque ligne est un seul objet texte, sans le calcul de largeur que fait
+ReportLab pour chaque chaîne. Les sauts de page sont gérés par
+`Document.place` : pied de page, nouvelle page, puis en-têtes de suite.
+
+Les données arrivent déjà lues (voir erp_app.pdf_factures.DonneesFacture) :
+le rendu ne fait aucune requête.
+"""
+
+import io
+
+from django.conf import settings
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+LARGEUR, HAUTEUR = A4
+MARGE = 50
+BAS = MARGE + 40  # limite basse du contenu, au-dessus du pied de page
+
+# Colonnes (abscisses) des tableaux
+COLONNES_LIGNES = (MARGE, 250, 330, 450)
+COLONNES_PAIEMENTS = (MARGE, 120, 200, 290)
+COLONNES_RELANCES = (MARGE, 80, 160, 230)
+
+
+def configurer_reportlab():
+    """
+    Applique `PDF_ASCII85` à ReportLab, dont le réglage vaut pour tout le
+    processus et pour chaque document au moment de son écriture : appelé
+    une fois au démarrage (ErpAppConfig.ready), jamais pendant un rendu.
+    """
+    rl_config.useA85 = int(settings.PDF_ASCII85)
+
+
+# ---------------------------------------------------------------------------
+# Éléments fixes
+# ---------------------------------------------------------------------------
+# Chaque élément est dessiné sous son point d'ancrage (0, 0) et déclare la
+# hauteur qu'il occupe, dont le curseur vertical est ensuite décalé.
+
+def _texte(c, police, taille, positions):
+    t = c.beginText()
+    t.setFont(police, taille)
+    for x, y, texte in positions:
+        t.setTextOrigin(x, y)
+        t.textOut(texte)
+    c.drawText(t)
+
+
+# Chaîne littérale PDF : parenthèses, barre oblique et octets hors ASCII
+# imprimable échappés (octal), comme le fait ReportLab
+_ECHAPPEMENTS = {i: "\\%03o" % i for i in [*range(32), *range(127, 256)]}
+_ECHAPPEMENTS.update({ord("("): "\\(", ord(")"): "\\)", ord("\\"): "\\\\"})
+
+
+def _chaine_pdf(texte):
+    """`texte` en WinAnsi (polices standard), échappé ; None s'il contient un caractère hors de ce jeu."""
+    try:
+        return texte.encode("cp1252").decode("latin-1").translate(_ECHAPPEMENTS)
+    except UnicodeEncodeError:
+        return None
+
+
+def _separateur(c):
+    c.setStrokeColorRGB(0.6, 0.6, 0.6)
+    c.setLineWidth(0.5)
+    c.line(MARGE, 0, LARGEUR - MARGE, 0)
+
+
+def _entete_lignes(c):
+    _texte(c, "Helvetica-Bold", 12, [
+        (x, 0, titre)
+        for x, titre in zip(COLONNES_LIGNES, ("Désignation", "Quantité", "Prix Unitaire", "Total ligne"))
+    ])
+
+
+def _titre_paiements(c):
+    _texte(c, "Helvetica-Bold", 12, [(MARGE, 0, "Historique des paiements :")])
+
+
+def _colonnes_paiements(c):
+    _texte(c, "Helvetica", 10, [
+        (x, 0, titre) for x, titre in zip(COLONNES_PAIEMENTS, ("Date", "Montant", "Méthode", "Référence"))
+    ])
+
+
+def _titre_relances(c):
+    _texte(c, "Helvetica-Bold", 12, [(MARGE, 0, "Historique des relances :")])
+
+
+def _colonnes_relances(c):
+    _texte(c, "Helvetica", 10, [
+        (x, 0, titre) for x, titre in zip(COLONNES_RELANCES, ("N°", "Date", "Statut", "Note"))
+    ])
+
+
+def _remerciements(c):
+    _texte(c, "Helvetica-Oblique", 10, [(MARGE, 0, "Merci pour votre confiance.")])
+
+
+def _pied(c):
+    c.setStrokeColorRGB(0.6, 0.6, 0.6)
+    c.setLineWidth(0.5)
+    c.line(MARGE, 15, LARGEUR - MARGE, 15)
+    _texte(c, "Helvetica-Oblique", 8, [(MARGE, 0, "Facture générée automatiquement par le système.")])
+
+
+# nom : (dessin, hauteur occupée)
+ELEMENTS = {
+    "separateur": (_separateur, 25),
+    "entete_lignes": (_entete_lignes, 20),
+    "titre_paiements": (_titre_paiements, 18),
+    "colonnes_paiements": (_colonnes_paiements, 15),
+    "titre_relances": (_titre_relances, 18),
+    "colonnes_relances": (_colonnes_relances, 15),
+    "remerciements": (_remerciements, 15),
+    "pied": (_pied, 0),
+}
+
+
+class Gabarit:
+    """
+    Form XObjects d'un canvas. Un élément est dessiné directement à sa
+    première pose et devient un form XObject à la deuxième : un élément qui
+    n'apparaît qu'une fois ne coûte pas d'objet supplémentaire au document.
+    """
+
+    def __init__(self, c, elements=ELEMENTS):
+        self.canvas = c
+        self.elements = elements
+        self.poses = set()
+        self.definis = set()
+
+    def poser(self, nom, x, y):
+        c = self.canvas
+        dessin, hauteur = self.elements[nom]
+        if nom in self.poses and nom not in self.definis:
+            # Boîte englobante de toute la page autour de l'ancrage
+            c.beginForm(nom, lowerx=0, lowery=-HAUTEUR, upperx=LARGEUR, uppery=HAUTEUR)
+            dessin(c)
+            c.endForm()
+            self.definis.add(nom)
+        c.saveState()
+        c.translate(x, y)
+        if nom in self.definis:
+            c.doForm(nom)
+        else:
+            dessin(c)
+            self.poses.add(nom)
+        c.restoreState()
+        return hauteur
+
+
+# ---------------------------------------------------------------------------
+# Document
+# ---------------------------------------------------------------------------
+
+class Document:
+    """Canvas, gabarit et curseur vertical ; une facture commence sur une nouvelle page."""
+
+    def __init__(self, flux):
+        self.canvas = canvas.Canvas(flux, pagesize=A4)
+        self.gabarit = Gabarit(self.canvas)
+        self.y = HAUTEUR - MARGE
+        self.titre = ""      # rappelé en pied de page
+        self.page = 0        # numéro de page dans la facture courante
+        self.suite = ()      # éléments reposés en haut d'une page de suite
+        self.page_entamee = False
+        self.police = None   # (nom, taille) en vigueur sur la page
+
+    def poser(self, *noms):
+        for nom in noms:
+            self.y -= self.gabarit.poser(nom, 0, self.y)
+
+    def choisir_police(self, police, taille):
+        if self.police != (police, taille):
+            self.canvas.setFont(police, taille)
+            self.police = (police, taille)
+
+    def texte(self, police, taille, positions, interligne):
+        """Une ligne de texte : `positions` = (x, texte) ; saut de page si nécessaire."""
+        self.place(interligne)
+        self.choisir_police(police, taille)
+        chaines = [(x, _chaine_pdf(texte)) for x, texte in positions]
+        if all(chaine is not None for _, chaine in chaines):
+            y = round(self.y, 2)
+            self.canvas.addLiteral(
+                "BT " + " ".join(f"1 0 0 1 {x} {y} Tm ({chaine}) Tj" for x, chaine in chaines) + " ET"
+            )
+        else:
+            _texte(self.canvas, police, taille, [(x, self.y, texte) for x, texte in positions])
+        self.y -= interligne
+
+    def place(self, hauteur):
+        if self.y - hauteur < BAS:
+            self._fermer_page()
+            self._ouvrir_page()
+            self.poser(*self.suite)
+
+    def commencer(self, titre):
+        """Nouvelle page, numérotée à partir de 1 sous `titre`."""
+        self._fermer_page()
+        self.titre, self.page, self.suite = titre, 0, ()
+        self._ouvrir_page()
+
+    def _ouvrir_page(self):
+        self.police = None  # état graphique réinitialisé par showPage
+        self.page_entamee = True
+        self.page += 1
+        self.y = HAUTEUR - MARGE
+
+    def _fermer_page(self):
+        if not self.page_entamee:
+            return
+        self.gabarit.poser("pied", 0, MARGE - 20)
+        self.canvas.setFont("Helvetica", 8)
+        self.canvas.drawRightString(LARGEUR - MARGE, MARGE - 20, f"{self.titre} - page {self.page}")
+        self.canvas.showPage()
+        self.page_entamee = False
+
+    def terminer(self):
+        self._fermer_page()
+        self.canvas.save()
+
+
+def dessiner_facture(doc, f):
+    """Dessine la facture `f` (DonneesFacture) à partir d'une nouvelle page de `doc`."""
+    doc.commencer(f"Facture N°{f.id}")
+    c = doc.canvas
+
+    doc.choisir_police("Helvetica-Bold", 20)
+    c.drawCentredString(LARGEUR / 2, doc.y, f"FACTURE N°{f.id}")
+    doc.y -= 40
+
+    # Tiers, dates et montants
+    infos = []
+    if f.tiers:
+        infos.append((f"{f.tiers} : {f.tiers_nom}", 20))
+    else:
+        doc.y -= 20
+    reste = f.montant_total - f.montant_paye
+    infos += [
+        (f"Date facture : {f.date_facture.strftime('%d/%m/%Y')}", 20),
+        (f"Statut facture : {f.statut}", 20),
+        (f"Montant total     : {f.montant_total:.2f} DH", 15),
+        (f"Montant payé      : {f.montant_paye:.2f} DH", 15),
+        (f"Reste à payer     : {reste:.2f} DH", 15),
+    ]
+    if f.date_echeance_restant:
+        infos.append((f"Date d'échéance    : {f.date_echeance_restant.strftime('%d/%m/%Y')}", 20))
+    for texte, interligne in infos:
+        doc.texte("Helvetica", 12, [(MARGE, texte)], interligne)
+    if not f.date_echeance_restant:
+        doc.y -= 10
+
+    # Lignes
+    doc.poser("separateur", "entete_lignes")
+    doc.suite = ("entete_lignes",)
+    x_nom, x_quantite, x_prix, x_total = COLONNES_LIGNES
+    for nom, quantite, prix_unitaire in f.lignes:
+        total_ligne = (quantite or 0) * (prix_unitaire or 0)
+        doc.texte("Helvetica", 10, [
+            (x_nom, nom),
+            (x_quantite, str(quantite)),
+            (x_prix, f"{prix_unitaire:.2f} DH"),
+            (x_total, f"{total_ligne:.2f} DH"),
+        ], 18)
+
+    # Paiements
+    doc.y -= 10
+    doc.suite = ()
+    doc.place(25 + 18 + 15 + 15)
+    doc.poser("separateur", "titre_paiements")
+    if f.paiements:
+        doc.poser("colonnes_paiements")
+        doc.suite = ("titre_paiements", "colonnes_paiements")
+        x_date, x_montant, x_methode, x_reference = COLONNES_PAIEMENTS
+        for date_paiement, montant, methode, reference in f.paiements:
+            doc.texte("Helvetica", 10, [
+                (x_date, date_paiement.strftime('%d/%m/%Y')),
+                (x_montant, f"{montant:.2f} DH"),
+                (x_methode, f"{methode}"),
+                (x_reference, reference),
+            ], 15)
+    else:
+        doc.texte("Helvetica", 10, [(MARGE, "Aucun paiement enregistré.")], 15)
+
+    # Relances
+    doc.y -= 10
+    doc.suite = ()
+    doc.place(25 + 18 + 15 + 15)
+    doc.poser("separateur", "titre_relances")
+    if f.relances:
+        doc.poser("colonnes_relances")
+        doc.suite = ("titre_relances", "colonnes_relances")
+        x_numero, x_date, x_statut, x_note = COLONNES_RELANCES
+        for numero, date_relance, statut, note in f.relances:
+            doc.texte("Helvetica", 10, [
+                (x_numero, str(numero)),
+                (x_date, date_relance.strftime('%d/%m/%Y')),
+                (x_statut, statut),
+                (x_note, note),
+            ], 15)
+    else:
+        doc.texte("Helvetica", 10, [(MARGE, "Aucune relance.")], 15)
+
+    doc.suite = ()
+    doc.y -= 20
+    doc.place(25 + 15)
+    doc.poser("separateur", "remerciements")
+
+
+def rendre_document(factures):
+    """Un PDF (bytes) contenant les factures `factures`, chacune à partir d'une nouvelle page."""
+    flux = io.BytesIO()
+    doc = Document(flux)
+    for f in factures:
+        dessiner_facture(doc, f)
+    doc.terminer()
+    return flux.getvalue()
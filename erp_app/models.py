@@ -1,8 +1,7 @@
 
-from datetime import date, timedelta
+from datetime import date
 
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
 
 
 class Person(models.Model):
@@ -16,6 +15,17 @@ class Person(models.Model):
     email = models.EmailField()
     telephone = models.CharField(max_length=20)
     adresse = models.TextField(blank=True)
+    # Identifiant dans le système externe : clé des synchronisations en masse
+    # (erp_app.synchronisation), vide pour les personnes saisies ici
+    cle_externe = models.CharField(max_length=100, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["type"], name="person_type_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["type", "cle_externe"], name="unique_person_type_cle_externe"),
+        ]
 
     def __str__(self):
         return f"{self.nom} ({self.get_type_display()})"
@@ -27,11 +37,59 @@ class Produit(models.Model):
     stock = models.PositiveIntegerField(default=0) 
     prix_achat = models.DecimalField(max_digits=10, decimal_places=2)
     prix_vente = models.DecimalField(max_digits=10, decimal_places=2)
+    # Identifiant dans le système externe : clé des synchronisations en masse
+    # (erp_app.synchronisation), vide pour les produits saisis ici
+    cle_externe = models.CharField(max_length=100, null=True, blank=True, unique=True)
 
     def __str__(self):
         return self.nom
 
 
+# ---------------------------------------------------------------------------
+#  MOUVEMENTS DE STOCK
+# ---------------------------------------------------------------------------
+class MouvementStock(models.Model):
+    """Journal append-only des variations de `Produit.stock` (quantité signée)."""
+
+    TYPE_CHOICES = (
+        ("initial", "Stock initial"),
+        ("entrée", "Entrée"),
+        ("sortie", "Sortie"),
+        ("ajustement", "Ajustement"),
+    )
+
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name="mouvements")
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    quantite = models.IntegerField()
+    date_mouvement = models.DateField(default=date.today)
+    ligne_commande = models.ForeignKey(
+        "LigneCommande", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    ligne_achat = models.ForeignKey("LigneAchat", on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["produit", "date_mouvement"])]
+
+    def __str__(self):
+        return f"{self.get_type_display()} {self.quantite:+d} {self.produit_id} le {self.date_mouvement}"
+
+
+class SnapshotStock(models.Model):
+    """Stock d'un produit en fin de journée, point de départ des calculs à date."""
+
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name="snapshots")
+    date = models.DateField()
+    stock = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["produit", "date"], name="unique_snapshot_stock_jour")
+        ]
+
+    def __str__(self):
+        return f"{self.produit_id} au {self.date} : {self.stock}"
+
+
 # ---------------------------------------------------------------------------
 #  ACHATS
 # ---------------------------------------------------------------------------
@@ -49,6 +107,9 @@ class Achat(models.Model):
     date_achat = models.DateField(auto_now_add=True)
     statut = models.CharField(max_length=50, choices=STATUT_CHOICES, default="en attente")
 
+    class Meta:
+        indexes = [models.Index(fields=["date_achat", "id"], name="achat_date_id_idx")]
+
     def __str__(self):
         return f"Achat #{self.id} - {self.statut}"
 
@@ -80,6 +141,9 @@ class Commande(models.Model):
     date_commande = models.DateField(auto_now_add=True)
     statut = models.CharField(max_length=50, choices=STATUT_CHOICES, default="en attente")
 
+    class Meta:
+        indexes = [models.Index(fields=["date_commande", "id"], name="commande_date_id_idx")]
+
     def __str__(self):
         return f"Commande #{self.id} - {self.statut}"
 
@@ -122,6 +186,25 @@ class Facture(models.Model):
         LigneAchat, blank=True, related_name="factures"
     )
 
+    class Meta:
+        indexes = [
+            # Pagination par (date, id)
+            models.Index(fields=["date_facture", "id"], name="facture_date_id_idx"),
+            # Factures ouvertes (relances, rapprochement) : index partiel, la
+            # grande majorité des factures étant soldées
+            models.Index(
+                fields=["date_facture"],
+                condition=~models.Q(statut="payée"),
+                name="facture_ouverte_date_idx",
+            ),
+            # Échéances restantes : seules les factures non soldées en ont une
+            models.Index(
+                fields=["date_echeance_restant"],
+                condition=models.Q(date_echeance_restant__isnull=False),
+                name="facture_echeance_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Facture #{self.id} - {self.statut}"
 
@@ -140,6 +223,22 @@ class CompteBancaire(models.Model):
         return f"{self.nom_banque} - {self.numero_compte}"
 
 
+class SoldeJournalier(models.Model):
+    """Solde de clôture d'un compte pour chaque jour ayant eu des mouvements."""
+    compte = models.ForeignKey(CompteBancaire, on_delete=models.CASCADE, related_name="soldes_journaliers")
+    date = models.DateField()
+    variation = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    solde = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["compte", "date"], name="unique_solde_compte_jour"),
+        ]
+
+    def __str__(self):
+        return f"{self.compte_id} au {self.date} : {self.solde} DH"
+
+
 class TransactionTresorerie(models.Model):
     TYPE_CHOICES = (("entrée", "Entrée"), ("sortie", "Sortie"))
 
@@ -152,6 +251,9 @@ class TransactionTresorerie(models.Model):
     facture = models.ForeignKey(Facture, on_delete=models.SET_NULL, null=True, blank=True)
     paiement = models.ForeignKey("Paiement", on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["date_transaction", "id"], name="transaction_date_id_idx")]
+
     def __str__(self):
         compte = f"({self.compte})" if self.compte else ""
         return f"{self.type} - {self.montant} DH le {self.date_transaction} {compte}"
@@ -176,59 +278,48 @@ class Paiement(models.Model):
     paiement_complet    = models.BooleanField(default=True)
     date_echeance_solde = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Paiements du jour et pagination par (date, id)
+            models.Index(fields=["date_paiement", "id"], name="paiement_date_id_idx"),
+            # Premier paiement d'une facture (délai de paiement, risque client)
+            models.Index(fields=["facture", "date_paiement"], name="paiement_facture_date_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["reference_paiement"],
+                condition=~models.Q(reference_paiement=""),
+                name="unique_reference_paiement",
+            ),
+        ]
+
     def __str__(self):
         return f"Paiement {self.montant} DH facture {self.facture_id}"
 
     # ------------------------------------------------------------
-    # Logique de cascade : trésorerie + mise à jour facture/statut
+    # Comptabilisation : trésorerie + solde compte + facture/statut
     # ------------------------------------------------------------
     def save(self, *args, **kwargs):
+        from .services import comptabiliser_paiement
+        from .unite_travail import marquer_facture
+
         is_new = self._state.adding
-        super().save(*args, **kwargs)
-
-        # Créer la ligne de trésorerie à la création
-        if is_new and self.compte_bancaire:
-            # Déterminer sens du flux
-            if self.facture.commande:
-                t_type = "entrée"  # client paie -> argent entre
-            elif self.facture.achat:
-                t_type = "sortie"  # on paie fournisseur -> argent sort
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if is_new:
+                comptabiliser_paiement(self)
             else:
-                t_type = "entrée"
-
-            TransactionTresorerie.objects.create(
-                compte=self.compte_bancaire,
-                type=t_type,
-                montant=self.montant,
-                description=f"Paiement pour facture #{self.facture.id}",
-                paiement=self,
-                facture=self.facture,
-            )
-
-            # Mise à jour solde compte
-            if t_type == "entrée":
-                self.compte_bancaire.solde += self.montant
-            else:
-                self.compte_bancaire.solde -= self.montant
-            self.compte_bancaire.save(update_fields=["solde"])
+                # Montant modifié : recalcul depuis les paiements au commit
+                marquer_facture(self.facture_id)
 
-        # ---------------------------------------------
-        #   Mettre à jour montant_paye + statut facture
-        # ---------------------------------------------
-        total_paye = self.facture.paiement_set.aggregate(total=Sum("montant"))["total"] or 0
-        self.facture.montant_paye = total_paye
 
-        reste = self.facture.montant_total - total_paye
-        if reste <= 0:
-            self.facture.statut = "payée"
-            self.facture.date_echeance_restant = None
-        else:
-            self.facture.statut = "partielle" if total_paye > 0 else "impayée"
-            # si aucun échéancier défini, propose +7 jours par défaut
-            if not self.facture.date_echeance_restant:
-                self.facture.date_echeance_restant = date.today() + timedelta(days=7)
+class SequencePaiement(models.Model):
+    """Compteur journalier des références PAI-YYYYMMDD-NNNN (une ligne par jour)."""
+    jour = models.DateField(unique=True)
+    dernier = models.PositiveIntegerField(default=0)
 
-        self.facture.save(update_fields=["montant_paye", "statut", "date_echeance_restant"])
+    def __str__(self):
+        return f"{self.jour} : {self.dernier}"
 
 
 # ---------------------------------------------------------------------------
@@ -241,6 +332,12 @@ class RelancePaiement(models.Model):
     numero = models.PositiveSmallIntegerField(default=1)
     note = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["facture", "date_relance"], name="relance_facture_date_idx"),
+            models.Index(fields=["date_relance", "id"], name="relance_date_id_idx"),
+        ]
+
     def __str__(self):
         return f"Relance #{self.numero} facture {self.facture_id}"
 
@@ -267,5 +364,47 @@ class VenteHistorique(models.Model):
     mois = models.DateField()  # Ex: 2024-03-01
     quantite = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["produit", "mois"], name="unique_vente_produit_mois"),
+        ]
+
     def __str__(self):
         return f"{self.produit.nom} - {self.mois.strftime('%Y-%m')} : {self.quantite}"
+
+
+# ---------------------------------------------------------------------------
+#  TÂCHES DE FOND (voir erp_app.jobs)
+# ---------------------------------------------------------------------------
+class Job(models.Model):
+    STATUT_CHOICES = [
+        ("en attente", "En attente"),
+        ("en cours", "En cours"),
+        ("terminé", "Terminé"),
+        ("échoué", "Échoué"),
+    ]
+
+    type = models.CharField(max_length=50)
+    parametres = models.JSONField(default=dict, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default="en attente")
+    resultat = models.JSONField(null=True, blank=True)
+    # Fichier produit (PDF, archive, export, image), sous JOBS_DIR
+    fichier = models.CharField(max_length=255, blank=True)
+    nom_fichier = models.CharField(max_length=255, blank=True)
+    type_contenu = models.CharField(max_length=100, blank=True)
+    erreur = models.TextField(blank=True)
+    cree_le = models.DateTimeField(auto_now_add=True)
+    debut = models.DateTimeField(null=True, blank=True)
+    fin = models.DateTimeField(null=True, blank=True)
+    # Worker (hôte:pid) qui exécute le job et dernier signe de vie de ce worker
+    proprietaire = models.CharField(max_length=100, blank=True)
+    battement = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # File d'attente : prochains jobs en attente, par ordre d'arrivée
+            models.Index(fields=["statut", "id"], name="job_statut_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.id} {self.type} - {self.statut}"
@@ -0,0 +1,214 @@
+# erp_app/pagination.py
+"""
+Pagination par curseur (keyset) : la page suivante est sélectionnée par
+`WHERE date <= d AND (date < d OR (date = d AND id < i))` sur l'ordre de la
+vue, (d, i) étant la position de la dernière ligne, et non par OFFSET. Une
+page profonde coûte donc autant que la première, à condition qu'un index
+couvre l'ordre de la vue.
+
+L'ordre est donné par `?ordering=` (OrderingFilter) ou, à défaut, par
+l'attribut `ordering` de la vue, par exemple `("-date_facture", "-id")` ;
+l'id est ajouté en dernier critère s'il n'y figure pas. Les champs de tri ne
+doivent pas être nullables.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .renderers import JSONFluxRenderer
+
+TOUT = "all"
+
+
+class CurseurPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = ("id",)
+
+    def get_page_size(self, request):
+        valeur = request.query_params.get(self.page_size_query_param)
+        if valeur:
+            try:
+                return max(1, min(int(valeur), self.max_page_size))
+            except ValueError:
+                pass
+        return api_settings.PAGE_SIZE or 50
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Ordre demandé via OrderingFilter (?ordering=) s'il est actif sur la
+        vue, sinon `view.ordering`. L'id est ajouté pour départager les ex aequo.
+        """
+        ordre = None
+        for backend in getattr(view, "filter_backends", ()):
+            if issubclass(backend, OrderingFilter):
+                ordre = backend().get_ordering(request, queryset, view)
+        ordre = list(ordre or getattr(view, "ordering", None) or self.ordering)
+        if not any(champ.lstrip("-") in ("id", "pk") for champ in ordre):
+            ordre.append("-id" if ordre[0].startswith("-") else "id")
+        return tuple(ordre)
+
+    @classmethod
+    def export_demande(cls, request):
+        return request.query_params.get(cls.page_size_query_param) == TOUT
+
+    # ------------------------------------------------------------------
+    # Curseur
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _encoder(valeurs, precedent):
+        brut = json.dumps({"v": valeurs, "p": precedent}, cls=DjangoJSONEncoder, separators=(",", ":"))
+        return urlsafe_b64encode(brut.encode()).decode().rstrip("=")
+
+    def _decoder(self, curseur):
+        try:
+            brut = urlsafe_b64decode(curseur + "=" * (-len(curseur) % 4))
+            donnees = json.loads(brut)
+            valeurs, precedent = donnees["v"], bool(donnees["p"])
+        except (ValueError, TypeError, KeyError):
+            raise NotFound("Curseur invalide.")
+        if not isinstance(valeurs, list) or len(valeurs) != len(self.champs):
+            raise NotFound("Curseur invalide.")
+        return valeurs, precedent
+
+    def _apres(self, valeurs, precedent):
+        """
+        Q des lignes situées après `valeurs` dans l'ordre (avant si `precedent`).
+        La disjonction seule n'est pas exploitable par l'index : la borne sur le
+        premier champ, ajoutée en conjonction, en fait un parcours d'intervalle
+        qui commence au curseur au lieu du début de l'index.
+        """
+        conditions = []
+        for i, champ in enumerate(self.champs):
+            operateur = self._operateur(champ, precedent)
+            egalites = {c.lstrip("-"): v for c, v in zip(self.champs[:i], valeurs)}
+            conditions.append(Q(**egalites, **{f"{champ.lstrip('-')}__{operateur}": valeurs[i]}))
+        if len(conditions) == 1:
+            return conditions[0]
+        premier = self.champs[0]
+        borne = Q(**{f"{premier.lstrip('-')}__{self._operateur(premier, precedent)}e": valeurs[0]})
+        return borne & reduce(or_, conditions)
+
+    @staticmethod
+    def _operateur(champ, precedent):
+        return "lt" if champ.startswith("-") != precedent else "gt"
+
+    def _position(self, objet):
+        return [getattr(objet, champ.lstrip("-")) for champ in self.champs]
+
+    # ------------------------------------------------------------------
+    # API DRF
+    # ------------------------------------------------------------------
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.export_demande(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.champs = self.get_ordering(request, queryset, view)
+
+        curseur = request.query_params.get(self.cursor_query_param)
+        valeurs, precedent = self._decoder(curseur) if curseur else (None, False)
+
+        ordre = self.champs
+        if precedent:
+            ordre = tuple(c[1:] if c.startswith("-") else f"-{c}" for c in self.champs)
+        queryset = queryset.order_by(*ordre)
+        if valeurs is not None:
+            queryset = queryset.filter(self._apres(valeurs, precedent))
+
+        resultats = list(queryset[: self.page_size + 1])
+        plus = len(resultats) > self.page_size
+        page = resultats[: self.page_size]
+        if precedent:
+            page.reverse()
+
+        # Pages voisines : positions de la dernière et de la première ligne.
+        # Arrivé par un curseur, il existe toujours une page du côté d'où l'on vient.
+        self.suivante = self._position(page[-1]) if page and (plus or precedent) else None
+        self.precedente = self._position(page[0]) if page and valeurs is not None and (plus or not precedent) else None
+        return page
+
+    def get_next_link(self):
+        if self.suivante is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self._encoder(self.suivante, False))
+
+    def get_previous_link(self):
+        if self.precedente is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self._encoder(self.precedente, True))
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class ExportFluxMixin:
+    """
+    Listes complètes en flux, lues par lots avec `.iterator()` au lieu d'être
+    chargées en mémoire : `?page_size=all` sur la liste (tableau JSON), ou une
+    action d'export qui appelle `reponse_flux` avec les rendus de
+    erp_app.renderers (JSON ou NDJSON, au choix par Accept ou ?format=).
+    """
+    taille_lot_export = 500
+
+    def list(self, request, *args, **kwargs):
+        if not CurseurPagination.export_demande(request):
+            return super().list(request, *args, **kwargs)
+        return self.reponse_flux(self.filter_queryset(self.get_queryset()))
+
+    def reponse_flux(self, queryset, nom_fichier=None):
+        renderer = getattr(self.request, "accepted_renderer", None)
+        if not hasattr(renderer, "flux"):
+            renderer = JSONFluxRenderer()
+        ordering = getattr(self, "ordering", None)
+        if ordering and not queryset.ordered:
+            queryset = queryset.order_by(*ordering)
+        response = StreamingHttpResponse(renderer.flux(self._lots(queryset)), content_type=renderer.media_type)
+        if nom_fichier:
+            response["Content-Disposition"] = f'attachment; filename="{nom_fichier}.{renderer.format}"'
+        return response
+
+    def _lots(self, queryset):
+        """Objets sérialisés, par lots de `taille_lot_export`."""
+        lot = []
+        # chunk_size explicite : curseur côté serveur sous PostgreSQL, et
+        # prefetch_related appliqué à chaque lot
+        for objet in queryset.iterator(chunk_size=self.taille_lot_export):
+            lot.append(objet)
+            if len(lot) == self.taille_lot_export:
+                yield self.get_serializer(lot, many=True).data
+                lot = []
+        if lot:
+            yield self.get_serializer(lot, many=True).data
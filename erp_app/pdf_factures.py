@@ -0,0 +1,188 @@
+# erp_app/pdf_factures.py
+"""
+Rendu PDF des factures, à l'unité (téléchargement) ou par lots (archive ZIP).
+
+Le rendu est séparé de la lecture : `charger_factures` lit les factures par
+lots avec le tiers, les lignes (et leurs produits), les paiements et les
+relances en quelques requêtes, et les réduit à des `DonneesFacture` de types
+simples. `rendre_facture` ne touche plus à la base : il peut donc tourner dans
+un processus de travail, et `rendus` répartit les rendus sur les cœurs. La
+mise en page elle-même est dans erp_app.mise_en_page.
+
+L'archive est écrite au fil de l'eau : seuls les rendus en cours (une fenêtre
+de quelques factures par processus) et le fichier en cours d'ajout sont en
+mémoire, quel que soit le nombre de factures.
+"""
+
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+
+import django
+from django.db.models import Prefetch
+
+from .mise_en_page import rendre_document
+from .models import Facture, LigneAchat, LigneCommande, Paiement, RelancePaiement
+
+TAILLE_LOT = 200
+FACTURES_PAR_PROCESSUS = 4  # rendus en attente par processus (fenêtre)
+
+
+@dataclass
+class DonneesFacture:
+    """Tout ce que le PDF affiche, sans objet ORM (sérialisable vers un processus de travail)."""
+    id: int
+    tiers: str                      # "Client" / "Fournisseur" / ""
+    tiers_nom: str
+    date_facture: date
+    statut: str
+    montant_total: Decimal
+    montant_paye: Decimal
+    date_echeance_restant: date = None
+    lignes: list = field(default_factory=list)     # (désignation, quantité, prix unitaire)
+    paiements: list = field(default_factory=list)  # (date, montant, méthode, référence)
+    relances: list = field(default_factory=list)   # (numéro, date, statut, note)
+
+    @property
+    def nom_fichier(self):
+        return f"facture_{self.id}.pdf"
+
+
+# ---------------------------------------------------------------------------
+# Lecture
+# ---------------------------------------------------------------------------
+
+def factures_pour_pdf(queryset=None):
+    """Factures avec tout ce que le rendu lit : une requête par relation et par lot."""
+    queryset = Facture.objects.all() if queryset is None else queryset
+    return queryset.select_related("commande__client", "achat__fournisseur").prefetch_related(
+        Prefetch(
+            "commande__lignecommande_set",
+            queryset=LigneCommande.objects.select_related("produit").order_by("id"),
+        ),
+        Prefetch("achat__lignes", queryset=LigneAchat.objects.select_related("produit").order_by("id")),
+        Prefetch("paiement_set", queryset=Paiement.objects.order_by("date_paiement", "id")),
+        Prefetch("relances", queryset=RelancePaiement.objects.order_by("numero", "id")),
+    )
+
+
+def donnees_facture(facture):
+    """Réduit une facture chargée par `factures_pour_pdf` à ses `DonneesFacture`."""
+    if facture.commande_id:
+        tiers, tiers_nom = "Client", facture.commande.client.nom
+        lignes = facture.commande.lignecommande_set.all()
+    elif facture.achat_id:
+        tiers, tiers_nom = "Fournisseur", facture.achat.fournisseur.nom
+        lignes = facture.achat.lignes.all()
+    else:
+        tiers, tiers_nom, lignes = "", "", ()
+    return DonneesFacture(
+        id=facture.id,
+        tiers=tiers,
+        tiers_nom=tiers_nom,
+        date_facture=facture.date_facture,
+        statut=facture.statut,
+        montant_total=facture.montant_total,
+        montant_paye=facture.montant_paye,
+        date_echeance_restant=facture.date_echeance_restant,
+        lignes=[(l.produit.nom, l.quantite, l.prix_unitaire) for l in lignes],
+        paiements=[(p.date_paiement, p.montant, p.methode, p.reference_paiement) for p in facture.paiement_set.all()],
+        relances=[(r.numero, r.date_relance, r.statut, r.note) for r in facture.relances.all()],
+    )
+
+
+def charger_factures(queryset=None, taille_lot=TAILLE_LOT):
+    """`DonneesFacture` des factures de `queryset`, lues par lots de `taille_lot`."""
+    queryset = factures_pour_pdf(queryset)
+    if not queryset.ordered:
+        queryset = queryset.order_by("id")
+    for facture in queryset.iterator(chunk_size=taille_lot):
+        yield donnees_facture(facture)
+
+
+# ---------------------------------------------------------------------------
+# Rendu
+# ---------------------------------------------------------------------------
+
+def rendre_facture(f):
+    """PDF (bytes) d'une facture. Fonction pure : aucune requête."""
+    return rendre_document([f])
+
+
+def _rendre(donnees):
+    return donnees.nom_fichier, rendre_facture(donnees)
+
+
+def rendus(donnees, processus=None):
+    """
+    (nom de fichier, PDF) de chaque facture de l'itérable `donnees`, dans
+    l'ordre. Avec plusieurs processus, au plus `FACTURES_PAR_PROCESSUS` rendus
+    par processus sont en attente : la lecture suit le rythme des rendus.
+    Par défaut un processus par cœur : réservé aux commandes et au worker, une
+    requête HTTP passe `settings.PDF_PROCESSUS_REQUETE`.
+    """
+    processus = processus or os.cpu_count() or 1
+    if processus == 1:
+        yield from map(_rendre, donnees)
+        return
+    # spawn et non fork : l'appelant peut avoir des threads (worker_jobs), dont
+    # les verrous seraient copiés dans leur état ; chaque processus initialise Django
+    with ProcessPoolExecutor(
+        max_workers=processus, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup,
+    ) as pool:
+        en_cours = deque()
+        for d in donnees:
+            en_cours.append(pool.submit(_rendre, d))
+            if len(en_cours) >= processus * FACTURES_PAR_PROCESSUS:
+                yield en_cours.popleft().result()
+        while en_cours:
+            yield en_cours.popleft().result()
+
+
+# ---------------------------------------------------------------------------
+# Archive ZIP
+# ---------------------------------------------------------------------------
+
+class _Tampon(io.RawIOBase):
+    """Sortie non positionnable : ZipFile y écrit, `vider` rend ce qui a été écrit."""
+
+    def __init__(self):
+        self.morceaux = []
+
+    def writable(self):
+        return True
+
+    def write(self, donnees):
+        self.morceaux.append(bytes(donnees))
+        return len(donnees)
+
+    def vider(self):
+        contenu, self.morceaux = b"".join(self.morceaux), []
+        return contenu
+
+
+def flux_zip(queryset=None, processus=None):
+    """Archive ZIP des PDF des factures de `queryset`, émise morceau par morceau."""
+    tampon = _Tampon()
+    # Les PDF sont déjà compressés : stockés tels quels
+    with zipfile.ZipFile(tampon, "w", compression=zipfile.ZIP_STORED) as archive:
+        for nom, pdf in rendus(charger_factures(queryset), processus):
+            archive.writestr(nom, pdf)
+            yield tampon.vider()
+    yield tampon.vider()
+
+
+def ecrire_zip(sortie, queryset=None, processus=None):
+    """Écrit l'archive dans le fichier binaire `sortie` ; renvoie le nombre de factures."""
+    n = 0
+    with zipfile.ZipFile(sortie, "w", compression=zipfile.ZIP_STORED) as archive:
+        for nom, pdf in rendus(charger_factures(queryset), processus):
+            archive.writestr(nom, pdf)
+            n += 1
+    return n
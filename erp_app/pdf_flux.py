@@ -0,0 +1,103 @@
+# erp_app/pdf_flux.py
+"""
+Structure d'un fichier PDF écrite au fil de l'eau, pour les documents dont
+le nombre de pages n'est pas borné (relevés de compte, erp_app.releve) : le
+canvas de ReportLab garde toutes les pages en mémoire jusqu'à `save()`.
+
+L'appelant fournit le contenu de chaque page (opérateurs PDF, comme ceux
+d'erp_app.mise_en_page) ; ce module n'écrit que les objets du fichier :
+polices standard en WinAnsi, form XObjects communs, pages, puis liste des
+pages, catalogue et table des références. Chaque objet est émis dès qu'il
+est complet ; seules sa position et la liste des pages sont retenues
+(quelques octets par page).
+"""
+
+import zlib
+
+
+class EcrivainPdf:
+    """
+    Fichier PDF de pages `largeur` × `hauteur`, polices `polices` (nom de
+    ressource : police standard). Chaque méthode renvoie les octets à émettre,
+    dans l'ordre : `entete`, `page` pour chaque page, `fin`.
+    """
+
+    def __init__(self, largeur, hauteur, polices):
+        self.largeur, self.hauteur, self.polices = largeur, hauteur, polices
+        self.position = 0
+        self.positions = [None]  # par numéro d'objet ; 0 : entrée libre de la table
+        self.pages = []
+        self.arbre = None
+        self.ressources = None
+
+    def _reserver(self):
+        self.positions.append(None)
+        return len(self.positions) - 1
+
+    def _objet(self, numero, corps):
+        self.positions[numero] = self.position
+        donnees = b"%d 0 obj\n%s\nendobj\n" % (numero, corps)
+        self.position += len(donnees)
+        return donnees
+
+    def _flux(self, numero, dictionnaire, contenu):
+        compresse = zlib.compress(contenu.encode("latin-1"))
+        return self._objet(
+            numero,
+            b"<< %s/Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream" % (dictionnaire, len(compresse), compresse),
+        )
+
+    def entete(self, formulaires):
+        """Début du fichier : polices et form XObjects (nom : contenu) communs à toutes les pages."""
+        sortie = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"]
+        self.position = len(sortie[0])
+        self.arbre = self._reserver()  # liste des pages, écrite à la fin
+
+        polices = []
+        for nom, police in self.polices.items():
+            numero = self._reserver()
+            sortie.append(self._objet(
+                numero, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % police.encode(),
+            ))
+            polices.append(b"/%s %d 0 R" % (nom.encode(), numero))
+        polices = b"/Font << %s >>" % b" ".join(polices)
+
+        formes = []
+        for nom, contenu in formulaires.items():
+            numero = self._reserver()
+            # Dessiné autour de son ancrage (0, 0), comme les éléments de Gabarit
+            sortie.append(self._flux(numero, b"/Type /XObject /Subtype /Form /BBox [0 %d %d %d] /Resources << %s >> " % (
+                -self.hauteur, self.largeur, self.hauteur, polices,
+            ), contenu))
+            formes.append(b"/%s %d 0 R" % (nom.encode(), numero))
+
+        self.ressources = self._reserver()
+        sortie.append(self._objet(
+            self.ressources, b"<< %s /XObject << %s >> >>" % (polices, b" ".join(formes)),
+        ))
+        return b"".join(sortie)
+
+    def page(self, contenu):
+        contenus, numero = self._reserver(), self._reserver()
+        sortie = self._flux(contenus, b"", contenu) + self._objet(numero, (
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources %d 0 R /Contents %d 0 R >>"
+            % (self.arbre, self.largeur, self.hauteur, self.ressources, contenus)
+        ))
+        self.pages.append(numero)
+        return sortie
+
+    def fin(self):
+        """Liste des pages, catalogue, table des références et trailer."""
+        catalogue = self._reserver()
+        sortie = [
+            self._objet(self.arbre, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                b" ".join(b"%d 0 R" % numero for numero in self.pages), len(self.pages),
+            )),
+            self._objet(catalogue, b"<< /Type /Catalog /Pages %d 0 R >>" % self.arbre),
+            b"xref\n0 %d\n0000000000 65535 f \n" % len(self.positions),
+        ]
+        sortie += [b"%010d 00000 n \n" % position for position in self.positions[1:]]
+        sortie.append(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(self.positions), catalogue, self.position,
+        ))
+        return b"".join(sortie)
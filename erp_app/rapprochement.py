@@ -0,0 +1,291 @@
+# erp_app/rapprochement.py
+"""
+Import de relevés bancaires : chaque ligne est rapprochée d'une facture
+ouverte, puis les paiements et lignes de trésorerie sont écrits en lot.
+
+Les factures ouvertes sont chargées une fois dans deux index en mémoire (par
+numéro et par reste à payer) ; le relevé est lu en flux, ligne à ligne. Un
+crédit règle une facture client, un débit une facture fournisseur.
+"""
+
+import csv
+import html
+import io
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F
+
+from .cache_pdf import invalider_apres_commit
+from .models import Facture, Paiement, TransactionTresorerie
+from .sequences import allouer_references
+from .tresorerie import mouvementer_compte
+from .unite_travail import atomique, modifier_versions, recalculer_paiements
+
+CENTIME = Decimal("0.01")
+
+# "FACTURE N°12", "Facture #12", "FAC-12", "fac 12"...
+REFERENCE_FACTURE = re.compile(r"\bFAC(?:TURE)?\s*(?:N°|NO|N|#)?\s*[-:.]?\s*(\d+)", re.IGNORECASE)
+
+
+class ReleveInvalide(Exception):
+    pass
+
+
+@dataclass
+class LigneReleve:
+    numero: int          # numéro de ligne dans le fichier
+    date: date
+    montant: Decimal     # positif : crédit, négatif : débit
+    libelle: str
+
+
+@dataclass
+class Rapport:
+    rapprochees: list = field(default_factory=list)   # (ligne, facture_id)
+    ambigues: list = field(default_factory=list)      # (ligne, [facture_id, ...])
+    non_rapprochees: list = field(default_factory=list)
+
+    def resume(self):
+        return {
+            "rapprochees": len(self.rapprochees),
+            "ambigues": len(self.ambigues),
+            "non_rapprochees": len(self.non_rapprochees),
+        }
+
+    def en_dict(self):
+        def ligne(l):
+            return {"ligne": l.numero, "date": l.date, "montant": l.montant, "libelle": l.libelle}
+
+        return {
+            **self.resume(),
+            "details": {
+                "rapprochees": [{**ligne(l), "facture": f} for l, f in self.rapprochees],
+                "ambigues": [{**ligne(l), "factures": f} for l, f in self.ambigues],
+                "non_rapprochees": [ligne(l) for l in self.non_rapprochees],
+            },
+        }
+
+
+# ---------------------------------------------------------------------------
+# Lecture du relevé
+# ---------------------------------------------------------------------------
+
+def _montant(valeur):
+    try:
+        return Decimal(valeur.strip().replace(" ", "").replace(",", ".")).quantize(CENTIME)
+    except InvalidOperation:
+        raise ReleveInvalide(f"Montant invalide : {valeur!r}")
+
+
+def _date(valeur):
+    valeur = valeur.strip()
+    # AAAA-MM-JJ, JJ/MM/AAAA ou AAAAMMJJ[HHMMSS...] (OFX)
+    for format, longueur in (("%Y-%m-%d", 10), ("%d/%m/%Y", 10), ("%Y%m%d", 8)):
+        try:
+            return datetime.strptime(valeur[:longueur], format).date()
+        except ValueError:
+            continue
+    raise ReleveInvalide(f"Date invalide : {valeur!r}")
+
+
+def _lire_csv(lignes):
+    """CSV avec en-tête : date, montant, libelle (séparateur , ou ;)."""
+    premiere = next(lignes, "")
+    separateur = "," if premiere.count(",") >= premiere.count(";") else ";"
+    entetes = [e.strip().lower() for e in next(csv.reader([premiere], delimiter=separateur))]
+    manquantes = {"date", "montant", "libelle"} - set(entetes)
+    if manquantes:
+        raise ReleveInvalide(f"Colonnes manquantes : {', '.join(sorted(manquantes))}")
+
+    for numero, valeurs in enumerate(csv.reader(lignes, delimiter=separateur), start=2):
+        if not any(valeurs):
+            continue
+        ligne = dict(zip(entetes, valeurs))
+        yield LigneReleve(numero, _date(ligne["date"]), _montant(ligne["montant"]), ligne["libelle"].strip())
+
+
+_BALISE_OFX = re.compile(r"<(/?)(\w+)>([^<\r\n]*)")
+
+
+def _lire_ofx(lignes):
+    """
+    Blocs <STMTTRN> d'un relevé OFX : DTPOSTED, TRNAMT, NAME / MEMO. Balises
+    lues une à une, en SGML (OFX 1.x, feuilles sans balise fermante) comme en
+    XML (OFX 2.x, souvent plusieurs blocs sur une seule ligne).
+    """
+    transaction_ofx, debut = None, 0
+    for numero, texte in enumerate(lignes, start=1):
+        for fermante, balise, valeur in _BALISE_OFX.findall(texte):
+            balise = balise.upper()
+            if balise != "STMTTRN":
+                if transaction_ofx is not None and not fermante:
+                    transaction_ofx[balise] = html.unescape(valeur.strip())
+            elif not fermante:
+                transaction_ofx, debut = {}, numero
+            elif transaction_ofx is not None:
+                libelle = " ".join(filter(None, (transaction_ofx.get("NAME"), transaction_ofx.get("MEMO"))))
+                yield LigneReleve(
+                    debut, _date(transaction_ofx["DTPOSTED"]), _montant(transaction_ofx["TRNAMT"]), libelle,
+                )
+                transaction_ofx = None
+
+
+def lire_releve(fichier):
+    """
+    Itère sur les lignes d'un relevé (fichier texte ou binaire) sans le charger
+    entièrement. Le format (CSV ou OFX) est détecté sur le début du fichier.
+    """
+    if isinstance(fichier, bytes):
+        fichier = io.BytesIO(fichier)
+    elif isinstance(fichier, str):
+        fichier = io.StringIO(fichier)
+    if not isinstance(fichier, io.TextIOBase) and "b" in getattr(fichier, "mode", "b"):
+        fichier = io.TextIOWrapper(fichier, encoding="utf-8-sig", newline="")
+
+    lignes = iter(fichier)
+    debut = []
+    for texte in lignes:
+        debut.append(texte)
+        if texte.strip():
+            break
+    if not debut:
+        return
+
+    def toutes():
+        yield from debut
+        yield from lignes
+
+    # OFX 1.x : en-tête « OFXHEADER:100 » ; OFX 2.x : « <?xml ...?> » puis « <?OFX ...?> »
+    entete = debut[-1].lstrip().upper()
+    if entete.startswith(("OFXHEADER", "<OFX", "<?XML", "<?OFX")):
+        yield from _lire_ofx(toutes())
+    else:
+        yield from _lire_csv(l for l in toutes() if l.strip())
+
+
+# ---------------------------------------------------------------------------
+# Rapprochement
+# ---------------------------------------------------------------------------
+
+class IndexFactures:
+    """Factures ouvertes indexées par numéro et par (sens, reste à payer)."""
+
+    def __init__(self):
+        self.restes = {}                  # facture_id -> (sens, reste)
+        self.par_montant = defaultdict(set)
+        ouvertes = Facture.objects.exclude(statut="payée").filter(montant_total__gt=F("montant_paye"))
+        for pk, commande_id, achat_id, total, paye in ouvertes.values_list(
+            "pk", "commande_id", "achat_id", "montant_total", "montant_paye"
+        ).iterator():
+            sens = "sortie" if achat_id and not commande_id else "entrée"
+            self._indexer(pk, sens, (total - paye).quantize(CENTIME))
+
+    def _indexer(self, pk, sens, reste):
+        self.restes[pk] = (sens, reste)
+        if reste > 0:
+            self.par_montant[(sens, reste)].add(pk)
+
+    def _imputer(self, pk, montant):
+        sens, reste = self.restes[pk]
+        self.par_montant[(sens, reste)].discard(pk)
+        self._indexer(pk, sens, reste - montant)
+
+    def rapprocher(self, ligne):
+        """Retourne (facture_id, None), (None, candidates) si ambiguë, ou (None, [])."""
+        sens = "entrée" if ligne.montant > 0 else "sortie"
+        montant = abs(ligne.montant)
+
+        numeros = {int(n) for n in REFERENCE_FACTURE.findall(ligne.libelle)}
+        if numeros:
+            candidates = sorted(
+                pk for pk in numeros
+                if pk in self.restes and self.restes[pk][0] == sens and 0 < montant <= self.restes[pk][1]
+            )
+        else:
+            candidates = sorted(self.par_montant.get((sens, montant), ()))
+
+        if len(candidates) == 1:
+            self._imputer(candidates[0], montant)
+            return candidates[0], None
+        return None, candidates
+
+
+def importer_releve(fichier, compte=None, simulation=False, taille_lot=1000):
+    """
+    Rapproche et enregistre les lignes d'un relevé ; retourne un `Rapport`.
+
+    Paiements et lignes de trésorerie sont insérés par `bulk_create`, puis le
+    montant payé et le statut des factures touchées sont recalculés en deux
+    UPDATE. Paiements et lignes de trésorerie prennent la date de leur ligne
+    de relevé, et le solde du compte est mouvementé une fois par date, ce qui
+    tient à jour ses soldes journaliers. Tout est fait dans une même
+    transaction ; `simulation` ne fait que le rapprochement.
+    """
+    rapport = Rapport()
+    index = IndexFactures()
+    for ligne in lire_releve(fichier):
+        facture_id, candidates = index.rapprocher(ligne)
+        if facture_id:
+            rapport.rapprochees.append((ligne, facture_id))
+        elif candidates:
+            rapport.ambigues.append((ligne, candidates))
+        else:
+            rapport.non_rapprochees.append(ligne)
+
+    if simulation or not rapport.rapprochees:
+        return rapport
+
+    compte_id = getattr(compte, "pk", compte)
+    with atomique():
+        references = allouer_references(len(rapport.rapprochees))
+        paiements = Paiement.objects.bulk_create(
+            [
+                Paiement(
+                    facture_id=facture_id,
+                    montant=abs(ligne.montant),
+                    methode="virement",
+                    compte_bancaire_id=compte_id,
+                    reference_paiement=reference,
+                )
+                for (ligne, facture_id), reference in zip(rapport.rapprochees, references)
+            ],
+            batch_size=taille_lot,
+        )
+        operations = TransactionTresorerie.objects.bulk_create(
+            [
+                TransactionTresorerie(
+                    compte_id=compte_id,
+                    type="entrée" if ligne.montant > 0 else "sortie",
+                    montant=abs(ligne.montant),
+                    description=f"Paiement pour facture #{facture_id} (relevé du {ligne.date} : {ligne.libelle})",
+                    paiement=paiement,
+                    facture_id=facture_id,
+                )
+                for (ligne, facture_id), paiement in zip(rapport.rapprochees, paiements)
+            ],
+            batch_size=taille_lot,
+        )
+        # auto_now_add date les lignes du jour de l'import : elles reprennent
+        # la date du relevé, un UPDATE par date et par lot
+        paiements_du_jour, operations_du_jour = defaultdict(list), defaultdict(list)
+        montants = defaultdict(Decimal)
+        for (ligne, _), paiement, operation in zip(rapport.rapprochees, paiements, operations):
+            paiements_du_jour[ligne.date].append(paiement.pk)
+            operations_du_jour[ligne.date].append(operation.pk)
+            montants[ligne.date] += ligne.montant
+        for jour, montant in sorted(montants.items()):
+            for debut in range(0, len(paiements_du_jour[jour]), taille_lot):
+                lot = slice(debut, debut + taille_lot)
+                Paiement.objects.filter(pk__in=paiements_du_jour[jour][lot]).update(date_paiement=jour)
+                TransactionTresorerie.objects.filter(pk__in=operations_du_jour[jour][lot]).update(date_transaction=jour)
+            mouvementer_compte(compte_id, montant, jour=jour)
+        factures = {facture_id for _, facture_id in rapport.rapprochees}
+        recalculer_paiements(factures)
+        modifier_versions(Facture, factures)
+        invalider_apres_commit(factures)
+
+    return rapport
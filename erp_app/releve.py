@@ -0,0 +1,245 @@
+# erp_app/releve.py
+"""
+Relevé de compte client (PDF) : factures et paiements d'une période, dans
+l'ordre des dates, avec le solde après chaque mouvement.
+
+Le relevé tient en mémoire constante, quelle que soit la longueur de
+l'historique du client :
+
+- les mouvements sont lus par une seule requête (UNION des factures et des
+  paiements du client, triée par date) parcourue par lots avec `.iterator()` ;
+- chaque page est émise dès qu'elle est pleine, par l'écrivain au fil de
+  l'eau d'erp_app.pdf_flux (le canvas de ReportLab garde toutes les pages
+  jusqu'à `save()`).
+
+La mise en page reprend celle des factures (erp_app.mise_en_page) : mêmes
+marges, polices standard en WinAnsi, texte en opérateurs directs, en-tête de
+tableau et pied de page en form XObjects posés sur chaque page. ReportLab
+fournit les métriques des polices pour aligner les montants à droite.
+"""
+
+import calendar
+from decimal import Decimal
+
+from django.db.models import CharField, DecimalField, F, IntegerField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from .mise_en_page import BAS, HAUTEUR, LARGEUR, MARGE, _chaine_pdf
+from .models import Facture, Paiement
+from .pdf_flux import EcrivainPdf
+
+TAILLE_LOT = 500
+FACTURE, PAIEMENT = 0, 1  # nature d'un mouvement ; le même jour, les factures d'abord
+ZERO = Decimal("0.00")
+
+# Colonnes : date, pièce, référence (alignées à gauche) ; débit, crédit, solde (à droite)
+COLONNES_TEXTE = (MARGE, 110, 230)
+COLONNES_MONTANTS = (390, 465, LARGEUR - MARGE)
+INTERLIGNE = 14
+POLICES = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Helvetica-Oblique"}
+
+
+# ---------------------------------------------------------------------------
+# Lecture
+# ---------------------------------------------------------------------------
+
+def periode_du_mois(jour):
+    """Premier et dernier jour du mois de `jour`."""
+    debut = jour.replace(day=1)
+    return debut, debut.replace(day=calendar.monthrange(debut.year, debut.month)[1])
+
+
+def solde_au(client_id, jour):
+    """Solde du client au début de `jour` : factures moins paiements antérieurs."""
+    zero = Value(ZERO, output_field=DecimalField(max_digits=12, decimal_places=2))
+    factures = Facture.objects.filter(commande__client_id=client_id, date_facture__lt=jour)
+    paiements = Paiement.objects.filter(facture__commande__client_id=client_id, date_paiement__lt=jour)
+    return (
+        factures.aggregate(total=Coalesce(Sum("montant_total"), zero))["total"]
+        - paiements.aggregate(total=Coalesce(Sum("montant"), zero))["total"]
+    )
+
+
+def mouvements(client_id, debut, fin, taille_lot=TAILLE_LOT):
+    """
+    (date, nature, pièce, facture, référence, montant) des factures et des
+    paiements du client entre `debut` et `fin` inclus, par date : une requête,
+    lue par lots.
+    """
+    colonnes = ("jour", "nature", "piece", "facture_no", "ref", "somme")
+    factures = Facture.objects.filter(
+        commande__client_id=client_id, date_facture__range=(debut, fin),
+    ).annotate(
+        jour=F("date_facture"),
+        nature=Value(FACTURE, output_field=IntegerField()),
+        piece=F("id"),
+        facture_no=F("id"),
+        ref=Value("", output_field=CharField()),
+        somme=F("montant_total"),
+    ).values_list(*colonnes)
+    paiements = Paiement.objects.filter(
+        facture__commande__client_id=client_id, date_paiement__range=(debut, fin),
+    ).annotate(
+        jour=F("date_paiement"),
+        nature=Value(PAIEMENT, output_field=IntegerField()),
+        piece=F("id"),
+        facture_no=F("facture_id"),
+        ref=F("reference_paiement"),
+        somme=F("montant"),
+    ).values_list(*colonnes)
+    union = factures.union(paiements, all=True).order_by("jour", "nature", "piece")
+    return union.iterator(chunk_size=taille_lot)
+
+
+# ---------------------------------------------------------------------------
+# Opérateurs de texte
+# ---------------------------------------------------------------------------
+
+def _litteral(texte):
+    chaine = _chaine_pdf(texte)
+    if chaine is None:  # caractères hors WinAnsi remplacés
+        chaine = _chaine_pdf(texte.encode("cp1252", "replace").decode("cp1252"))
+    return chaine
+
+
+def _texte(police, taille, x, y, texte):
+    return f"BT /{police} {taille} Tf 1 0 0 1 {x:.2f} {y:.2f} Tm ({_litteral(texte)}) Tj ET"
+
+
+def _a_droite(police, taille, x, y, texte):
+    return _texte(police, taille, x - stringWidth(texte, POLICES[police], taille), y, texte)
+
+
+# ---------------------------------------------------------------------------
+# Mise en page
+# ---------------------------------------------------------------------------
+
+def _forme_colonnes():
+    operations = [_texte("F2", 9, x, 0, titre) for x, titre in zip(COLONNES_TEXTE, ("Date", "Pièce", "Référence"))]
+    operations += [
+        _a_droite("F2", 9, x, 0, titre) for x, titre in zip(COLONNES_MONTANTS, ("Débit", "Crédit", "Solde"))
+    ]
+    operations.append(f"0.6 G 0.5 w {MARGE} -5 m {LARGEUR - MARGE:.2f} -5 l S")
+    return "\n".join(operations)
+
+
+def _forme_pied():
+    return "\n".join([
+        f"0.6 G 0.5 w {MARGE} 15 m {LARGEUR - MARGE:.2f} 15 l S",
+        _texte("F3", 8, MARGE, 0, "Relevé généré automatiquement par le système."),
+    ])
+
+
+# nom : (contenu, hauteur occupée)
+FORMULAIRES = {
+    "Colonnes": (_forme_colonnes(), 20),
+    "Pied": (_forme_pied(), 0),
+}
+
+
+def _montant(valeur):
+    return "" if valeur is None else f"{valeur:.2f}"
+
+
+class Releve:
+    """
+    Curseur vertical et sauts de page du relevé. Les octets produits
+    s'accumulent jusqu'à `vider` : au plus une page terminée à la fois.
+    """
+
+    def __init__(self, client, debut, fin):
+        self.client, self.debut, self.fin = client, debut, fin
+        self.pdf = EcrivainPdf(LARGEUR, HAUTEUR, POLICES)
+        self.sortie = [self.pdf.entete({nom: contenu for nom, (contenu, _) in FORMULAIRES.items()})]
+        self.operations = []
+        self.page = 0
+        self.y = HAUTEUR - MARGE
+
+    def vider(self):
+        contenu, self.sortie = b"".join(self.sortie), []
+        return contenu
+
+    def _poser(self, nom, y=None):
+        self.operations.append(f"q 1 0 0 1 0 {self.y if y is None else y:.2f} cm /{nom} Do Q")
+        if y is None:
+            self.y -= FORMULAIRES[nom][1]
+
+    def _ouvrir_page(self):
+        self._fermer_page()
+        self.page += 1
+        self.y = HAUTEUR - MARGE
+        if self.page > 1:
+            self.operations.append(_texte("F2", 10, MARGE, self.y, f"Relevé de compte - {self.client.nom} (suite)"))
+            self.y -= 25
+            self._poser("Colonnes")
+
+    def _fermer_page(self):
+        if not self.page:
+            return
+        self._poser("Pied", MARGE - 20)
+        self.operations.append(_a_droite(
+            "F1", 8, LARGEUR - MARGE, MARGE - 20, f"Relevé {self.client.nom} - page {self.page}",
+        ))
+        self.sortie.append(self.pdf.page("\n".join(self.operations)))
+        self.operations = []
+
+    def ligne(self, police, textes, montants):
+        """Une ligne du tableau : `textes` et `montants` dans l'ordre des colonnes."""
+        if self.y - INTERLIGNE < BAS:
+            self._ouvrir_page()
+        self.operations += [_texte(police, 9, x, self.y, t) for x, t in zip(COLONNES_TEXTE, textes) if t]
+        self.operations += [
+            _a_droite(police, 9, x, self.y, _montant(m)) for x, m in zip(COLONNES_MONTANTS, montants) if m is not None
+        ]
+        self.y -= INTERLIGNE
+
+    def commencer(self, solde):
+        self._ouvrir_page()
+        titre = "RELEVÉ DE COMPTE"
+        self.operations.append(_texte("F2", 18, (LARGEUR - stringWidth(titre, "Helvetica-Bold", 18)) / 2, self.y, titre))
+        self.y -= 35
+        for texte in (
+            f"Client : {self.client.nom}",
+            f"Période : du {self.debut:%d/%m/%Y} au {self.fin:%d/%m/%Y}",
+            f"Édité le : {timezone.localdate():%d/%m/%Y}",
+        ):
+            self.operations.append(_texte("F1", 11, MARGE, self.y, texte))
+            self.y -= 16
+        self.operations.append(_texte("F3", 9, MARGE, self.y, "Montants en DH"))
+        self.y -= 25
+        self._poser("Colonnes")
+        self.ligne("F2", (f"{self.debut:%d/%m/%Y}", "Solde initial", ""), (None, None, solde))
+
+    def terminer(self, debit, credit, solde):
+        self.y -= 6
+        self.ligne("F2", ("", "Total de la période", ""), (debit, credit, None))
+        self.ligne("F2", (f"{self.fin:%d/%m/%Y}", "Solde final", ""), (None, None, solde))
+        self._fermer_page()
+        self.sortie.append(self.pdf.fin())
+
+
+def flux_releve(client, debut, fin, taille_lot=TAILLE_LOT):
+    """Relevé PDF de `client` du `debut` au `fin` inclus, émis page par page."""
+    solde = solde_au(client.pk, debut)
+    releve = Releve(client, debut, fin)
+    releve.commencer(solde)
+    yield releve.vider()
+
+    debit = credit = ZERO
+    for jour, nature, piece, facture_id, reference, montant in mouvements(client.pk, debut, fin, taille_lot):
+        if nature == FACTURE:
+            solde += montant
+            debit += montant
+            releve.ligne("F1", (f"{jour:%d/%m/%Y}", f"Facture N°{piece}", reference), (montant, None, solde))
+        else:
+            solde -= montant
+            credit += montant
+            releve.ligne("F1", (f"{jour:%d/%m/%Y}", f"Paiement facture N°{facture_id}", reference), (None, montant, solde))
+        morceau = releve.vider()
+        if morceau:
+            yield morceau
+
+    releve.terminer(debit, credit, solde)
+    yield releve.vider()
@@ -0,0 +1,52 @@
+# erp_app/renderers.py
+"""
+Rendus en flux pour les exports : les objets arrivent par lots déjà sérialisés
+(voir pagination.ExportFluxMixin) et chaque lot est encodé puis émis aussitôt
+dans une StreamingHttpResponse. Seul le lot courant est en mémoire, quelle que
+soit la taille de l'export.
+
+`render` reste disponible pour les réponses ordinaires de la vue (erreurs de
+validation, par exemple), comme avec le JSONRenderer de DRF.
+"""
+
+from rest_framework.compat import SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+class JSONFluxRenderer(JSONRenderer):
+    """Tableau JSON émis lot par lot."""
+
+    def _encodeur(self):
+        return self.encoder_class(
+            ensure_ascii=self.ensure_ascii, allow_nan=not self.strict, separators=SHORT_SEPARATORS,
+        )
+
+    def _encoder(self, encodeur, objet):
+        # Mêmes échappements que JSONRenderer.render
+        return encodeur.encode(objet).replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+    def flux(self, lots):
+        encodeur = self._encodeur()
+        yield b"["
+        separateur = b""
+        for lot in lots:
+            if lot:
+                yield separateur + b",".join(self._encoder(encodeur, objet) for objet in lot)
+                separateur = b","
+        yield b"]"
+
+
+class NDJSONRenderer(JSONFluxRenderer):
+    """Un objet JSON par ligne (application/x-ndjson) : lisible ligne à ligne par le client."""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        contenu = super().render(data, accepted_media_type, renderer_context)
+        return contenu + b"\n" if contenu else contenu
+
+    def flux(self, lots):
+        encodeur = self._encodeur()
+        for lot in lots:
+            if lot:
+                yield b"".join(self._encoder(encodeur, objet) + b"\n" for objet in lot)
@@ -0,0 +1,50 @@
+# erp_app/sequences.py
+"""
+Références de paiement PAI-YYYYMMDD-NNNN attribuées depuis un compteur
+journalier (SequencePaiement) : un UPDATE `dernier = dernier + n` sur la ligne
+du jour, qui la verrouille jusqu'à la fin de la transaction. Deux requêtes
+concurrentes ne peuvent pas obtenir le même numéro, et le coût ne dépend pas
+du nombre de paiements déjà enregistrés.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.timezone import localdate
+
+from .models import SequencePaiement
+
+
+def format_reference(jour, numero):
+    return f"PAI-{jour:%Y%m%d}-{numero:04d}"
+
+
+def allouer_numeros(nombre=1, jour=None):
+    """
+    Réserve `nombre` numéros consécutifs pour `jour` (aujourd'hui par défaut)
+    et retourne le range correspondant. Un bloc (imports en masse) ne coûte
+    qu'un seul UPDATE, quelle que soit sa taille.
+    """
+    if nombre < 1:
+        return range(0)
+    jour = jour or localdate()
+    with transaction.atomic(savepoint=False):
+        n = SequencePaiement.objects.filter(jour=jour).update(dernier=F("dernier") + nombre)
+        if not n:
+            try:
+                with transaction.atomic():
+                    SequencePaiement.objects.create(jour=jour, dernier=nombre)
+            except IntegrityError:
+                # Ligne du jour créée entre-temps par une autre transaction
+                SequencePaiement.objects.filter(jour=jour).update(dernier=F("dernier") + nombre)
+        dernier = SequencePaiement.objects.filter(jour=jour).values_list("dernier", flat=True).get()
+    return range(dernier - nombre + 1, dernier + 1)
+
+
+def allouer_references(nombre=1, jour=None):
+    """Liste de `nombre` références PAI-YYYYMMDD-NNNN consécutives."""
+    jour = jour or localdate()
+    return [format_reference(jour, numero) for numero in allouer_numeros(nombre, jour)]
+
+
+def prochaine_reference(jour=None):
+    return allouer_references(1, jour)[0]
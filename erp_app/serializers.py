@@ -1,37 +1,127 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.reverse import reverse
 from .models import (
     Person, Produit, Achat, LigneAchat, Commande, LigneCommande, Facture,
-    Paiement, CompteBancaire, TransactionTresorerie, RelancePaiement
+    Paiement, CompteBancaire, TransactionTresorerie, RelancePaiement, MouvementStock,
+    Job,
 )
+from .services import creer_commande_en_masse
+from .stock import StockInsuffisant
 
 from datetime import date
-
-class PersonSerializer(serializers.ModelSerializer):
+from django.db import transaction
+
+
+# ---------------------------------------------------------------------------
+# Champs à la demande : ?fields= / ?expand=
+# ---------------------------------------------------------------------------
+
+class ChampsDynamiquesMixin:
+    """
+    En lecture, `?fields=id,date_commande` limite la représentation aux champs
+    cités, et `?expand=lignes` choisit parmi `champs_extensibles` (relations
+    embarquées) celles à inclure : `?expand=` seul n'en inclut aucune. Sans
+    ces paramètres la représentation est complète.
+
+    `relations` associe un champ aux jointures (chemin select_related) ou
+    préchargements (Prefetch) dont il a besoin : `optimiser_queryset` n'applique
+    que ceux des champs rendus. Seul le serializer racine lit la requête.
+    """
+    champs_extensibles = ()
+    relations = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        demandes, extensions = self.selection(self.context.get('request'))
+        if demandes is not None or extensions is not None:
+            for nom in list(self.fields):
+                if not self.champ_retenu(nom, demandes, extensions):
+                    self.fields.pop(nom)
+
+    @staticmethod
+    def selection(request):
+        """(fields, expand) de la requête, chacun à None s'il est absent."""
+        if request is None or request.method not in SAFE_METHODS:
+            return None, None
+
+        def noms(parametre):
+            valeur = request.query_params.get(parametre)
+            if valeur is None:
+                return None
+            return {nom.strip() for nom in valeur.split(',') if nom.strip()}
+
+        # ?fields= vide : représentation complète plutôt qu'un objet vide
+        return noms('fields') or None, noms('expand')
+
+    @classmethod
+    def champ_retenu(cls, nom, demandes, extensions):
+        if demandes is not None and nom not in demandes:
+            return False
+        return extensions is None or nom not in cls.champs_extensibles or nom in extensions
+
+    @classmethod
+    def optimiser_queryset(cls, queryset, request):
+        demandes, extensions = cls.selection(request)
+        jointures, prechargements = [], []
+        for nom, chemins in cls.relations.items():
+            if not cls.champ_retenu(nom, demandes, extensions):
+                continue
+            for chemin in chemins:
+                (prechargements if isinstance(chemin, Prefetch) else jointures).append(chemin)
+        if jointures:
+            queryset = queryset.select_related(*jointures)
+        if prechargements:
+            queryset = queryset.prefetch_related(*prechargements)
+        return queryset
+
+
+class PersonSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Person
         fields = '__all__'
+        # Clé unique : absente (null) plutôt que vide
+        extra_kwargs = {'cle_externe': {'allow_blank': False}}
 
 
-class ProduitSerializer(serializers.ModelSerializer):
+class ProduitSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = Produit
         fields = '__all__'
+        # Clé unique : absente (null) plutôt que vide
+        extra_kwargs = {'cle_externe': {'allow_blank': False}}
+
 
+class MouvementStockSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
+    class Meta:
+        model = MouvementStock
+        fields = ['id', 'produit', 'type', 'quantite', 'date_mouvement', 'ligne_commande', 'ligne_achat']
 
-class LigneAchatSerializer(serializers.ModelSerializer):
+
+class LigneAchatSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
         
     quantite = serializers.IntegerField()
     produit_nom = serializers.CharField(source='produit.nom', read_only=True)
 
+    champs_extensibles = ('produit_nom',)
+    relations = {'produit_nom': ['produit']}
+
     class Meta:
         model = LigneAchat
         fields = ['id', 'produit', 'produit_nom', 'quantite', 'prix_unitaire']
 
 
-class AchatSerializer(serializers.ModelSerializer):
+class AchatSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     fournisseur_nom = serializers.CharField(source='fournisseur.nom', read_only=True)
     lignes = LigneAchatSerializer(many=True, read_only=True)
 
+    champs_extensibles = ('fournisseur_nom', 'lignes')
+    relations = {
+        'fournisseur_nom': ['fournisseur'],
+        'lignes': [Prefetch('lignes', queryset=LigneAchat.objects.select_related('produit'))],
+    }
+
     class Meta:
         model = Achat
         fields = ['id', 'fournisseur', 'fournisseur_nom', 'date_achat', 'statut', 'lignes']
@@ -52,48 +142,107 @@ class AchatSerializer(serializers.ModelSerializer):
         return achat
 
 
-class LigneCommandeSerializer(serializers.ModelSerializer):
+class LigneCommandeSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     produit_nom = serializers.CharField(source='produit.nom', read_only=True)
 
+    champs_extensibles = ('produit_nom',)
+    relations = {'produit_nom': ['produit']}
+
     def validate(self, data):
+        # Contrôle indicatif (sans verrou) : la sortie conditionnelle de
+        # erp_app.stock fait foi au moment de l'enregistrement
         produit = data['produit']
         quantite = data['quantite']
         if produit.stock < quantite:
             raise serializers.ValidationError("Stock insuffisant pour ce produit.")
         return data
 
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except StockInsuffisant:
+            raise serializers.ValidationError("Stock insuffisant pour ce produit.")
+
     class Meta:
         model = LigneCommande
         fields = ['id', 'commande', 'produit', 'produit_nom', 'quantite', 'prix_unitaire']
 
 
 
-class CommandeSerializer(serializers.ModelSerializer):
+class CommandeSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     client_nom = serializers.CharField(source='client.nom', read_only=True)
     lignes = LigneCommandeSerializer(many=True, read_only=True, source='lignecommande_set')
 
+    champs_extensibles = ('client_nom', 'lignes')
+    relations = {
+        'client_nom': ['client'],
+        'lignes': [Prefetch('lignecommande_set', queryset=LigneCommande.objects.select_related('produit'))],
+    }
+
     class Meta:
         model = Commande
         fields = ['id', 'client', 'client_nom', 'date_commande', 'statut', 'lignes']
 
     def create(self, validated_data):
         lignes_data = self.context['request'].data.get('lignes', [])
-        commande = Commande.objects.create(
-            client=validated_data['client'],
-            statut=validated_data.get('statut', 'en attente'),
-            date_commande=validated_data.get('date_commande', date.today())
-        )
-        for ligne_data in lignes_data:
-            LigneCommande.objects.create(
-                commande=commande,
-                produit_id=ligne_data.get('produit'),
-                quantite=ligne_data.get('quantite'),
-                prix_unitaire=ligne_data.get('prix_unitaire')
+        # Tout ou rien : une ligne sans stock annule la commande entière
+        with transaction.atomic():
+            commande = Commande.objects.create(
+                client=validated_data['client'],
+                statut=validated_data.get('statut', 'en attente'),
+                date_commande=validated_data.get('date_commande', date.today())
             )
+            for index, ligne_data in enumerate(lignes_data):
+                try:
+                    LigneCommande.objects.create(
+                        commande=commande,
+                        produit_id=ligne_data.get('produit'),
+                        quantite=ligne_data.get('quantite'),
+                        prix_unitaire=ligne_data.get('prix_unitaire')
+                    )
+                except StockInsuffisant as e:
+                    raise serializers.ValidationError(
+                        {'lignes': [dict(echec, ligne=index) for echec in e.echecs]}
+                    )
         return commande
 
 
-class FactureSerializer(serializers.ModelSerializer):
+class LigneCommandeBulkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LigneCommande
+        fields = ['produit', 'quantite', 'prix_unitaire']
+
+
+class CommandeBulkSerializer(serializers.ModelSerializer):
+    """Création d'une commande avec toutes ses lignes en une seule transaction."""
+    lignes = LigneCommandeBulkSerializer(many=True)
+
+    class Meta:
+        model = Commande
+        fields = ['client', 'statut', 'lignes']
+
+    def validate_lignes(self, lignes):
+        # Contrôle du stock sur la quantité cumulée par produit
+        demandes = {}
+        for ligne in lignes:
+            produit = ligne['produit']
+            demandes[produit] = demandes.get(produit, 0) + ligne['quantite']
+        for produit, quantite in demandes.items():
+            if produit.stock < quantite:
+                raise serializers.ValidationError(
+                    f"Stock insuffisant pour le produit {produit.nom}."
+                )
+        return lignes
+
+    def create(self, validated_data):
+        try:
+            return creer_commande_en_masse(**validated_data)
+        except StockInsuffisant as e:
+            raise serializers.ValidationError({'lignes': e.echecs})
+
+
+class FactureSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     client_nom = serializers.SerializerMethodField()
     fournisseur_nom = serializers.SerializerMethodField()
     montant_paye = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
@@ -103,6 +252,13 @@ class FactureSerializer(serializers.ModelSerializer):
     client = serializers.SerializerMethodField()
     fournisseur = serializers.SerializerMethodField()
 
+    champs_extensibles = ('client_nom', 'fournisseur_nom')
+    relations = {
+        'client': ['commande'],
+        'fournisseur': ['achat'],
+        'client_nom': ['commande__client'],
+        'fournisseur_nom': ['achat__fournisseur'],
+    }
 
     class Meta:
         model = Facture
@@ -125,13 +281,13 @@ class FactureSerializer(serializers.ModelSerializer):
         return obj.statut
     
     def get_client(self, obj):
-        return obj.commande.client.id if obj.commande and obj.commande.client else None
+        return obj.commande.client_id if obj.commande else None
 
     def get_fournisseur(self, obj):
-        return obj.achat.fournisseur.id if obj.achat and obj.achat.fournisseur else None
+        return obj.achat.fournisseur_id if obj.achat else None
 
 
-class PaiementSerializer(serializers.ModelSerializer):
+class PaiementSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     paiement_complet    = serializers.BooleanField()
     date_echeance_solde = serializers.DateField(allow_null=True, required=False)
 
@@ -163,19 +319,44 @@ class PaiementSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class CompteBancaireSerializer(serializers.ModelSerializer):
+class ImportReleveSerializer(serializers.Serializer):
+    """Relevé bancaire à rapprocher (voir rapprochement.importer_releve)."""
+    fichier    = serializers.FileField()
+    compte     = serializers.PrimaryKeyRelatedField(queryset=CompteBancaire.objects.all(), required=False, allow_null=True)
+    simulation = serializers.BooleanField(default=False)
+
+
+class CompteBancaireSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = CompteBancaire
         fields = '__all__'
 
 
-class TransactionTresorerieSerializer(serializers.ModelSerializer):
+class TransactionTresorerieSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = TransactionTresorerie
         fields = '__all__'
 
 
-class RelancePaiementSerializer(serializers.ModelSerializer):
+class RelancePaiementSerializer(ChampsDynamiquesMixin, serializers.ModelSerializer):
     class Meta:
         model = RelancePaiement
         fields = ['id', 'facture', 'date_relance', 'statut', 'numero', 'note']
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """État d'une tâche de fond ; `url_resultat` est renseignée une fois le job terminé."""
+    url_resultat = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'type', 'parametres', 'statut', 'resultat', 'nom_fichier', 'erreur',
+            'cree_le', 'debut', 'fin', 'url_resultat',
+        ]
+        read_only_fields = fields
+
+    def get_url_resultat(self, job):
+        if job.statut != 'terminé':
+            return None
+        return reverse('job-resultat', args=[job.pk], request=self.context.get('request'))
@@ -0,0 +1,188 @@
+# erp_app/services.py
+
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, OuterRef, Subquery, When
+
+from .models import (
+    Commande, Facture, LigneAchat, LigneCommande, Paiement, TransactionTresorerie,
+)
+from .sequences import prochaine_reference
+from .signals import _montant_ligne
+from .tresorerie import mouvementer_compte
+from .stock import reserver
+from .unite_travail import (
+    MONTANT,
+    ajouter_delta_facture,
+    atomique,
+    champs_statut,
+    enregistrer_mouvement,
+    enregistrer_vente,
+    modifier_versions,
+    somme_correlee,
+)
+
+# ---------------------------------------------------------------------------
+# Commande en masse
+# ---------------------------------------------------------------------------
+
+def creer_commande_en_masse(client, lignes, statut="en attente"):
+    """
+    Crée une commande et toutes ses lignes en une transaction, sans passer par
+    les signaux ligne par ligne : stock, historique et facture sont appliqués
+    en lot avant le commit.
+
+    `lignes` : liste de dicts {produit, quantite, prix_unitaire}, `produit`
+    pouvant être une instance ou un id. Le résultat (stock, VenteHistorique,
+    Facture) est identique à une création ligne par ligne. Lève
+    `StockInsuffisant` (rien n'est créé) si une ligne ne peut être servie.
+    La commande est datée du jour (`date_commande` est `auto_now_add`).
+    """
+    with atomique():
+        # Sortie de stock tout-ou-rien avant toute écriture
+        reserver([(getattr(l["produit"], "pk", l["produit"]), l["quantite"]) for l in lignes])
+
+        commande = Commande.objects.create(client=client, statut=statut)
+
+        objets = LigneCommande.objects.bulk_create([
+            LigneCommande(
+                commande=commande,
+                produit_id=getattr(l["produit"], "pk", l["produit"]),
+                quantite=int(l["quantite"]),
+                prix_unitaire=l["prix_unitaire"],
+            )
+            for l in lignes
+        ])
+
+        # Journal de stock, historique et facture : cumulés par l'unité de
+        # travail et appliqués une seule fois au commit
+        mois_commande = commande.date_commande.replace(day=1)
+        for ligne in objets:
+            enregistrer_mouvement(ligne.produit_id, "sortie", -ligne.quantite, ligne_commande_id=ligne.pk)
+            enregistrer_vente(ligne.produit_id, mois_commande, ligne.quantite)
+            ajouter_delta_facture(
+                "commande", commande.pk,
+                _montant_ligne(ligne.quantite, ligne.prix_unitaire),
+                lier=ligne.pk,
+            )
+
+    return commande
+
+
+# ---------------------------------------------------------------------------
+# Comptabilisation des paiements
+# ---------------------------------------------------------------------------
+
+def comptabiliser_paiement(paiement):
+    """
+    Effets d'un nouveau paiement, dans la transaction de son insertion : une
+    ligne de trésorerie, le solde du compte (et son solde journalier) et le
+    montant payé / statut de la facture, mis à jour par F() sans relire ni le
+    compte ni les paiements. Une requête de plus si la facture n'est pas déjà
+    chargée sur le paiement.
+    """
+    if Paiement.facture.is_cached(paiement):
+        commande_id, achat_id = paiement.facture.commande_id, paiement.facture.achat_id
+    else:
+        commande_id, achat_id = Facture.objects.filter(pk=paiement.facture_id).values_list(
+            "commande_id", "achat_id"
+        ).get()
+    # Client qui paie -> argent entre ; paiement fournisseur -> argent sort
+    sens = "sortie" if achat_id and not commande_id else "entrée"
+
+    TransactionTresorerie.objects.create(
+        compte_id=paiement.compte_bancaire_id,
+        type=sens,
+        montant=paiement.montant,
+        description=f"Paiement pour facture #{paiement.facture_id}",
+        paiement=paiement,
+        facture_id=paiement.facture_id,
+    )
+
+    mouvementer_compte(
+        paiement.compte_bancaire_id, paiement.montant if sens == "entrée" else -paiement.montant
+    )
+
+    paye = F("montant_paye") + paiement.montant
+    echeance = None
+    if not paiement.paiement_complet and paiement.date_echeance_solde:
+        echeance = paiement.date_echeance_solde
+    Facture.objects.filter(pk=paiement.facture_id).update(
+        montant_paye=paye, **champs_statut(F("montant_total"), paye=paye, echeance=echeance)
+    )
+    modifier_versions(Facture, [paiement.facture_id])
+
+
+def enregistrer_paiement(facture, montant, reference_paiement="", **champs):
+    """
+    Enregistre et comptabilise un paiement en une transaction. Sans
+    `reference_paiement`, une référence PAI-YYYYMMDD-NNNN est attribuée.
+    """
+    with atomique():
+        return Paiement.objects.create(
+            facture=facture,
+            montant=montant,
+            reference_paiement=reference_paiement or prochaine_reference(),
+            **champs,
+        )
+
+
+# ---------------------------------------------------------------------------
+# Relances
+# ---------------------------------------------------------------------------
+
+def factures_a_relancer_le(jour):
+    """
+    Factures candidates à une relance le `jour` (pas encore relancées ce
+    jour-là). Le filtre `statut != payée` sert l'index partiel des factures
+    ouvertes.
+    """
+    return Facture.objects.exclude(statut="payée").filter(
+        montant_total__gt=0,
+        statut__in=["en attente", "en cours"],
+    ).exclude(
+        relances__date_relance__gte=jour
+    )
+
+
+# ---------------------------------------------------------------------------
+# Vérification des totaux de factures
+# ---------------------------------------------------------------------------
+
+def factures_recalculees(queryset=None):
+    """Annote chaque facture avec ses totaux recalculés depuis les lignes et paiements."""
+    montant_ligne = ExpressionWrapper(F("quantite") * F("prix_unitaire"), output_field=MONTANT)
+    queryset = Facture.objects.all() if queryset is None else queryset
+    return queryset.annotate(
+        total_commande=somme_correlee(LigneCommande.objects, "commande", "commande", montant_ligne),
+        total_achat=somme_correlee(LigneAchat.objects, "achat", "achat", montant_ligne),
+        paye_calcule=somme_correlee(Paiement.objects, "facture", "pk", F("montant")),
+    ).annotate(
+        total_calcule=Case(
+            When(commande__isnull=False, then=F("total_commande")),
+            When(achat__isnull=False, then=F("total_achat")),
+            default=F("montant_total"),
+            output_field=MONTANT,
+        ),
+    )
+
+
+def ecarts_factures(queryset=None):
+    """Factures dont le total ou le montant payé stocké diverge du recalcul complet."""
+    return factures_recalculees(queryset).exclude(
+        montant_total=F("total_calcule"), montant_paye=F("paye_calcule")
+    )
+
+
+def corriger_factures(ids):
+    """Réécrit totaux, montant payé et statut des factures `ids` depuis le recalcul complet."""
+    if not ids:
+        return 0
+    recalcul = factures_recalculees().filter(pk=OuterRef("pk"))
+    with transaction.atomic():
+        n = Facture.objects.filter(pk__in=ids).update(
+            montant_total=Subquery(recalcul.values("total_calcule")[:1]),
+            montant_paye=Subquery(recalcul.values("paye_calcule")[:1]),
+        )
+        Facture.objects.filter(pk__in=ids).update(**champs_statut(F("montant_total")))
+        modifier_versions(Facture, ids)
+    return n
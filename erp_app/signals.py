@@ -1,10 +1,9 @@
 # erp_app/signals.py
 
-from datetime import timedelta, date
-from django.db.models.signals import post_save, post_delete
+from datetime import date
+from decimal import Decimal
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Sum
-from django.utils import timezone
 
 from .models import (
     Commande,
@@ -13,30 +12,68 @@ from .models import (
     LigneCommande,
     LigneAchat,
     Paiement,
-    TransactionTresorerie,
-    VenteHistorique
+    Person,
+    Produit,
+    RelancePaiement,
+)
+from .cache_pdf import invalider_apres_commit
+from .stock import StockInsuffisant, decrementer
+from .unite_travail import (
+    ajouter_delta_facture,
+    ajuster_stock,
+    enregistrer_mouvement,
+    enregistrer_vente,
+    modifier_versions,
 )
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _refresh_facture_statut(facture: Facture):
-    """Recalcule statut / reste après modif montant_total ou paiements."""
-    total_paye = facture.paiement_set.aggregate(total=Sum("montant"))["total"] or 0
-    facture.montant_paye = total_paye
-    reste = facture.montant_total - total_paye
+def _montant_ligne(quantite, prix_unitaire):
+    return Decimal(str(prix_unitaire or 0)) * int(quantite or 0)
+
+
+def _appliquer_ligne_facture(sender, instance, parent, signal, created):
+    """
+    Maintient la facture d'une commande/d'un achat à partir de l'écart
+    ancien → nouveau montant de la ligne, sans relire les autres lignes.
+    Le calcul est confié à l'unité de travail.
+    """
+    parent_id = getattr(instance, f"{parent}_id")
+    montant = _montant_ligne(instance.quantite, instance.prix_unitaire)
+
+    if signal is post_delete:
+        # Les liaisons M2M sont supprimées en cascade avec la ligne
+        ajouter_delta_facture(parent, parent_id, -montant, delier=instance.pk)
+        return
 
-    if reste <= 0:
-        facture.statut = "payée"
-        facture.date_echeance_restant = None
-    else:
-        facture.statut = "partielle" if total_paye > 0 else "impayée"
-        # Respecte la date d’échéance si déjà fixée, sinon on propose +7 jours
-        if not facture.date_echeance_restant:
-            facture.date_echeance_restant = date.today() + timedelta(days=7)
+    initiale = getattr(instance, "_ligne_initiale", None)
+    if initiale and initiale[0] != parent_id:
+        # Ligne déplacée : on la retire de l'ancienne facture
+        through = Facture._meta.get_field(f"{parent}_lignes").remote_field.through
+        through.objects.filter(**{f"{sender._meta.model_name}_id": instance.pk}).delete()
+        ajouter_delta_facture(parent, initiale[0], -_montant_ligne(*initiale[1:]), delier=instance.pk)
+        created, initiale = True, None
 
-    facture.save(update_fields=["montant_paye", "statut", "date_echeance_restant"])
+    if created:
+        ajouter_delta_facture(parent, parent_id, montant, lier=instance.pk)
+    elif initiale:
+        ajouter_delta_facture(parent, parent_id, montant - _montant_ligne(*initiale[1:]))
+
+
+@receiver(pre_save, sender=LigneCommande)
+@receiver(pre_save, sender=LigneAchat)
+def memoriser_ligne_initiale(sender, instance, **kwargs):
+    """Mémorise (parent, quantité, prix) avant modification pour le calcul de l'écart."""
+    instance._ligne_initiale = None
+    if instance._state.adding or instance.pk is None:
+        return
+    parent = "commande_id" if sender is LigneCommande else "achat_id"
+    instance._ligne_initiale = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list(parent, "quantite", "prix_unitaire").first()
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -45,43 +82,20 @@ def _refresh_facture_statut(facture: Facture):
 
 @receiver(post_save, sender=Commande)
 def create_or_update_facture_commande(sender, instance, created, **kwargs):
-    # 1) Création → on ne fait ça qu'une seule fois
+    # Création seulement : ensuite, le total de la facture suit les lignes par
+    # écarts (voir _appliquer_ligne_facture) ; un recalcul complet n'est fait
+    # que par `manage.py verifier_factures --corriger`
     if created:
         Facture.objects.create(
             commande=instance,
             montant_total=0,
             statut='en attente'
         )
-        return
-
-    # 2) Mise à jour → on ne touche qu'à la facture déjà existante
-    try:
-        facture = Facture.objects.get(commande=instance)
-    except Facture.DoesNotExist:
-        return
-
-    # Recalcul du montant et du statut
-    lignes = LigneCommande.objects.filter(commande=instance)
-    total = sum((l.prix_unitaire or 0) * (l.quantite or 0) for l in lignes)
-    facture.montant_total = total
-    facture.commande_lignes.set(lignes)
-    facture.save(update_fields=["montant_total"])
-    _refresh_facture_statut(facture)
 
 
 @receiver([post_save, post_delete], sender=LigneCommande)
 def update_facture_on_lignecommande_change(sender, instance, **kwargs):
-    commande = instance.commande
-    try:
-        facture = Facture.objects.get(commande=commande)
-    except Facture.DoesNotExist:
-        return
-    lignes = LigneCommande.objects.filter(commande=commande)
-    total = sum((l.prix_unitaire or 0) * (l.quantite or 0) for l in lignes)
-    facture.montant_total = total
-    facture.commande_lignes.set(lignes)
-    facture.save(update_fields=["montant_total"])
-    _refresh_facture_statut(facture)
+    _appliquer_ligne_facture(sender, instance, "commande", kwargs["signal"], kwargs.get("created", False))
 
 @receiver(post_delete, sender=Commande)
 def delete_facture_commande(sender, instance, **kwargs):
@@ -94,39 +108,17 @@ def delete_facture_commande(sender, instance, **kwargs):
 
 @receiver(post_save, sender=Achat)
 def create_or_update_facture_achat(sender, instance, created, **kwargs):
+    # Création seulement, comme pour les commandes
     if created:
         Facture.objects.create(
             achat=instance,
             montant_total=0,
             statut='en attente'
         )
-        return
-
-    try:
-        facture = Facture.objects.get(achat=instance)
-    except Facture.DoesNotExist:
-        return
-
-    lignes = LigneAchat.objects.filter(achat=instance)
-    total = sum((l.prix_unitaire or 0) * (l.quantite or 0) for l in lignes)
-    facture.montant_total = total
-    facture.achat_lignes.set(lignes)
-    facture.save(update_fields=["montant_total"])
-    _refresh_facture_statut(facture)
 
 @receiver([post_save, post_delete], sender=LigneAchat)
 def update_facture_on_ligneachat_change(sender, instance, **kwargs):
-    achat = instance.achat
-    try:
-        facture = Facture.objects.get(achat=achat)
-    except Facture.DoesNotExist:
-        return
-    lignes = LigneAchat.objects.filter(achat=achat)
-    total = sum((l.prix_unitaire or 0) * (l.quantite or 0) for l in lignes)
-    facture.montant_total = total
-    facture.achat_lignes.set(lignes)
-    facture.save(update_fields=["montant_total"])
-    _refresh_facture_statut(facture)
+    _appliquer_ligne_facture(sender, instance, "achat", kwargs["signal"], kwargs.get("created", False))
 
 @receiver(post_delete, sender=Achat)
 def delete_facture_achat(sender, instance, **kwargs):
@@ -134,131 +126,95 @@ def delete_facture_achat(sender, instance, **kwargs):
 
 
 # ---------------------------------------------------------------------------
-# Paiement → Facture + Transaction + Liaison auto
+# Gestion de stock automatique
 # ---------------------------------------------------------------------------
 
-@receiver(post_save, sender=Paiement)
-def handle_paiement(sender, instance, created, **kwargs):
+@receiver(post_save, sender=LigneCommande)
+def diminuer_stock(sender, instance, created, **kwargs):
     if not created:
         return
-
-    # Lier automatiquement la facture si absente
-    if not instance.facture:
-        if instance.type_reference == 'commande':
-            facture = Facture.objects.filter(commande=instance.id_reference).first()
-        elif instance.type_reference == 'achat':
-            facture = Facture.objects.filter(achat=instance.id_reference).first()
-        else:
-            facture = None
-        if facture:
-            instance.facture = facture
-            instance.save(update_fields=["facture"])
-        else:
-            return  # Pas de facture trouvée, on arrête ici
-
-    facture = instance.facture
-
-    # Créer une transaction liée
-    type_transaction = "entrée" if facture.commande else "sortie" if facture.achat else "inconnu"
-
-    TransactionTresorerie.objects.create(
-        montant=instance.montant,
-        type=type_transaction,
-        date_transaction=instance.date_paiement,
-        description=f"Paiement pour Facture #{facture.id}"
+    # Sortie conditionnelle immédiate : jamais de stock négatif ni de mise à jour perdue
+    if not decrementer(instance.produit_id, int(instance.quantite)):
+        raise StockInsuffisant([{
+            "ligne": 0,
+            "produit": instance.produit_id,
+            "demande": int(instance.quantite),
+            "disponible": Produit.objects.filter(pk=instance.produit_id).values_list("stock", flat=True).first(),
+        }])
+    enregistrer_mouvement(
+        instance.produit_id, "sortie", -int(instance.quantite), ligne_commande_id=instance.pk
     )
 
-    # Recalculer le statut de la facture
-    _refresh_facture_statut(facture)
+@receiver(post_save, sender=LigneAchat)
+def augmenter_stock(sender, instance, created, **kwargs):
+    if created:
+        ajuster_stock(instance.produit_id, int(instance.quantite))
+        enregistrer_mouvement(
+            instance.produit_id, "entrée", int(instance.quantite), ligne_achat_id=instance.pk
+        )
 
 
-# ---------------------------------------------------------------------------
-# Gestion de stock automatique
-# ---------------------------------------------------------------------------
+@receiver(pre_save, sender=Produit)
+def memoriser_stock_initial(sender, instance, update_fields=None, **kwargs):
+    instance._stock_initial = None
+    if instance._state.adding or (update_fields is not None and "stock" not in update_fields):
+        return
+    instance._stock_initial = sender.objects.filter(pk=instance.pk).values_list("stock", flat=True).first()
 
-@receiver(post_save, sender=LigneCommande)
-def diminuer_stock(sender, instance, created, **kwargs):
-    if created:
-        produit = instance.produit
-        produit.stock -= int(instance.quantite)
-        produit.save()
 
-@receiver(post_save, sender=LigneAchat)
-def augmenter_stock(sender, instance, created, **kwargs):
+@receiver(post_save, sender=Produit)
+def journaliser_stock_produit(sender, instance, created, **kwargs):
+    """Stock saisi à la création ou modifié à la main → mouvement initial / ajustement."""
     if created:
-        produit = instance.produit
-        produit.stock += int(instance.quantite)
-        produit.save()
+        if instance.stock:
+            enregistrer_mouvement(instance.pk, "initial", int(instance.stock))
+        return
+    initial = getattr(instance, "_stock_initial", None)
+    if initial is not None and int(instance.stock) != initial:
+        enregistrer_mouvement(instance.pk, "ajustement", int(instance.stock) - initial)
+
+
+def _mois_ligne(ligne):
+    date_commande = ligne.commande.date_commande or date.today()
+    # ⚠️ Normalisation à 1er jour du mois
+    return date(date_commande.year, date_commande.month, 1)
 
 
 @receiver(post_save, sender=LigneCommande)
 def update_vente_historique(sender, instance, **kwargs):
-    produit = instance.produit
-    quantite = instance.quantite
-    date_commande = instance.commande.date_commande or date.today()
-
-    # ⚠️ Normalisation à 1er jour du mois
-    mois_commande = date(date_commande.year, date_commande.month, 1)
-
-    # 🔍 Historique existant pour ce produit
-    existing = VenteHistorique.objects.filter(produit=produit).order_by("mois")
-
-    if existing.count() == 1 and existing.first().mois == mois_commande:
-        # Injecter automatiquement un mois précédent si nécessaire
-        if mois_commande.month == 1:
-            mois_precedent = date(mois_commande.year - 1, 12, 1)
-        else:
-            mois_precedent = date(mois_commande.year, mois_commande.month - 1, 1)
-
-        # Répartition 50/50 (ou 60/40 si tu veux)
-        q1 = quantite // 2
-        q2 = quantite - q1
-
-        # Créer ou maj mois précédent
-        histo_prev, created_prev = VenteHistorique.objects.get_or_create(
-            produit=produit,
-            mois=mois_precedent,
-            defaults={'quantite': q1}
-        )
-        if not created_prev:
-            histo_prev.quantite += q1
-            histo_prev.save()
-
-        # Créer ou maj mois actuel
-        histo_current, created_current = VenteHistorique.objects.get_or_create(
-            produit=produit,
-            mois=mois_commande,
-            defaults={'quantite': q2}
-        )
-        if not created_current:
-            histo_current.quantite += q2
-            histo_current.save()
-
-    else:
-        # Comportement standard
-        histo, created = VenteHistorique.objects.get_or_create(
-            produit=produit,
-            mois=mois_commande,
-            defaults={'quantite': quantite}
-        )
-        if not created:
-            histo.quantite += quantite
-            histo.save()
+    # Répartition sur le mois précédent si besoin : voir unite_travail.repartition_vente
+    enregistrer_vente(instance.produit_id, _mois_ligne(instance), int(instance.quantite))
 
 
 @receiver(post_delete, sender=LigneCommande)
 def retirer_vente_historique(sender, instance, **kwargs):
-    produit = instance.produit
-    quantite = instance.quantite
-    date_commande = instance.commande.date_commande or date.today()
-    mois_commande = date(date_commande.year, date_commande.month, 1)
-
-    try:
-        historique = VenteHistorique.objects.get(produit=produit, mois=mois_commande)
-        historique.quantite -= quantite
-        if historique.quantite <= 0:
-            historique.delete()
-        else:
-            historique.save()
-    except VenteHistorique.DoesNotExist:
-        pass  # rien à faire si ça n'existe pas
+    enregistrer_vente(instance.produit_id, _mois_ligne(instance), -int(instance.quantite))
+
+
+# ---------------------------------------------------------------------------
+# Versions (ETag des listes et fiches, voir erp_app.versions)
+# ---------------------------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=Person)
+@receiver([post_save, post_delete], sender=Produit)
+@receiver([post_save, post_delete], sender=Commande)
+@receiver([post_save, post_delete], sender=LigneCommande)
+@receiver([post_save, post_delete], sender=Achat)
+@receiver([post_save, post_delete], sender=Facture)
+def changer_version(sender, instance, using, **kwargs):
+    modifier_versions(sender, [instance.pk], using=using)
+
+
+# ---------------------------------------------------------------------------
+# Cache des PDF de factures (voir erp_app.cache_pdf)
+# ---------------------------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=Paiement)
+@receiver([post_save, post_delete], sender=RelancePaiement)
+def invalider_pdf_facture(sender, instance, using, **kwargs):
+    invalider_apres_commit([instance.facture_id], using=using)
+
+
+@receiver(post_delete, sender=Facture)
+def supprimer_pdf_facture(sender, instance, using, **kwargs):
+    invalider_apres_commit([instance.pk], using=using)
@@ -0,0 +1,145 @@
+# erp_app/stock.py
+"""
+Moteur de stock : les sorties sont des UPDATE conditionnels atomiques
+(`stock = stock - q WHERE stock >= q`), sans lecture préalable du stock.
+Deux commandes concurrentes sur le même produit ne peuvent ni perdre une
+mise à jour ni passer le stock en négatif.
+
+Chaque variation est aussi journalisée dans MouvementStock ; des snapshots
+quotidiens (SnapshotStock) bornent le nombre de mouvements à relire pour
+connaître le stock à une date donnée.
+"""
+
+from collections import Counter
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import MouvementStock, Produit, SnapshotStock
+from .unite_travail import modifier_versions
+
+
+class StockInsuffisant(Exception):
+    """Sortie de stock refusée ; `echecs` détaille chaque ligne refusée."""
+
+    def __init__(self, echecs):
+        self.echecs = echecs
+        super().__init__(", ".join(
+            f"produit {e['produit']} : demandé {e['demande']}, disponible {e['disponible']}"
+            for e in echecs
+        ))
+
+
+class _Refus(Exception):
+    pass
+
+
+def decrementer(produit_id, quantite):
+    """Retire `quantite` du stock si elle est disponible. Retourne True si appliqué."""
+    if Produit.objects.filter(pk=produit_id, stock__gte=quantite).update(stock=F("stock") - quantite):
+        modifier_versions(Produit, [produit_id])
+        return True
+    return False
+
+
+def incrementer(produit_id, quantite):
+    Produit.objects.filter(pk=produit_id).update(stock=F("stock") + quantite)
+    modifier_versions(Produit, [produit_id])
+
+
+def reserver(lignes):
+    """
+    Sortie de stock tout-ou-rien pour une commande.
+
+    `lignes` : liste de (produit_id, quantité). Les quantités sont cumulées par
+    produit et décrémentées en un seul UPDATE conditionnel. Si un produit n'a
+    pas assez de stock, rien n'est retiré et `StockInsuffisant` est levée avec
+    les lignes concernées (index, produit, demandé, disponible).
+    """
+    lignes = list(lignes)
+    demandes = Counter()
+    for produit_id, quantite in lignes:
+        demandes[produit_id] += int(quantite)
+    if not demandes:
+        return
+
+    besoin = Case(
+        *[When(pk=produit_id, then=Value(q)) for produit_id, q in demandes.items()],
+        output_field=IntegerField(),
+    )
+    try:
+        with transaction.atomic():
+            n = Produit.objects.filter(pk__in=demandes.keys(), stock__gte=besoin).update(
+                stock=F("stock") - besoin
+            )
+            if n != len(demandes):
+                raise _Refus
+    except _Refus:
+        disponibles = dict(Produit.objects.filter(pk__in=demandes.keys()).values_list("pk", "stock"))
+        refuses = {pid for pid, q in demandes.items() if disponibles.get(pid, 0) < q} or set(demandes)
+        raise StockInsuffisant([
+            {
+                "ligne": index,
+                "produit": produit_id,
+                "demande": demandes[produit_id],
+                "disponible": disponibles.get(produit_id, 0),
+            }
+            for index, (produit_id, _) in enumerate(lignes)
+            if produit_id in refuses
+        ])
+    modifier_versions(Produit, demandes.keys())
+
+
+# ---------------------------------------------------------------------------
+# Journal des mouvements : stock à date
+# ---------------------------------------------------------------------------
+
+def stock_a_date(produit_id, jour):
+    """
+    Stock du produit en fin de journée `jour` : dernier snapshot antérieur
+    plus les mouvements postérieurs à ce snapshot (deux requêtes indexées).
+    """
+    snapshot = (
+        SnapshotStock.objects.filter(produit_id=produit_id, date__lte=jour)
+        .order_by("-date").values_list("date", "stock").first()
+    )
+    mouvements = MouvementStock.objects.filter(produit_id=produit_id, date_mouvement__lte=jour)
+    base = 0
+    if snapshot:
+        mouvements = mouvements.filter(date_mouvement__gt=snapshot[0])
+        base = snapshot[1]
+    return base + (mouvements.aggregate(total=Sum("quantite"))["total"] or 0)
+
+
+def produits_avec_stock_a_date(jour, queryset=None):
+    """Annote `stock_a_date` sur chaque produit, en une requête."""
+    queryset = Produit.objects.all() if queryset is None else queryset
+    snapshot = SnapshotStock.objects.filter(produit=OuterRef("pk"), date__lte=jour).order_by("-date")
+    mouvements = (
+        MouvementStock.objects.filter(
+            produit=OuterRef("pk"),
+            date_mouvement__lte=jour,
+            date_mouvement__gt=Coalesce(OuterRef("snapshot_date"), Value(date.min)),
+        )
+        .order_by().values("produit")
+        .annotate(total=Sum("quantite")).values("total")
+    )
+    return queryset.annotate(
+        snapshot_date=Subquery(snapshot.values("date")[:1]),
+        snapshot_stock=Subquery(snapshot.values("stock")[:1]),
+    ).annotate(
+        stock_a_date=Coalesce(F("snapshot_stock"), 0) + Coalesce(Subquery(mouvements), 0),
+    )
+
+
+def prendre_snapshots(jour):
+    """Enregistre (ou remplace) le stock de fin de journée de tous les produits pour `jour`."""
+    with transaction.atomic():
+        SnapshotStock.objects.filter(date=jour).delete()
+        snapshots = SnapshotStock.objects.bulk_create(
+            SnapshotStock(produit_id=pk, date=jour, stock=stock)
+            for pk, stock in produits_avec_stock_a_date(jour).values_list("pk", "stock_a_date").iterator()
+        )
+    return len(snapshots)
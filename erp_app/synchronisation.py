@@ -0,0 +1,245 @@
+# erp_app/synchronisation.py
+"""
+Synchronisation en masse du référentiel (produits, clients et fournisseurs)
+depuis un front externe : chaque élément est créé ou mis à jour selon son
+identifiant dans le système externe (`cle_externe`, unique par type pour les
+personnes). Les lignes saisies dans l'ERP, sans clé externe, ne sont jamais
+touchées ; deux produits de même nom ou deux personnes de même email restent
+deux lignes distinctes.
+
+Les lignes existantes sont lues par lots de clés, chaque élément est validé
+par le serializer de la ressource (partiellement s'il met à jour une ligne
+existante), puis les écritures sont faites par bulk_create / bulk_update, en
+ne réécrivant que les champs qui changent. Un élément invalide est rapporté
+avec son index, sans interrompre le lot.
+
+Les clés sont comparées sans espaces de bord, comme les écrit le serializer
+(`trim_whitespace`). Les validateurs d'unicité du serializer sont retirés
+ici : la correspondance par clé en tient lieu, sans une requête par élément,
+et la contrainte d'unicité reste le dernier garde-fou face à une
+synchronisation concurrente.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import IntegrityError
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+
+from .models import Person, Produit
+from .serializers import PersonSerializer, ProduitSerializer
+from .unite_travail import atomique, enregistrer_mouvement, modifier_versions
+
+
+@dataclass
+class RapportSynchronisation:
+    crees: list = field(default_factory=list)      # ids
+    modifies: list = field(default_factory=list)   # ids
+    inchanges: int = 0
+    erreurs: list = field(default_factory=list)    # {"index": i, "erreurs": {...}}
+
+    def en_dict(self):
+        return {
+            "crees": len(self.crees),
+            "modifies": len(self.modifies),
+            "inchanges": self.inchanges,
+            "erreurs": self.erreurs,
+        }
+
+
+class Synchronisation:
+    modele = None
+    serializer_class = None
+    cles = ()
+    taille_lot = 1000
+    taille_lot_modification = 200
+    taille_groupe = 20  # objets aux valeurs identiques écrits par un seul UPDATE
+
+    @staticmethod
+    def normaliser(valeur):
+        return str(valeur).strip()
+
+    def cle(self, element):
+        return tuple(self.normaliser(element.get(nom) or "") for nom in self.cles)
+
+    def preparer(self, element):
+        """Élément tel qu'il sera validé et écrit."""
+        return element
+
+    @staticmethod
+    def sans_unicite(serializer):
+        """`serializer` sans ses validateurs d'unicité (un SELECT par élément, faux pour une mise à jour)."""
+        for champ in serializer.fields.values():
+            champ.validators = [v for v in champ.validators if not isinstance(v, UniqueValidator)]
+        serializer.validators = [v for v in serializer.validators if not isinstance(v, UniqueTogetherValidator)]
+        return serializer
+
+    def existants(self, cles):
+        """Lignes existantes par clé normalisée."""
+        trouves = {}
+        cles = list(cles)
+        for debut in range(0, len(cles), self.taille_lot):
+            lot = cles[debut:debut + self.taille_lot]
+            filtre = {f"{nom}__in": {cle[i] for cle in lot} for i, nom in enumerate(self.cles)}
+            for objet in self.modele.objects.filter(**filtre).order_by("pk"):
+                trouves.setdefault(self.cle({nom: getattr(objet, nom) for nom in self.cles}), objet)
+        return trouves
+
+    def preparer_modification(self, objet, donnees):
+        """Champs dont la valeur change, à écrire par bulk_update ; None si rien ne change."""
+        changes = {nom: valeur for nom, valeur in donnees.items() if getattr(objet, nom) != valeur}
+        return changes or None
+
+    def ecrire_modifications(self, a_modifier):
+        """
+        `a_modifier` : couples (objet, champs modifiés). Les objets recevant
+        exactement les mêmes valeurs (un prix commun, par exemple) sont écrits
+        par un UPDATE ... WHERE pk IN, les autres par bulk_update.
+        """
+        groupes = defaultdict(list)
+        for objet, changes in a_modifier:
+            groupes[tuple(sorted(changes.items()))].append(objet)
+
+        restants, champs = [], set()
+        for valeurs, objets in groupes.items():
+            if len(objets) < self.taille_groupe:
+                restants += objets
+                champs.update(nom for nom, _ in valeurs)
+                continue
+            ids = [objet.pk for objet in objets]
+            for debut in range(0, len(ids), self.taille_lot):
+                self.modele.objects.filter(pk__in=ids[debut:debut + self.taille_lot]).update(**dict(valeurs))
+        if restants:
+            # bulk_update écrit un CASE par champ : son coût croît avec la taille
+            # du lot, d'où des lots plus petits que pour l'insertion
+            self.modele.objects.bulk_update(restants, sorted(champs), batch_size=self.taille_lot_modification)
+
+    def apres_ecriture(self, crees):
+        pass
+
+    def executer(self, elements):
+        if not isinstance(elements, list):
+            raise ValidationError("Une liste d'éléments est attendue.")
+
+        rapport = RapportSynchronisation()
+        # Un serializer par mode, réutilisé pour chaque élément
+        complet = self.sans_unicite(self.serializer_class())
+        partiel = self.sans_unicite(self.serializer_class(partial=True))
+        elements = [self.preparer(e) if isinstance(e, dict) else e for e in elements]
+        existants = self.existants({self.cle(e) for e in elements if isinstance(e, dict)})
+
+        a_creer, a_modifier, vus = [], [], {}
+        for index, element in enumerate(elements):
+            if not isinstance(element, dict):
+                rapport.erreurs.append({"index": index, "erreurs": {"non_field_errors": ["Objet attendu."]}})
+                continue
+            cle = self.cle(element)
+            manquantes = [nom for nom, valeur in zip(self.cles, cle) if not valeur]
+            if manquantes:
+                rapport.erreurs.append({
+                    "index": index,
+                    "erreurs": {nom: ["Champ obligatoire pour la synchronisation."] for nom in manquantes},
+                })
+                continue
+            if cle in vus:
+                rapport.erreurs.append({
+                    "index": index,
+                    "erreurs": {"non_field_errors": [f"Clé déjà présente à l'élément {vus[cle]}."]},
+                })
+                continue
+            vus[cle] = index
+
+            objet = existants.get(cle)
+            try:
+                donnees = (complet if objet is None else partiel).run_validation(element)
+            except ValidationError as e:
+                rapport.erreurs.append({"index": index, "erreurs": e.detail})
+                continue
+
+            if objet is None:
+                a_creer.append(self.modele(**donnees))
+                continue
+            changes = self.preparer_modification(objet, donnees)
+            if changes is None:
+                rapport.inchanges += 1
+                continue
+            rapport.modifies.append(objet.pk)
+            if changes:
+                for nom, valeur in changes.items():
+                    setattr(objet, nom, valeur)
+                a_modifier.append((objet, changes))
+
+        try:
+            with atomique():
+                crees = self.modele.objects.bulk_create(a_creer, batch_size=self.taille_lot)
+                self.ecrire_modifications(a_modifier)
+                self.apres_ecriture(crees)
+                rapport.crees = [objet.pk for objet in crees]
+                # bulk_create / bulk_update n'émettent pas de signaux
+                modifier_versions(self.modele, rapport.crees + rapport.modifies)
+        except IntegrityError:
+            # Seule contrainte que la validation ne couvre pas : l'unicité de la
+            # clé, créée entre la lecture et l'écriture par une autre synchronisation
+            raise ValidationError("Une clé externe a été créée pendant la synchronisation : relancer le lot.")
+        return rapport
+
+
+class SynchronisationProduits(Synchronisation):
+    """
+    Clé : cle_externe. Le stock d'un produit existant n'est pas écrasé :
+    l'écart avec le stock lu est appliqué par F() et journalisé en ajustement,
+    pour ne pas perdre une sortie concurrente (voir erp_app.stock). Un écart
+    négatif qu'une sortie concurrente rendrait impossible annule le lot.
+    """
+    modele = Produit
+    serializer_class = ProduitSerializer
+    cles = ("cle_externe",)
+
+    def __init__(self):
+        self.ajustements = []
+
+    def preparer_modification(self, objet, donnees):
+        donnees = dict(donnees)
+        ecart = int(donnees.pop("stock", objet.stock)) - int(objet.stock)
+        if ecart:
+            self.ajustements.append((objet.pk, ecart))
+        changes = super().preparer_modification(objet, donnees)
+        return {} if changes is None and ecart else changes
+
+    def apres_ecriture(self, crees):
+        for produit in crees:
+            if produit.stock:
+                enregistrer_mouvement(produit.pk, "initial", int(produit.stock))
+        # Un UPDATE par écart distinct (souvent peu nombreux), par lots d'ids
+        par_ecart = defaultdict(list)
+        for produit_id, ecart in self.ajustements:
+            par_ecart[ecart].append(produit_id)
+            enregistrer_mouvement(produit_id, "ajustement", ecart)
+        insuffisants = []
+        for ecart, ids in par_ecart.items():
+            for debut in range(0, len(ids), self.taille_lot):
+                lot = ids[debut:debut + self.taille_lot]
+                # Le stock a pu baisser depuis la lecture : un produit que
+                # l'écart rendrait négatif n'est pas mis à jour
+                modifies = Produit.objects.filter(pk__in=lot, stock__gte=-ecart).update(stock=F("stock") + ecart)
+                if modifies < len(lot):
+                    insuffisants += Produit.objects.filter(pk__in=lot, stock__lt=-ecart).values_list("pk", flat=True)
+        if insuffisants:
+            raise ValidationError({
+                "stock": [f"Stock modifié pendant la synchronisation, l'ajustement le rendrait négatif "
+                          f"(produits {sorted(insuffisants)}) : relancer le lot."],
+            })
+
+
+class SynchronisationPersonnes(Synchronisation):
+    """Clé : type et cle_externe. Les emails sont écrits en minuscules."""
+    modele = Person
+    serializer_class = PersonSerializer
+    cles = ("type", "cle_externe")
+
+    def preparer(self, element):
+        if isinstance(element.get("email"), str):
+            element = {**element, "email": element["email"].strip().lower()}
+        return element
@@ -0,0 +1,95 @@
+# erp_app/tableau_de_bord.py
+"""
+Statistiques des commandes pour le tableau de bord des ventes.
+
+Trois requêtes groupées, quel que soit le volume : répartition par statut (le
+total en est la somme), chiffre d'affaires mensuel calculé sur les lignes
+(quantité × prix unitaire, commandes annulées exclues) et dernières commandes
+avec leur montant.
+
+Le résultat est gardé en cache sous les versions des commandes et des lignes
+(voir erp_app.versions) : une commande créée ou modifiée change la clé, et la
+durée de vie courte borne l'écart pour les écritures qui n'incrémentent pas
+ces versions (nom d'un client, par exemple).
+"""
+
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils.timezone import localdate
+
+from .models import Commande, LigneCommande
+from .versions import cle_version, lire_versions
+
+NB_MOIS = 12
+NB_RECENTES = 5
+DUREE_CACHE = 60
+
+_MONTANT_LIGNES = Sum(F("lignecommande__quantite") * F("lignecommande__prix_unitaire"))
+
+
+def _debut_periode(jour, nb_mois):
+    """Premier jour du mois, `nb_mois - 1` mois avant celui de `jour`."""
+    index = jour.year * 12 + jour.month - 1 - (nb_mois - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def calculer_statistiques(jour=None):
+    jour = jour or localdate()
+
+    par_statut = list(
+        Commande.objects.order_by("statut").values("statut").annotate(count=Count("id"))
+    )
+
+    mensuel = (
+        Commande.objects.filter(date_commande__gte=_debut_periode(jour, NB_MOIS))
+        .annotate(month=TruncMonth("date_commande"))
+        .values("month")
+        .annotate(
+            count=Count("id", distinct=True),
+            total_amount=Coalesce(
+                Sum(
+                    F("lignecommande__quantite") * F("lignecommande__prix_unitaire"),
+                    filter=~Q(statut="annulée"),
+                ),
+                Value(0),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+        .order_by("month")
+    )
+
+    recentes = (
+        Commande.objects.select_related("client")
+        .annotate(montant=_MONTANT_LIGNES)
+        .order_by("-date_commande", "-id")[:NB_RECENTES]
+    )
+
+    return {
+        "total": sum(ligne["count"] for ligne in par_statut),
+        "monthlyData": list(mensuel),
+        "statusStats": par_statut,
+        "recentOrders": [
+            {
+                "id": commande.id,
+                "date": commande.date_commande,
+                "statut": commande.statut,
+                "montant": commande.montant or 0,
+                "client": {"nom": commande.client.nom, "email": commande.client.email},
+            }
+            for commande in recentes
+        ],
+    }
+
+
+def statistiques_commandes():
+    """Statistiques du jour, lues dans le cache tant que les commandes n'ont pas changé."""
+    versions = lire_versions([cle_version(Commande), cle_version(LigneCommande)])
+    cle = "tableau_de_bord:commandes:%s:%s:%s" % (localdate().isoformat(), *versions)
+    resultat = cache.get(cle)
+    if resultat is None:
+        resultat = calculer_statistiques()
+        cache.set(cle, resultat, DUREE_CACHE)
+    return resultat
@@ -1,12 +1,49 @@
-from datetime import date
-from django.test import TestCase, override_settings
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import IntegrityError, connection, transaction
 from django.db.models import Sum, F
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from .models import Commande, Facture, Produit, LigneCommande, Person
+from .models import (
+    Achat, Commande, CompteBancaire, Facture, Job, LigneAchat, LigneCommande, MouvementStock, Paiement, Person,
+    Produit, RelancePaiement,
+    SequencePaiement, SnapshotStock, SoldeJournalier, TransactionTresorerie, VenteHistorique,
+)
 
+import io
+import json
 import os
+import re
+import shutil
+import tempfile
+import zipfile
+from unittest import skipUnless
+from unittest.mock import patch
+from pypdf import PdfReader
 from .utils import predire_risque_facture, categoriser_risque, MODEL_PATH
 from .serializers import PaiementSerializer
+from .sequences import allouer_references
+from .services import creer_commande_en_masse, ecarts_factures, enregistrer_paiement, factures_a_relancer_le
+from .stock import StockInsuffisant, incrementer, reserver, stock_a_date
+from .unite_travail import statistiques
+from .checks import verifier_cache_versions
+from .jobs import battre, executer as executer_job, fichier_resultat, purger, reprendre_interrompus, reserver as reserver_job
+from .cache_pdf import evincer
+from .pagination import CurseurPagination
+from .views import TransactionTresorerieViewSet
+from .mise_en_page import _chaine_pdf, configurer_reportlab, rendre_document
+from .pdf_factures import DonneesFacture, rendre_facture
+from .rapprochement import importer_releve, lire_releve
+from .pdf_flux import EcrivainPdf
+from .releve import mouvements, solde_au
+from .synchronisation import SynchronisationProduits
+from .tresorerie import historique_soldes, mouvementer_transaction, reconstruire_soldes
 
 TEST_DATABASES = {
     'default': {
@@ -45,6 +82,7 @@ class PaiementSerializerTest(TestCase):
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
 
 # Create your tests here.
@@ -68,6 +106,7 @@ class PersonAPITest(TestCase):
     """Tests for the Person API endpoints"""
 
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
 
     def test_create_and_filter_persons(self):
@@ -92,7 +131,7 @@ class PersonAPITest(TestCase):
 
         response = self.client.get(url + "?type=client")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(len(response.json()["results"]), 1)
 
 
 class RisqueClientTest(TestCase):
@@ -138,3 +177,1447 @@ class RisqueClientTest(TestCase):
         proba = predire_risque_facture(self.client_obj.id)
         self.assertIsNotNone(proba)
         self.assertTrue(0 <= proba <= 1)
+
+
+class CommandeEnMasseTest(TestCase):
+    """Bulk order creation must match the line-by-line signal path"""
+
+    def setUp(self):
+        self.client_obj = Person.objects.create(
+            type='client', nom='Client Bulk', email='bulk@b.com', telephone='123'
+        )
+
+    def _produits(self):
+        n = Produit.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            return [
+                Produit.objects.create(nom=f"P{n + i}", prix_vente=10, prix_achat=5, stock=100)
+                for i in range(2)
+            ]
+
+    def _etat(self, commande, produits):
+        facture = Facture.objects.get(commande=commande)
+        ventes = [
+            list(VenteHistorique.objects.filter(produit=p).order_by('mois').values_list('mois', 'quantite'))
+            for p in produits
+        ]
+        stocks = [Produit.objects.get(pk=p.pk).stock for p in produits]
+        return (
+            facture.montant_total, facture.statut, facture.date_echeance_restant,
+            facture.commande_lignes.count(), ventes, stocks,
+        )
+
+    def test_bulk_identique_au_chemin_signal(self):
+        a, b = self._produits()
+        commande = Commande.objects.create(client=self.client_obj)
+        for produit, quantite in ((a, 3), (b, 2), (a, 5)):
+            # Un commit par ligne : comportement du chemin signal hors transaction
+            with self.captureOnCommitCallbacks(execute=True):
+                LigneCommande.objects.create(commande=commande, produit=produit, quantite=quantite, prix_unitaire="12.50")
+        attendu = self._etat(commande, [a, b])
+
+        a2, b2 = self._produits()
+        with self.captureOnCommitCallbacks(execute=True):
+            commande2 = creer_commande_en_masse(self.client_obj, [
+                {'produit': produit, 'quantite': quantite, 'prix_unitaire': "12.50"}
+                for produit, quantite in ((a2, 3), (b2, 2), (a2, 5))
+            ])
+        self.assertEqual(self._etat(commande2, [a2, b2]), attendu)
+        self.assertEqual(Commande.objects.get(pk=commande2.pk).date_commande, date.today())
+
+    def test_nombre_de_requetes_constant(self):
+        a, b = self._produits()
+
+        def compter(n):
+            lignes = [{'produit': (a, b)[i % 2], 'quantite': 1, 'prix_unitaire': 10} for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                creer_commande_en_masse(self.client_obj, lignes)
+            return len(ctx.captured_queries)
+
+        # Deux passes pour que l'historique des ventes (mois + mois précédent) existe
+        compter(2)
+        compter(2)
+        self.assertEqual(compter(2), compter(40))
+
+    def test_endpoint_bulk(self):
+        a, _ = self._produits()
+        response = APIClient().post('/api/commandes/bulk/', {
+            'client': self.client_obj.pk,
+            'lignes': [{'produit': a.pk, 'quantite': 60, 'prix_unitaire': '10.00'}] * 2,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/commandes/bulk/', {
+                'client': self.client_obj.pk,
+                'lignes': [{'produit': a.pk, 'quantite': 4, 'prix_unitaire': '10.00'}] * 2,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()['lignes']), 2)
+        self.assertEqual(Produit.objects.get(pk=a.pk).stock, 92)
+        self.assertEqual(Facture.objects.get(commande_id=response.json()['id']).montant_total, 80)
+
+
+class FactureDeltaTest(TestCase):
+    """Invoice totals are maintained from line deltas and checked by the verifier"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        self.commande = Commande.objects.create(client=client)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produit = Produit.objects.create(nom="P", prix_vente=10, prix_achat=5, stock=1000)
+            self.lignes = [
+                LigneCommande.objects.create(commande=self.commande, produit=self.produit, quantite=2, prix_unitaire=10)
+                for _ in range(20)
+            ]
+
+    def facture(self):
+        return Facture.objects.get(commande=self.commande)
+
+    def test_creation_modification_suppression(self):
+        self.assertEqual(self.facture().montant_total, 400)
+        self.assertEqual(self.facture().commande_lignes.count(), 20)
+        self.assertEqual(self.facture().statut, 'impayée')
+
+        ligne = self.lignes[0]
+        ligne.quantite = 5
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            ligne.save(update_fields=['quantite'])
+        self.assertEqual(self.facture().montant_total, 430)
+        self.assertNotIn('"erp_app_facture_commande_lignes"', ' '.join(q['sql'] for q in ctx.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lignes[1].delete()
+        self.assertEqual(self.facture().montant_total, 410)
+        self.assertEqual(self.facture().commande_lignes.count(), 19)
+        self.assertFalse(ecarts_factures().exists())
+
+    def test_modification_commande_sans_recalcul(self):
+        self.commande.statut = 'livrée'
+        with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+            self.commande.save()
+        # Le changement de statut n'est qu'un UPDATE de la commande
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries], ['UPDATE'])
+        self.assertEqual(self.facture().montant_total, 400)
+
+    def test_verificateur_detecte_et_corrige(self):
+        Facture.objects.filter(commande=self.commande).update(montant_total=1)
+        self.assertEqual(list(ecarts_factures().values_list('id', flat=True)), [self.facture().pk])
+        out = StringIO()
+        call_command('verifier_factures', '--corriger', stdout=out)
+        self.assertIn(f"Facture #{self.facture().pk}", out.getvalue())
+        self.assertEqual(self.facture().montant_total, 400)
+        self.assertFalse(ecarts_factures().exists())
+
+
+class UniteDeTravailTest(TestCase):
+    """Recomputations are coalesced per transaction and dropped with rolled-back savepoints"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produit = Produit.objects.create(nom="P", prix_vente=10, prix_achat=5, stock=100)
+        self.commande = Commande.objects.create(client=client)
+
+    def test_un_seul_recalcul_par_transaction(self):
+        avant = statistiques()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for _ in range(10):
+                LigneCommande.objects.create(commande=self.commande, produit=self.produit, quantite=1, prix_unitaire=10)
+        self.assertEqual(len(callbacks), 1)
+
+        facture = Facture.objects.get(commande=self.commande)
+        self.assertEqual(facture.montant_total, 100)
+        self.assertEqual(facture.commande_lignes.count(), 10)
+        self.assertEqual(Produit.objects.get(pk=self.produit.pk).stock, 90)
+        self.assertGreater(statistiques()['economises'] - avant['economises'], 0)
+        self.assertEqual(APIClient().get('/api/unite-travail/').json(), statistiques())
+
+    def test_savepoint_annule(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            LigneCommande.objects.create(commande=self.commande, produit=self.produit, quantite=1, prix_unitaire=10)
+            try:
+                with transaction.atomic():
+                    LigneCommande.objects.create(commande=self.commande, produit=self.produit, quantite=5, prix_unitaire=10)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(Produit.objects.get(pk=self.produit.pk).stock, 99)
+        self.assertEqual(Facture.objects.get(commande=self.commande).montant_total, 10)
+
+    def ligne_api(self):
+        return APIClient().post('/api/lignecommandes/', {
+            'commande': self.commande.pk, 'produit': self.produit.pk, 'quantite': 2, 'prix_unitaire': '10.00',
+        }, format='json')
+
+    def test_api_appliquee_avant_commit(self):
+        # Aucun callback de commit exécuté : tout est déjà écrit dans la transaction
+        response = self.ligne_api()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Facture.objects.get(commande=self.commande).montant_total, 20)
+        self.assertEqual(VenteHistorique.objects.get(produit=self.produit).quantite, 2)
+
+    def test_echec_annule_la_requete(self):
+        with patch('erp_app.unite_travail.enregistrer_ventes', side_effect=RuntimeError("panne")):
+            with self.assertRaises(RuntimeError):
+                self.ligne_api()
+        self.assertFalse(LigneCommande.objects.exists())
+        self.assertFalse(Facture.objects.filter(commande=self.commande, montant_total__gt=0).exists())
+
+    def test_echec_apres_commit_journalise(self):
+        suivants = []
+        with patch('erp_app.unite_travail.enregistrer_ventes', side_effect=RuntimeError("panne")), \
+                self.assertLogs('erp_app.unite_travail', 'ERROR') as logs, \
+                self.captureOnCommitCallbacks(execute=True):
+            LigneCommande.objects.create(commande=self.commande, produit=self.produit, quantite=1, prix_unitaire=10)
+            transaction.on_commit(lambda: suivants.append(True))
+        self.assertIn('verifier_factures --corriger', logs.output[0])
+        self.assertEqual(suivants, [True])
+
+
+class StockTest(TestCase):
+    """Stock is decremented with conditional atomic updates"""
+
+    def setUp(self):
+        self.a = Produit.objects.create(nom="A", prix_vente=10, prix_achat=5, stock=5)
+        self.b = Produit.objects.create(nom="B", prix_vente=10, prix_achat=5, stock=5)
+
+    def stocks(self):
+        return list(Produit.objects.filter(pk__in=[self.a.pk, self.b.pk]).order_by('pk').values_list('stock', flat=True))
+
+    def test_reserver_tout_ou_rien(self):
+        reserver([(self.a.pk, 2), (self.b.pk, 1), (self.a.pk, 1)])
+        self.assertEqual(self.stocks(), [2, 4])
+
+        with self.assertRaises(StockInsuffisant) as ctx:
+            reserver([(self.b.pk, 1), (self.a.pk, 2), (self.a.pk, 1)])
+        self.assertEqual([e['ligne'] for e in ctx.exception.echecs], [1, 2])
+        self.assertEqual(ctx.exception.echecs[0]['disponible'], 2)
+        self.assertEqual(self.stocks(), [2, 4])
+
+    def test_commande_api_annulee_si_stock_insuffisant(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        response = APIClient().post('/api/commandes/', {
+            'client': client.pk,
+            'lignes': [
+                {'produit': self.a.pk, 'quantite': 3, 'prix_unitaire': '10.00'},
+                {'produit': self.a.pk, 'quantite': 3, 'prix_unitaire': '10.00'},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['lignes'][0]['ligne'], '1')
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(self.stocks(), [5, 5])
+
+
+class MouvementStockTest(TestCase):
+    """The stock ledger answers point-in-time queries from snapshots"""
+
+    def test_journal_et_stock_a_date(self):
+        jour = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            produit = Produit.objects.create(nom="P", prix_vente=10, prix_achat=5, stock=10)
+            fournisseur = Person.objects.create(type='fournisseur', nom='F', email='f@f.com', telephone='1')
+            client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+            achat = Achat.objects.create(fournisseur=fournisseur)
+            LigneAchat.objects.create(achat=achat, produit=produit, quantite=5, prix_unitaire=5)
+            creer_commande_en_masse(client, [{'produit': produit, 'quantite': 3, 'prix_unitaire': 10}])
+        self.assertEqual(
+            list(MouvementStock.objects.filter(produit=produit).order_by('id').values_list('type', 'quantite')),
+            [('initial', 10), ('entrée', 5), ('sortie', -3)],
+        )
+        self.assertEqual(Produit.objects.get(pk=produit.pk).stock, 12)
+        self.assertEqual(stock_a_date(produit.pk, jour), 12)
+
+        # Snapshot de la veille puis mouvements du jour
+        MouvementStock.objects.filter(produit=produit, type='initial').update(date_mouvement=jour - timedelta(days=2))
+        call_command('snapshot_stock', stdout=StringIO())
+        self.assertEqual(SnapshotStock.objects.get(produit=produit).stock, 10)
+        self.assertEqual(stock_a_date(produit.pk, jour - timedelta(days=3)), 0)
+        self.assertEqual(stock_a_date(produit.pk, jour), 12)
+
+        response = APIClient().get(f'/api/produits/{produit.pk}/stock-a-date/?date={jour - timedelta(days=1)}')
+        self.assertEqual(response.json()['stock'], 10)
+
+        # Journal paginé par curseur, dans l'ordre des dates
+        page = APIClient().get(f'/api/produits/{produit.pk}/mouvements/?page_size=2').json()
+        self.assertEqual([m['type'] for m in page['results']], ['initial', 'entrée'])
+        suite = APIClient().get(page['next']).json()
+        self.assertEqual(([m['type'] for m in suite['results']], suite['next']), (['sortie'], None))
+        tout = APIClient().get(f'/api/produits/{produit.pk}/mouvements/?page_size=all&from={jour}')
+        self.assertEqual([m['type'] for m in json.loads(b''.join(tout.streaming_content))], ['entrée', 'sortie'])
+
+
+class SequencePaiementTest(TestCase):
+    """Payment references come from a per-day counter row"""
+
+    def test_allocation_unitaire_et_par_bloc(self):
+        jour = date(2025, 6, 6)
+        self.assertEqual(allouer_references(jour=jour), ['PAI-20250606-0001'])
+        self.assertEqual(
+            allouer_references(3, jour=jour),
+            ['PAI-20250606-0002', 'PAI-20250606-0003', 'PAI-20250606-0004'],
+        )
+        self.assertEqual(allouer_references(jour=date(2025, 6, 7)), ['PAI-20250607-0001'])
+        self.assertEqual(SequencePaiement.objects.get(jour=jour).dernier, 4)
+
+    def test_api_sans_comptage(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        commande = Commande.objects.create(client=client)
+        Facture.objects.filter(commande=commande).update(montant_total=100)
+        api = APIClient()
+        references = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as requetes:
+                response = api.post('/api/paiements/', {
+                    'type_reference': 'commande', 'id_reference': commande.pk,
+                    'montant': '10.00', 'paiement_complet': True,
+                }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+            references.append(response.json()['reference_paiement'])
+            self.assertFalse(any('COUNT(' in q['sql'] for q in requetes.captured_queries))
+        jour = date.today()
+        self.assertEqual(references, [f"PAI-{jour:%Y%m%d}-0001", f"PAI-{jour:%Y%m%d}-0002"])
+
+        # Une référence saisie en double est refusée
+        response = api.post('/api/paiements/', {
+            'type_reference': 'commande', 'id_reference': commande.pk,
+            'montant': '10.00', 'paiement_complet': True, 'reference_paiement': references[0],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SequencePaiementConcurrenceTest(TransactionTestCase):
+    """Concurrent allocations never hand out the same number (one connection per thread)"""
+
+    def test_allocations_concurrentes(self):
+        import threading
+        from django.db import connections
+
+        jour = date(2025, 6, 6)
+        resultats, verrou = [], threading.Lock()
+
+        def allouer(nombre):
+            try:
+                references = allouer_references(nombre, jour=jour)
+                with verrou:
+                    resultats.extend(references)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=allouer, args=(1 + i % 3,)) for i in range(30)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        attendu = sum(1 + i % 3 for i in range(30))
+        self.assertEqual(len(resultats), attendu)
+        self.assertEqual(len(set(resultats)), attendu)
+        self.assertEqual(SequencePaiement.objects.get(jour=jour).dernier, attendu)
+
+
+class ComptabilisationPaiementTest(TestCase):
+    """A payment is posted in one transaction with a fixed query budget"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        self.facture = Facture.objects.get(commande=Commande.objects.create(client=client))
+        Facture.objects.filter(pk=self.facture.pk).update(montant_total=100)
+        self.compte = CompteBancaire.objects.create(nom_banque='B', numero_compte='1', solde=10)
+        allouer_references()  # ligne de séquence du jour déjà créée
+
+    def test_budget_de_requetes(self):
+        echeance = date.today() + timedelta(days=30)
+        with self.assertNumQueries(10):
+            enregistrer_paiement(
+                self.facture, 40, compte_bancaire=self.compte,
+                paiement_complet=False, date_echeance_solde=echeance,
+            )
+        facture = Facture.objects.get(pk=self.facture.pk)
+        self.assertEqual((facture.montant_paye, facture.statut, facture.date_echeance_restant), (40, 'partielle', echeance))
+        self.assertEqual(CompteBancaire.objects.get(pk=self.compte.pk).solde, 50)
+        self.assertEqual(TransactionTresorerie.objects.get().compte_id, self.compte.pk)
+
+        enregistrer_paiement(self.facture, 60)
+        facture = Facture.objects.get(pk=self.facture.pk)
+        self.assertEqual((facture.montant_paye, facture.statut, facture.date_echeance_restant), (100, 'payée', None))
+        self.assertEqual(TransactionTresorerie.objects.count(), 2)
+
+    def test_paiement_fournisseur_debite_le_compte(self):
+        fournisseur = Person.objects.create(type='fournisseur', nom='F', email='f@f.com', telephone='2')
+        facture = Facture.objects.get(achat=Achat.objects.create(fournisseur=fournisseur))
+        Facture.objects.filter(pk=facture.pk).update(montant_total=30)
+        Paiement.objects.create(facture_id=facture.pk, montant=30, compte_bancaire=self.compte)
+        self.assertEqual(CompteBancaire.objects.get(pk=self.compte.pk).solde, -20)
+        self.assertEqual(TransactionTresorerie.objects.get().type, 'sortie')
+        self.assertEqual(Facture.objects.get(pk=facture.pk).statut, 'payée')
+
+
+class ImportPaiementsTest(TestCase):
+    """Bank statement lines are matched to open invoices and posted in bulk"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        fournisseur = Person.objects.create(type='fournisseur', nom='F', email='f@f.com', telephone='2')
+        self.f1, self.f2, self.f3, self.f4 = [
+            Facture.objects.get(commande=Commande.objects.create(client=client)) for _ in range(4)
+        ]
+        self.fa = Facture.objects.get(achat=Achat.objects.create(fournisseur=fournisseur))
+        for facture, total in ((self.f1, 100), (self.f2, 100), (self.f3, 50), (self.f4, 50), (self.fa, 70)):
+            Facture.objects.filter(pk=facture.pk).update(montant_total=total)
+        self.compte = CompteBancaire.objects.create(nom_banque='B', numero_compte='1')
+
+    def test_import_csv(self):
+        import tempfile
+
+        releve = (
+            "date;montant;libelle\n"
+            f"2025-06-02;40,00;VIR CLIENT FACTURE N°{self.f1.pk}\n"
+            "2025-06-02;100,00;VIR CLIENT\n"
+            "03/06/2025;50,00;VIR CLIENT\n"
+            "2025-06-03;-70,00;PRLV FOURNISSEUR\n"
+            "2025-06-04;12,34;FRAIS\n"
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write(releve)
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('import_paiements', f.name, compte=self.compte.pk, details=True, stdout=out)
+        self.assertIn("Rapprochées : 3 — ambiguës : 1 — non rapprochées : 1", out.getvalue())
+
+        statuts = dict(Facture.objects.values_list('pk', 'statut'))
+        self.assertEqual(
+            [statuts[f.pk] for f in (self.f1, self.f2, self.f3, self.fa)],
+            ['partielle', 'payée', 'en attente', 'payée'],
+        )
+        self.assertEqual(Facture.objects.get(pk=self.f1.pk).montant_paye, 40)
+        self.assertEqual(CompteBancaire.objects.get(pk=self.compte.pk).solde, 70)
+        self.assertEqual(TransactionTresorerie.objects.count(), 3)
+        self.assertEqual(len(set(Paiement.objects.values_list('reference_paiement', flat=True))), 3)
+
+    def test_dates_du_releve(self):
+        jour = date.today()
+        d1, d2 = jour - timedelta(days=10), jour - timedelta(days=5)
+        releve = (
+            "date;montant;libelle\n"
+            f"{d1:%Y-%m-%d};40,00;VIR CLIENT FACTURE N°{self.f1.pk}\n"
+            f"{d2:%Y-%m-%d};-70,00;PRLV FOURNISSEUR\n"
+        )
+        rapport = importer_releve(releve.encode(), compte=self.compte)
+        self.assertEqual(len(rapport.rapprochees), 2)
+        self.assertEqual(sorted(Paiement.objects.values_list('date_paiement', flat=True)), [d1, d2])
+        self.assertEqual(sorted(TransactionTresorerie.objects.values_list('date_transaction', flat=True)), [d1, d2])
+
+        historique = {h['date']: h['solde'] for h in historique_soldes(self.compte, d1 - timedelta(days=1), jour)}
+        self.assertEqual(
+            [historique[d] for d in (d1 - timedelta(days=1), d1, d2 - timedelta(days=1), d2, jour)],
+            [0, 40, 40, -30, -30],
+        )
+        soldes = list(SoldeJournalier.objects.order_by('date').values_list('date', 'variation', 'solde'))
+        reconstruire_soldes()
+        self.assertEqual(list(SoldeJournalier.objects.order_by('date').values_list('date', 'variation', 'solde')), soldes)
+
+    def test_api_ofx_simulation(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        ofx = (
+            "OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+            "<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20250602\n<TRNAMT>100.00\n<NAME>VIR CLIENT\n</STMTTRN>\n"
+            "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+        )
+        response = APIClient().post('/api/paiements/import/', {
+            'fichier': SimpleUploadedFile('releve.ofx', ofx.encode()),
+            'simulation': True,
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(response.json()['ambigues'], 1)
+        self.assertEqual(response.json()['details']['ambigues'][0]['factures'], [self.f1.pk, self.f2.pk])
+        self.assertFalse(Paiement.objects.exists())
+
+    def test_ofx_xml(self):
+        ofx = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<?OFX OFXHEADER="200" VERSION="220"?>\n'
+            '<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>'
+            '<STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20250602</DTPOSTED><TRNAMT>100.00</TRNAMT>'
+            '<NAME>VIR A&amp;B</NAME></STMTTRN>'
+            '<STMTTRN><TRNTYPE>DEBIT</TRNTYPE><DTPOSTED>20250603120000</DTPOSTED><TRNAMT>-5.50</TRNAMT>'
+            '<MEMO>FRAIS</MEMO></STMTTRN>'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+        lignes = list(lire_releve(ofx.encode()))
+        self.assertEqual(
+            [(l.numero, l.date, l.montant, l.libelle) for l in lignes],
+            [(3, date(2025, 6, 2), Decimal('100.00'), 'VIR A&B'), (3, date(2025, 6, 3), Decimal('-5.50'), 'FRAIS')],
+        )
+
+
+class SoldeJournalierTest(TestCase):
+    """Daily account balances are maintained as payments post"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        self.facture = Facture.objects.get(commande=Commande.objects.create(client=client))
+        Facture.objects.filter(pk=self.facture.pk).update(montant_total=1000)
+        self.compte = CompteBancaire.objects.create(nom_banque='B', numero_compte='1', solde=100)
+
+    def test_historique_et_reconstruction(self):
+        jour = date.today()
+        enregistrer_paiement(self.facture, 40, compte_bancaire=self.compte)
+        enregistrer_paiement(self.facture, 10, compte_bancaire=self.compte)
+        solde = SoldeJournalier.objects.get(compte=self.compte)
+        self.assertEqual((solde.date, solde.variation, solde.solde), (jour, 50, 150))
+
+        # Transactions de l'avant-veille : soldes journaliers reconstruits
+        TransactionTresorerie.objects.filter(compte=self.compte, montant=10).update(
+            date_transaction=jour - timedelta(days=2)
+        )
+        out = StringIO()
+        call_command('reconstruire_soldes', stdout=out)
+        self.assertIn("2 soldes journaliers", out.getvalue())
+
+        # Compte, solde d'ouverture, soldes de la période (+ savepoint de la requête)
+        with self.assertNumQueries(5):
+            response = APIClient().get(
+                f'/api/comptes-bancaires/{self.compte.pk}/historique/'
+                f'?from={jour - timedelta(days=3)}&to={jour}'
+            )
+        self.assertEqual(
+            [float(s['solde']) for s in response.json()['soldes']],
+            [100, 110, 110, 150],
+        )
+
+    def test_api_transactions_egal_reconstruction(self):
+        jour = date.today()
+        autre = CompteBancaire.objects.create(nom_banque='B', numero_compte='2', solde=0)
+        # Transaction antidatée, enregistrée par le même chemin que l'API
+        ancienne = TransactionTresorerie.objects.create(compte=self.compte, type='entrée', montant=30)
+        TransactionTresorerie.objects.filter(pk=ancienne.pk).update(date_transaction=jour - timedelta(days=3))
+        mouvementer_transaction(TransactionTresorerie.objects.get(pk=ancienne.pk))
+
+        api = APIClient()
+        url = '/api/transactions-tresorerie/'
+        creee = api.post(url, {'compte': self.compte.pk, 'type': 'sortie', 'montant': '20.00'}, format='json').json()
+        api.post(url, {'compte': self.compte.pk, 'type': 'entrée', 'montant': '5.00'}, format='json')
+        api.patch(f"{url}{ancienne.pk}/", {'montant': '50.00', 'type': 'sortie'}, format='json')
+        api.patch(f"{url}{creee['id']}/", {'compte': autre.pk}, format='json')
+        supprimee = api.post(url, {'compte': self.compte.pk, 'type': 'entrée', 'montant': '7.00'}, format='json').json()
+        api.delete(f"{url}{supprimee['id']}/")
+
+        def soldes():
+            return (
+                list(CompteBancaire.objects.order_by('pk').values_list('solde', flat=True)),
+                list(SoldeJournalier.objects.order_by('compte', 'date').values_list('compte', 'date', 'variation', 'solde')),
+            )
+
+        # 100 - 50 + 5 ; 0 - 20
+        incremental = soldes()
+        self.assertEqual(incremental[0], [55, -20])
+        reconstruire_soldes()
+        self.assertEqual(soldes(), incremental)
+
+
+class PlansRequetesTest(TestCase):
+    """Hot querysets must use an index, never a sequential scan, on a large dataset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        aujourd_hui = date.today()
+        clients = Person.objects.bulk_create(
+            Person(type='client', nom=f'C{i}', email=f'c{i}@c.com', telephone=str(i)) for i in range(2000)
+        )
+        Person.objects.bulk_create(
+            Person(type='fournisseur', nom=f'F{i}', email=f'f{i}@f.com', telephone=str(i)) for i in range(20)
+        )
+        commandes = Commande.objects.bulk_create(Commande(client=clients[i % 2000]) for i in range(4000))
+        # Comme en production : une facture sur dix reste ouverte
+        statuts = ['en attente', 'impayée'] + ['payée'] * 18
+        factures = Facture.objects.bulk_create(
+            Facture(
+                commande=c, montant_total=100, statut=statuts[i % 20],
+                date_echeance_restant=aujourd_hui + timedelta(days=i % 60 - 30) if i % 20 < 2 else None,
+            )
+            for i, c in enumerate(commandes)
+        )
+        paiements = Paiement.objects.bulk_create(
+            Paiement(facture=f, montant=10, reference_paiement=f"IMP-{i}") for i, f in enumerate(factures)
+        )
+        for i, p in enumerate(paiements):
+            p.date_paiement = aujourd_hui - timedelta(days=i % 365)
+        Paiement.objects.bulk_update(paiements, ['date_paiement'], batch_size=500)
+        RelancePaiement.objects.bulk_create(RelancePaiement(facture=f) for f in factures[::2])
+        produits = Produit.objects.bulk_create(
+            Produit(nom=f'P{i}', prix_vente=10, prix_achat=5, stock=0) for i in range(200)
+        )
+        VenteHistorique.objects.bulk_create(
+            VenteHistorique(produit=p, mois=date(2020 + m // 12, m % 12 + 1, 1), quantite=1)
+            for p in produits for m in range(24)
+        )
+        SequencePaiement.objects.bulk_create(
+            SequencePaiement(jour=aujourd_hui - timedelta(days=i), dernier=1) for i in range(1000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.client_id, cls.facture_id, cls.produit_id = clients[7].pk, factures[7].pk, produits[7].pk
+
+    def balayages(self, queryset):
+        """Tables lues en entier dans le plan d'exécution du queryset."""
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            return re.findall(r'Seq Scan on (\w+)', plan)
+        if connection.vendor == 'sqlite':
+            return re.findall(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)\s*$', plan, re.MULTILINE)
+        self.skipTest(f"Plans non analysés pour {connection.vendor}")
+
+    def test_requetes_frequentes_indexees(self):
+        aujourd_hui = date.today()
+        requetes = {
+            'relances': factures_a_relancer_le(aujourd_hui),
+            'relances du client': RelancePaiement.objects.filter(facture__commande__client_id=self.client_id),
+            'échéances dépassées': Facture.objects.filter(date_echeance_restant__lt=aujourd_hui),
+            'séquence paiement': SequencePaiement.objects.filter(jour=aujourd_hui),
+            'paiements du jour': Paiement.objects.filter(date_paiement=aujourd_hui),
+            'premier paiement': Paiement.objects.filter(facture_id=self.facture_id).order_by('date_paiement')[:1],
+            'historique ventes': VenteHistorique.objects.filter(produit_id=self.produit_id).order_by('mois'),
+            'vente du mois': VenteHistorique.objects.filter(produit_id=self.produit_id, mois=date(2021, 3, 1)),
+            'factures client': Facture.objects.filter(commande__client_id=self.client_id),
+            'fournisseurs': Person.objects.filter(type='fournisseur'),
+        }
+        for nom, queryset in requetes.items():
+            with self.subTest(nom):
+                self.assertEqual(self.balayages(queryset), [], queryset.explain())
+
+
+class RequetesListesTest(TestCase):
+    """List endpoints run a constant number of queries whatever the row count"""
+
+    ENDPOINTS = [
+        'persons', 'produits', 'achats', 'ligneachats', 'commandes', 'lignecommandes', 'factures',
+        'paiements', 'comptes-bancaires', 'transactions-tresorerie', 'relances-paiement',
+    ]
+
+    def ajouter_donnees(self, n):
+        debut = Produit.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(debut, debut + n):
+                client = Person.objects.create(type='client', nom=f'C{i}', email=f'c{i}@c.com', telephone='1')
+                fournisseur = Person.objects.create(type='fournisseur', nom=f'F{i}', email=f'f{i}@f.com', telephone='2')
+                produit = Produit.objects.create(nom=f'P{i}', prix_vente=10, prix_achat=5, stock=100)
+                achat = Achat.objects.create(fournisseur=fournisseur)
+                LigneAchat.objects.create(achat=achat, produit=produit, quantite=2, prix_unitaire=5)
+                commande = creer_commande_en_masse(client, [
+                    {'produit': produit, 'quantite': 1, 'prix_unitaire': 10},
+                    {'produit': produit, 'quantite': 2, 'prix_unitaire': 10},
+                ])
+                compte = CompteBancaire.objects.create(nom_banque='B', numero_compte=str(i))
+                facture = Facture.objects.get(commande=commande)
+                Paiement.objects.create(facture=facture, montant=5, compte_bancaire=compte)
+                RelancePaiement.objects.create(facture=facture)
+
+    def compter(self):
+        api = APIClient()
+        comptes = {}
+        for endpoint in self.ENDPOINTS:
+            with CaptureQueriesContext(connection) as requetes:
+                response = api.get(f'/api/{endpoint}/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            comptes[endpoint] = len(requetes)
+        return comptes
+
+    def test_nombre_de_requetes_constant(self):
+        cache.clear()
+        self.ajouter_donnees(1)
+        avant = self.compter()
+        self.ajouter_donnees(4)
+        self.assertEqual(self.compter(), avant)
+
+
+class PaginationCurseurTest(TestCase):
+    """Lists are paginated by keyset on (date, id), with a streaming export"""
+
+    def setUp(self):
+        fournisseur = Person.objects.create(type='fournisseur', nom='F', email='f@f.com', telephone='1')
+        achats = Achat.objects.bulk_create(Achat(fournisseur=fournisseur) for _ in range(7))
+        # Dates en partie identiques : l'id départage
+        for i, achat in enumerate(achats):
+            achat.date_achat = date(2025, 1, 1) + timedelta(days=i // 3)
+        Achat.objects.bulk_update(achats, ['date_achat'])
+        self.attendu = [a.pk for a in sorted(achats, key=lambda a: (a.date_achat, a.pk), reverse=True)]
+
+    @skipUnless(connection.vendor == 'sqlite', "compte les instructions de la machine virtuelle SQLite")
+    def test_page_profonde_cout_constant(self):
+        fournisseur = Person.objects.get(type='fournisseur')
+        achats = Achat.objects.bulk_create(Achat(fournisseur=fournisseur) for _ in range(600))
+        for i, achat in enumerate(achats):
+            achat.date_achat = date(2024, 1, 1) + timedelta(days=i // 3)
+        Achat.objects.bulk_update(achats, ['date_achat'])
+
+        def instructions(url):
+            # Instructions exécutées par SQLite : proportionnelles aux lignes parcourues
+            compteur = [0]
+
+            def compter():
+                compteur[0] += 1
+                return 0
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(compter, 1)
+            try:
+                self.assertEqual(APIClient().get(url).status_code, status.HTTP_200_OK)
+            finally:
+                connection.connection.set_progress_handler(None, 1)
+            return compteur[0]
+
+        premiere = instructions('/api/achats/?page_size=3&fields=id')
+        fin = Achat.objects.order_by('date_achat', 'id')[3]
+        curseur = CurseurPagination._encoder([fin.date_achat, fin.pk], False)
+        # Sans borne exploitable par l'index, les ~600 lignes précédant le
+        # curseur seraient lues puis écartées
+        self.assertLess(instructions(f'/api/achats/?page_size=3&fields=id&cursor={curseur}'), 3 * premiere)
+
+    def test_parcours_avant_arriere(self):
+        api = APIClient()
+        url, vus, pages = '/api/achats/?page_size=3', [], []
+        while url:
+            page = api.get(url).json()
+            pages.append(page)
+            vus += [a['id'] for a in page['results']]
+            url = page['next']
+        self.assertEqual(vus, self.attendu)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]['previous'])
+
+        precedente = api.get(pages[2]['previous']).json()
+        self.assertEqual([a['id'] for a in precedente['results']], self.attendu[3:6])
+        self.assertEqual(
+            [a['id'] for a in api.get(precedente['previous']).json()['results']], self.attendu[:3]
+        )
+
+    def test_export_en_flux(self):
+        response = APIClient().get('/api/achats/?page_size=all')
+        self.assertTrue(response.streaming)
+        contenu = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([a['id'] for a in contenu], self.attendu)
+
+    def test_curseur_invalide(self):
+        self.assertEqual(APIClient().get('/api/achats/?cursor=xyz').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FiltresListesTest(TestCase):
+    """Invoice, payment and treasury lists are filtered server-side"""
+
+    def setUp(self):
+        hier = date.today() - timedelta(days=1)
+        self.c1 = Person.objects.create(type='client', nom='Alpha', email='a@a.com', telephone='1')
+        c2 = Person.objects.create(type='client', nom='Beta', email='b@b.com', telephone='2')
+        self.factures = []
+        for i, (client, statut, total, echeance) in enumerate([
+            (self.c1, 'impayée', 100, hier),
+            (self.c1, 'payée', 250, None),
+            (c2, 'partielle', 80, date.today() + timedelta(days=5)),
+            (c2, 'impayée', 40, hier),
+        ]):
+            facture = Facture.objects.get(commande=Commande.objects.create(client=client))
+            Facture.objects.filter(pk=facture.pk).update(
+                statut=statut, montant_total=total, date_echeance_restant=echeance
+            )
+            self.factures.append(facture.pk)
+
+    def ids(self, url):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return sorted(f['id'] for f in response.json()['results'])
+
+    def test_filtres_factures(self):
+        f = self.factures
+        self.assertEqual(self.ids('/api/factures/?statut=impayée,partielle'), [f[0], f[2], f[3]])
+        self.assertEqual(self.ids(f'/api/factures/?client={self.c1.pk}'), [f[0], f[1]])
+        self.assertEqual(self.ids('/api/factures/?en_retard=true'), [f[0], f[3]])
+        self.assertEqual(self.ids('/api/factures/?montant_min=50&montant_max=150'), [f[0], f[2]])
+        self.assertEqual(self.ids('/api/factures/?search=beta'), [f[2], f[3]])
+
+    def test_tri_pagine(self):
+        api, url, montants = APIClient(), '/api/factures/?ordering=-montant_total&page_size=3', []
+        while url:
+            page = api.get(url).json()
+            montants += [f['montant_total'] for f in page['results']]
+            url = page['next']
+        self.assertEqual(montants, ['250.00', '100.00', '80.00', '40.00'])
+
+    def test_parametres_invalides(self):
+        api = APIClient()
+        self.assertEqual(api.get('/api/factures/?statut=inconnu').status_code, status.HTTP_400_BAD_REQUEST)
+        response = api.get('/api/factures/?date_min=2025-02-01&date_max=2025-01-01')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('date_min', response.json())
+        self.assertEqual(api.get('/api/paiements/?methode=carte').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ChampsDemandesTest(TestCase):
+    """?fields= / ?expand= shrink the payload and skip the related queries"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='Alpha', email='a@a.com', telephone='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            produit = Produit.objects.create(nom='P', prix_vente=10, prix_achat=5, stock=100)
+            creer_commande_en_masse(client, [{'produit': produit, 'quantite': 1, 'prix_unitaire': 10}])
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as requetes:
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        return response.json()['results'][0], [q['sql'] for q in requetes.captured_queries]
+
+    def test_champs_et_requetes(self):
+        complet, requetes_completes = self.get('/api/commandes/')
+        self.assertEqual(complet['client_nom'], 'Alpha')
+        self.assertEqual(len(complet['lignes']), 1)
+
+        etroit, requetes = self.get('/api/commandes/?fields=id,date_commande')
+        self.assertEqual(set(etroit), {'id', 'date_commande'})
+        self.assertEqual(len(requetes), len(requetes_completes) - 1)
+        self.assertFalse(any('JOIN' in sql for sql in requetes))
+
+        # Relations embarquées : seules celles citées dans ?expand=
+        sans_lignes, _ = self.get('/api/commandes/?expand=client_nom')
+        self.assertNotIn('lignes', sans_lignes)
+        self.assertEqual(sans_lignes['client_nom'], 'Alpha')
+
+    def test_facture_sans_jointure(self):
+        facture, requetes = self.get('/api/factures/?fields=id,montant_total&expand=')
+        self.assertEqual(set(facture), {'id', 'montant_total'})
+        self.assertFalse(any('JOIN' in sql for sql in requetes))
+        complete, _ = self.get('/api/factures/')
+        self.assertEqual(complete['client_nom'], 'Alpha')
+
+
+class EtagTest(TestCase):
+    """Up-to-date If-None-Match gets a 304 without querying; writes change the ETag"""
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p1 = Produit.objects.create(nom='P1', prix_vente=10, prix_achat=5, stock=10)
+            self.p2 = Produit.objects.create(nom='P2', prix_vente=10, prix_achat=5, stock=10)
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.api.get(url, **headers)
+        selects = [q for q in requetes.captured_queries if q['sql'].startswith('SELECT')]
+        return response, selects
+
+    def test_liste_et_fiche(self):
+        liste, fiche = '/api/produits/', f'/api/produits/{self.p1.pk}/'
+        response, _ = self.get(liste)
+        etag_liste = response['ETag']
+        etag_fiche = self.get(fiche)[0]['ETag']
+
+        response, selects = self.get(liste, etag_liste)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(selects, [])
+
+        # UPDATE du moteur de stock sur P2 : la liste change, pas la fiche de P1
+        with self.captureOnCommitCallbacks(execute=True):
+            incrementer(self.p2.pk, 5)
+        response, _ = self.get(liste, etag_liste)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag_liste)
+        self.assertEqual(self.get(fiche, etag_fiche)[0].status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_facture_suit_paiements_et_client(self):
+        client = Person.objects.create(type='client', nom='Alpha', email='a@a.com', telephone='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            commande = creer_commande_en_masse(client, [{'produit': self.p1, 'quantite': 2, 'prix_unitaire': 10}])
+        facture = Facture.objects.get(commande=commande)
+        url = f'/api/factures/{facture.pk}/'
+
+        etag = self.get(url)[0]['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            enregistrer_paiement(facture, 5, paiement_complet=False, date_echeance_solde=date.today())
+        response, _ = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            client.nom = 'Alpha SA'
+            client.save()
+        response, _ = self.get(url, etag)
+        self.assertEqual(response.json()['client_nom'], 'Alpha SA')
+
+
+    @override_settings(VERSIONS_CACHE_PARTAGE=None)
+    def test_desactive_sans_cache_partage(self):
+        # Cache mémoire local : chaque processus aurait ses propres versions
+        response, _ = self.get('/api/produits/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual([w.id for w in verifier_cache_versions(None)], ['erp_app.W001'])
+
+
+class CacheReponsesTest(TestCase):
+    """Product and person responses are served from the cache until a write touches them"""
+
+    def setUp(self):
+        cache.clear()
+        self.api = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p1 = Produit.objects.create(nom='P1', prix_vente=10, prix_achat=5, stock=10)
+            self.p2 = Produit.objects.create(nom='P2', prix_vente=10, prix_achat=5, stock=10)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), [q for q in requetes.captured_queries if q['sql'].startswith('SELECT')]
+
+    def test_lecture_et_invalidation(self):
+        liste, fiche = '/api/produits/', f'/api/produits/{self.p2.pk}/'
+        premiere, _ = self.get(liste)
+        self.get(fiche)
+        seconde, selects = self.get(liste)
+        self.assertEqual(seconde, premiere)
+        self.assertEqual(selects, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.patch(f'/api/produits/{self.p1.pk}/', {'nom': 'P1 bis'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        donnees, selects = self.get(liste)
+        self.assertEqual(donnees['results'][0]['nom'], 'P1 bis')
+        self.assertNotEqual(selects, [])
+        # La fiche d'un autre produit reste en cache
+        self.assertEqual(self.get(fiche)[1], [])
+
+        stats = self.api.get('/api/cache-reponses/').json()
+        self.assertEqual(stats['produit'], {'succes': 2, 'echecs': 3, 'taux_succes': 0.4})
+        # Ressources connues sans passer par le cache, même sans lecture
+        self.assertEqual(stats['person'], {'succes': 0, 'echecs': 0, 'taux_succes': None})
+
+
+    @override_settings(VERSIONS_CACHE_PARTAGE=None)
+    def test_desactive_sans_cache_partage(self):
+        self.get('/api/produits/')
+        self.assertNotEqual(self.get('/api/produits/')[1], [])
+
+
+class ExportFluxTest(TestCase):
+    """Invoice and treasury exports stream JSON or NDJSON, batch by batch"""
+
+    def setUp(self):
+        compte = CompteBancaire.objects.create(nom_banque='B', numero_compte='1')
+        TransactionTresorerie.objects.bulk_create(
+            TransactionTresorerie(compte=compte, type='entrée' if i % 3 else 'sortie', montant=i + 1, description=f'T{i}')
+            for i in range(7)
+        )
+
+    def test_ndjson_et_json(self):
+        api = APIClient()
+        with patch.object(TransactionTresorerieViewSet, 'taille_lot_export', 3):
+            response = api.get('/api/transactions-tresorerie/export/?format=ndjson&type=entrée')
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            morceaux = list(response.streaming_content)
+        lignes = [json.loads(l) for l in b''.join(morceaux).splitlines()]
+        self.assertEqual(len(lignes), 4)
+        self.assertEqual({l['type'] for l in lignes}, {'entrée'})
+        self.assertEqual(len(morceaux), 2)  # un morceau par lot
+
+        response = api.get('/api/transactions-tresorerie/export/', HTTP_ACCEPT='application/json')
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 7)
+        self.assertIn('transactions.json', response['Content-Disposition'])
+        self.assertEqual(api.get('/api/factures/export/?statut=inconnu').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SynchronisationTest(TestCase):
+    """Bulk endpoints upsert on the external key and report invalid items without aborting"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.existant = Produit.objects.create(nom='P1', prix_vente=10, prix_achat=5, stock=10, cle_externe='E1')
+        self.client_existant = Person.objects.create(
+            type='client', nom='Alpha', email='a@a.com', telephone='1', cle_externe='C1',
+        )
+
+    def test_upsert_produits(self):
+        elements = [
+            {'cle_externe': 'E1', 'prix_vente': '12.00', 'stock': 15},
+            {'cle_externe': 'E2', 'nom': 'P2', 'prix_vente': '8.00', 'prix_achat': '4.00', 'stock': 3},
+            {'cle_externe': 'E3', 'nom': 'P3', 'prix_vente': 'abc', 'prix_achat': '1.00'},
+            {'cle_externe': 'E2', 'nom': 'P2', 'prix_vente': '9.00', 'prix_achat': '4.00'},
+            {'nom': 'P4', 'prix_vente': '9.00', 'prix_achat': '4.00'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as requetes:
+            response = APIClient().post('/api/produits/bulk/', elements, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rapport = response.json()
+        self.assertEqual((rapport['crees'], rapport['modifies']), (1, 1))
+        self.assertEqual([e['index'] for e in rapport['erreurs']], [2, 3, 4])
+        self.assertIn('prix_vente', rapport['erreurs'][0]['erreurs'])
+        self.assertIn('cle_externe', rapport['erreurs'][2]['erreurs'])
+
+        p1 = Produit.objects.get(pk=self.existant.pk)
+        self.assertEqual((p1.prix_vente, p1.prix_achat, p1.stock), (12, 5, 15))
+        self.assertEqual(stock_a_date(p1.pk, date.today()), 15)
+        self.assertEqual(stock_a_date(Produit.objects.get(cle_externe='E2').pk, date.today()), 3)
+        self.assertLess(len(requetes), 20)
+
+    def test_upsert_personnes(self):
+        response = APIClient().post('/api/persons/bulk/', [
+            {'type': 'client', 'cle_externe': 'C1', 'email': 'a@a.com', 'nom': 'Alpha SA'},
+            {'type': 'fournisseur', 'cle_externe': 'C1', 'email': 'A@A.com', 'nom': 'Alpha Fournitures', 'telephone': '2'},
+            {'type': 'client', 'cle_externe': 'C2', 'email': 'pas-un-email', 'nom': 'X', 'telephone': '3'},
+        ], format='json')
+        rapport = response.json()
+        self.assertEqual((rapport['crees'], rapport['modifies']), (1, 1))
+        self.assertEqual(rapport['erreurs'][0]['index'], 2)
+        self.assertEqual(Person.objects.get(pk=self.client_existant.pk).nom, 'Alpha SA')
+        self.assertEqual(Person.objects.get(type='fournisseur').email, 'a@a.com')
+        rapport = APIClient().post('/api/persons/bulk/', [
+            {'type': 'client', 'cle_externe': 'C1', 'email': ' A@a.COM ', 'nom': 'Alpha SA'},
+        ], format='json').json()
+        self.assertEqual((rapport['modifies'], rapport['inchanges']), (0, 1))
+        self.assertEqual(APIClient().post('/api/persons/bulk/', {'type': 'client'}, format='json').status_code, 400)
+
+    def test_cle_externe(self):
+        rapport = APIClient().post('/api/produits/bulk/', [{'cle_externe': ' E1 ', 'prix_vente': '11.00'}], format='json').json()
+        self.assertEqual((rapport['crees'], rapport['modifies']), (0, 1))
+        self.assertEqual(list(Produit.objects.values_list('cle_externe', 'prix_vente')), [('E1', 11)])
+
+        # Les noms et emails ne sont pas des clés ; la clé externe est unique
+        reponse = APIClient().post('/api/produits/', {'nom': 'P1', 'prix_vente': '1.00', 'prix_achat': '1.00'}, format='json')
+        self.assertEqual(reponse.status_code, status.HTTP_201_CREATED)
+        Person.objects.create(type='client', nom='Bis', email='a@a.com', telephone='2')
+        reponse = APIClient().post('/api/produits/', {'nom': 'P5', 'prix_vente': '1.00', 'prix_achat': '1.00', 'cle_externe': 'E1'}, format='json')
+        self.assertEqual(reponse.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Person.objects.create(type='client', nom='Ter', email='t@t.com', telephone='3', cle_externe='C1')
+
+    def test_stock_negatif_concurrent(self):
+        synchronisation = SynchronisationProduits()
+        lecture = synchronisation.existants
+
+        def sortie_concurrente(cles):
+            # Une sortie de 8 unités entre la lecture et l'écriture
+            trouves = lecture(cles)
+            Produit.objects.filter(pk=self.existant.pk).update(stock=2)
+            return trouves
+
+        synchronisation.existants = sortie_concurrente
+        with self.assertRaises(ValidationError) as erreur:
+            synchronisation.executer([{'cle_externe': 'E1', 'stock': 5}])
+        self.assertIn('stock', erreur.exception.detail)
+        self.assertEqual(Produit.objects.get(pk=self.existant.pk).stock, 2)
+        self.assertFalse(MouvementStock.objects.filter(type='ajustement').exists())
+
+
+class StatistiquesCommandesTest(TestCase):
+    """Dashboard stats come from three grouped queries and are cached until an order changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.client_obj = Person.objects.create(type='client', nom='Alpha', email='a@a.com', telephone='1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produit = Produit.objects.create(nom='P', prix_vente=10, prix_achat=5, stock=100)
+            for statut, quantite in (('livrée', 2), ('livrée', 3), ('annulée', 4)):
+                commande = Commande.objects.create(client=self.client_obj, statut=statut)
+                LigneCommande.objects.create(commande=commande, produit=self.produit, quantite=quantite, prix_unitaire=10)
+            ancienne = Commande.objects.create(client=self.client_obj)
+        Commande.objects.filter(pk=ancienne.pk).update(date_commande=date.today() - timedelta(days=400))
+
+    def selects(self):
+        with CaptureQueriesContext(connection) as requetes:
+            stats = APIClient().get('/api/commandes/stats/').json()
+        return stats, [q for q in requetes.captured_queries if q['sql'].startswith('SELECT')]
+
+    def test_stats(self):
+        stats, selects = self.selects()
+        self.assertEqual(len(selects), 3)
+        self.assertEqual(stats['total'], 4)
+        self.assertEqual({s['statut']: s['count'] for s in stats['statusStats']}, {'livrée': 2, 'annulée': 1, 'en attente': 1})
+        mois, = stats['monthlyData']
+        self.assertEqual((mois['count'], float(mois['total_amount'])), (3, 50))
+        self.assertEqual(len(stats['recentOrders']), 4)
+        self.assertEqual(float(stats['recentOrders'][0]['montant']), 40)
+
+        self.assertEqual(self.selects()[1], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Commande.objects.create(client=self.client_obj)
+        self.assertEqual(self.selects()[0]['total'], 5)
+
+
+class BalanceAgeeTest(TestCase):
+    """Open client receivables are bucketed by days past due in one grouped query"""
+
+    def setUp(self):
+        jour = date.today()
+        alpha = Person.objects.create(type='client', nom='Alpha', email='a@a.com', telephone='1')
+        beta = Person.objects.create(type='client', nom='Beta', email='b@b.com', telephone='2')
+        for client, echeance, total, paye, statut in (
+            (alpha, jour + timedelta(days=5), 100, 0, 'impayée'),
+            (alpha, jour - timedelta(days=10), 200, 50, 'partielle'),
+            (alpha, jour - timedelta(days=45), 300, 0, 'impayée'),
+            (beta, jour - timedelta(days=75), 400, 0, 'impayée'),
+            (beta, jour - timedelta(days=120), 500, 0, 'impayée'),
+            (beta, jour - timedelta(days=120), 600, 600, 'payée'),
+        ):
+            Facture.objects.filter(commande=Commande.objects.create(client=client)).update(
+                montant_total=total, montant_paye=paye, statut=statut, date_echeance_restant=echeance,
+            )
+
+    def test_tranches(self):
+        with CaptureQueriesContext(connection) as requetes:
+            balance = APIClient().get('/api/factures/balance-agee/').json()
+        self.assertEqual(len([q for q in requetes.captured_queries if q['sql'].startswith('SELECT')]), 1)
+        alpha, beta = balance['clients']
+        self.assertEqual(
+            [float(alpha[t]) for t in ('a_echoir', '0_30', '31_60', '61_90', 'plus_90', 'total')],
+            [100, 150, 300, 0, 0, 550],
+        )
+        self.assertEqual((float(beta['61_90']), float(beta['plus_90'])), (400, 500))
+        self.assertEqual(float(balance['total']['total']), 1450)
+
+        sortie = StringIO()
+        call_command('balance_agee', stdout=sortie)
+        self.assertIn('1450.00', sortie.getvalue())
+
+    def test_date_arretee(self):
+        jour = date.today()
+        arrete = jour - timedelta(days=30)
+        gamma = Person.objects.create(type='client', nom='Gamma', email='g@g.com', telephone='3')
+        ancienne, recente = (Facture.objects.get(commande=Commande.objects.create(client=gamma)) for _ in range(2))
+        Facture.objects.filter(pk=ancienne.pk).update(montant_total=100, date_facture=jour - timedelta(days=40))
+        Facture.objects.filter(pk=recente.pk).update(montant_total=70, date_facture=jour - timedelta(days=10))
+        # Payée en partie avant l'arrêté, soldée après
+        enregistrer_paiement(Facture.objects.get(pk=ancienne.pk), 30)
+        enregistrer_paiement(Facture.objects.get(pk=ancienne.pk), 70)
+        Paiement.objects.filter(facture=ancienne, montant=30).update(date_paiement=jour - timedelta(days=35))
+        self.assertEqual(Facture.objects.get(pk=ancienne.pk).statut, 'payée')
+
+        with CaptureQueriesContext(connection) as requetes:
+            balance = APIClient().get(f'/api/factures/balance-agee/?date={arrete:%Y-%m-%d}').json()
+        self.assertEqual(len([q for q in requetes.captured_queries if q['sql'].startswith('SELECT')]), 1)
+        # Seule l'ancienne facture existait, avec 70 restant dus, échue depuis 10 jours
+        gamma_au, = balance['clients']
+        self.assertEqual((gamma_au['client_nom'], float(gamma_au['0_30']), float(gamma_au['total'])), ('Gamma', 70, 70))
+        # Aujourd'hui : l'ancienne est soldée, la récente reste due
+        gamma = next(l for l in APIClient().get('/api/factures/balance-agee/').json()['clients'] if l['client_nom'] == 'Gamma')
+        self.assertEqual(float(gamma['total']), 70)
+
+
+class FacturesPdfTest(TestCase):
+    """Invoice PDFs are rendered from prefetched data and zipped in a stream"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='Alpha', email='a@a.com', telephone='1')
+        self.client_id = client.pk
+        produit = Produit.objects.create(nom='P', prix_vente=10, prix_achat=5, stock=1000)
+        for _ in range(3):
+            commande = Commande.objects.create(client=client)
+            for quantite in (1, 2):
+                LigneCommande.objects.create(commande=commande, produit=produit, quantite=quantite, prix_unitaire=10)
+            RelancePaiement.objects.create(facture=Facture.objects.get(commande=commande), note='Rappel')
+
+    def test_zip(self):
+        with CaptureQueriesContext(connection) as requetes, patch('erp_app.pdf_factures.ProcessPoolExecutor') as pool:
+            response = APIClient().get('/api/factures/pdf-zip/')
+            contenu = b''.join(response.streaming_content)
+        # Rendu dans le processus de la requête, sans pool
+        pool.assert_not_called()
+        # Factures (+ tiers), lignes, paiements, relances
+        self.assertLessEqual(len([q for q in requetes.captured_queries if q['sql'].startswith('SELECT')]), 6)
+        archive = zipfile.ZipFile(io.BytesIO(contenu))
+        self.assertEqual(len(archive.namelist()), 3)
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+        pdf = APIClient().get(f'/api/factures/{Facture.objects.first().pk}/pdf/')
+        self.assertTrue(b''.join(pdf.streaming_content).startswith(b'%PDF'))
+
+    def test_commande(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'factures.zip')
+            call_command('generer_factures_pdf', chemin, '--processus', '2', '--client', str(self.client_id), stdout=StringIO())
+            self.assertEqual(len(zipfile.ZipFile(chemin).namelist()), 3)
+
+
+class CachePdfTest(TestCase):
+    """Invoice PDFs are cached on disk under a content fingerprint, with ETag and LRU eviction"""
+
+    def setUp(self):
+        cache.clear()
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+        client = Person.objects.create(type='client', nom='C', email='c@c.com', telephone='1')
+        self.facture = Facture.objects.get(commande=Commande.objects.create(client=client))
+        Facture.objects.filter(pk=self.facture.pk).update(montant_total=100)
+        self.url = f'/api/factures/{self.facture.pk}/pdf/'
+
+    def telecharger(self, **entetes):
+        response = APIClient().get(self.url, **entetes)
+        if response.status_code == status.HTTP_200_OK:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_cache_et_invalidation(self):
+        with self.settings(PDF_CACHE_DIR=self.dossier):
+            etag = self.telecharger()['ETag']
+            with patch('erp_app.cache_pdf.rendre_facture') as rendu:
+                self.assertEqual(self.telecharger()['ETag'], etag)
+                self.assertEqual(self.telecharger(HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(
+                    self.telecharger(HTTP_IF_NONE_MATCH=f'"x", W/{etag}').status_code, status.HTTP_304_NOT_MODIFIED,
+                )
+            rendu.assert_not_called()
+
+            # Une relance change le contenu : nouvelle empreinte, ancien fichier retiré
+            with self.captureOnCommitCallbacks(execute=True):
+                RelancePaiement.objects.create(facture=self.facture, note='Rappel')
+            fichiers = [f for _, _, noms in os.walk(self.dossier) for f in noms]
+            self.assertEqual(fichiers, [])
+            self.assertNotEqual(self.telecharger()['ETag'], etag)
+
+    def test_eviction(self):
+        with self.settings(PDF_CACHE_DIR=self.dossier, PDF_CACHE_TAILLE_MAX=0):
+            response = APIClient().get(self.url)
+            # Évincé aussitôt écrit, mais servi en entier
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        fichiers = [f for _, _, noms in os.walk(self.dossier) for f in noms]
+        self.assertEqual(fichiers, [])
+
+    def test_temporaires(self):
+        with self.settings(PDF_CACHE_DIR=self.dossier):
+            with patch('erp_app.cache_pdf.os.replace', side_effect=OSError("disque plein")):
+                self.assertEqual(self.telecharger().status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+            fichiers = [f for _, _, noms in os.walk(self.dossier) for f in noms]
+            self.assertEqual(fichiers, [])
+
+            # Temporaire d'un processus arrêté en pleine écriture, et un autre en cours
+            os.makedirs(os.path.join(self.dossier, 'ab'))
+            abandonne, en_cours = (os.path.join(self.dossier, 'ab', nom) for nom in ('x.tmp', 'y.tmp'))
+            for chemin in (abandonne, en_cours):
+                with open(chemin, 'wb') as fichier:
+                    fichier.write(b'%PDF')
+            os.utime(abandonne, (0, 0))
+            self.assertEqual(evincer(), 1)
+            self.assertEqual(os.listdir(os.path.join(self.dossier, 'ab')), ['y.tmp'])
+
+
+class MiseEnPageTest(TestCase):
+    """Repeated page elements are emitted once as form XObjects; text is escaped like ReportLab"""
+
+    def facture(self, n, nb_lignes):
+        return DonneesFacture(
+            id=n, tiers='Client', tiers_nom='Alpha', date_facture=date(2025, 1, 31), statut='impayée',
+            montant_total=Decimal('10.00'), montant_paye=Decimal('0.00'),
+            lignes=[('Café (spécial)', 1, Decimal('10.00'))] * nb_lignes,
+        )
+
+    def test_formes_reutilisees(self):
+        pdf = rendre_document([self.facture(1, 200), self.facture(2, 200)])
+        # Un seul objet par élément répété, quel que soit le nombre de pages
+        self.assertEqual(len(re.findall(rb'/Subtype /Form', pdf)), len(set(re.findall(rb'/FormXob\.\w+', pdf))))
+        self.assertGreater(pdf.count(b'/Type /Page\n'), 6)
+
+    def test_chaines(self):
+        self.assertEqual(_chaine_pdf('Café (x) \\'), 'Caf\\351 \\(x\\) \\\\')
+        self.assertIsNone(_chaine_pdf('Ωmega'))
+        self.assertTrue(rendre_facture(DonneesFacture(
+            id=3, tiers='', tiers_nom='', date_facture=date(2025, 1, 31), statut='payée',
+            montant_total=Decimal('0'), montant_paye=Decimal('0'), lignes=[('Ωmega', 1, Decimal('1'))],
+        )).startswith(b'%PDF'))
+
+    def test_ascii85_selon_reglage(self):
+        self.addCleanup(configurer_reportlab)
+        self.assertNotIn(b'/ASCII85Decode', rendre_facture(self.facture(1, 1)))
+        with self.settings(PDF_ASCII85=True):
+            configurer_reportlab()
+            self.assertIn(b'/ASCII85Decode', rendre_facture(self.facture(1, 1)))
+
+
+class JobsTest(TestCase):
+    """Heavy endpoints accept ?async=1, queue a job for the worker and expose its status and result"""
+
+    def setUp(self):
+        client = Person.objects.create(type='client', nom='J', email='j@j.com', telephone='1')
+        self.facture = Facture.objects.get(commande=Commande.objects.create(client=client))
+
+    def test_pdf_asynchrone(self):
+        response = APIClient().get(f'/api/factures/{self.facture.pk}/pdf/?async=1')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertEqual(response['Location'], response.json()['url'])
+
+        etat = APIClient().get(response['Location']).json()
+        self.assertEqual(etat['statut'], 'en attente')
+        self.assertIsNone(etat['url_resultat'])
+        self.assertEqual(APIClient().get(f'/api/jobs/{job.pk}/resultat/').status_code, status.HTTP_409_CONFLICT)
+
+        call_command('worker_jobs', '--une-fois', stdout=StringIO())
+        etat = APIClient().get(response['Location']).json()
+        self.assertEqual(etat['statut'], 'terminé')
+        resultat = APIClient().get(etat['url_resultat'])
+        self.assertEqual(resultat['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(resultat.streaming_content).startswith(b'%PDF'))
+
+    def test_export_et_echec(self):
+        reponse = APIClient().get(f'/api/factures/export/?async=1&format=ndjson&client={self.facture.commande.client_id}')
+        self.assertEqual(reponse.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(APIClient().get('/api/factures/export/?async=1&statut=inconnu').status_code, 400)
+        echec = Job.objects.create(type='inconnu')
+
+        with self.assertLogs('erp_app.jobs', 'ERROR'):
+            call_command('worker_jobs', '--une-fois', stdout=StringIO())
+        job = Job.objects.get(pk=reponse.json()['id'])
+        self.assertEqual(job.statut, 'terminé')
+        with open(job.fichier, 'rb') as fichier:
+            lignes = fichier.read().splitlines()
+        self.assertEqual([json.loads(ligne)['id'] for ligne in lignes], [self.facture.pk])
+        echec.refresh_from_db()
+        self.assertEqual(echec.statut, 'échoué')
+        self.assertIn('KeyError', echec.erreur)
+
+    def test_reprise_selon_battement(self):
+        ancien = timezone.now() - timedelta(hours=2)
+        vivant = Job.objects.create(type='export', statut='en cours', debut=ancien, battement=timezone.now())
+        abandonne = Job.objects.create(type='export', statut='en cours', debut=ancien, battement=ancien)
+        # Un job long d'un worker vivant reste à son worker
+        self.assertEqual(reprendre_interrompus(timedelta(minutes=5)), 1)
+        self.assertEqual(Job.objects.get(pk=vivant.pk).statut, 'en cours')
+        self.assertEqual(Job.objects.get(pk=abandonne.pk).statut, 'en attente')
+
+        job = reserver_job('hote:1')
+        self.assertEqual((job.pk, job.proprietaire), (abandonne.pk, 'hote:1'))
+        Job.objects.filter(pk=job.pk).update(battement=ancien)
+        self.assertEqual(battre('hote:1'), 1)
+        self.assertEqual(reprendre_interrompus(timedelta(minutes=5)), 0)
+
+    def test_resultat_abandonne_si_repris(self):
+        Job.objects.create(type='export', parametres={'format': 'json'})
+        job = reserver_job('hote:1')
+
+        def repris_pendant_execution(job):
+            # Battement manqué : le job est remis en attente puis pris par un autre worker
+            Job.objects.filter(pk=job.pk).update(battement=timezone.now() - timedelta(hours=1))
+            reprendre_interrompus(timedelta(minutes=5))
+            reserver_job('hote:2')
+            with fichier_resultat(job, 'export.json', 'application/json') as sortie:
+                sortie.write(b'[]')
+            return {'lignes': 0}
+
+        with patch.dict('erp_app.jobs.TACHES', {'export': repris_pendant_execution}), \
+                self.assertLogs('erp_app.jobs', 'WARNING'):
+            self.assertFalse(executer_job(job))
+        repris = Job.objects.get(pk=job.pk)
+        self.assertEqual((repris.statut, repris.proprietaire, repris.resultat, repris.fichier), ('en cours', 'hote:2', None, ''))
+        self.assertFalse(os.path.exists(job.fichier))
+
+    def test_purge_et_fichier_partiel(self):
+        job = Job.objects.create(type='export')
+        with self.assertRaises(ValueError), fichier_resultat(job, 'partiel.json', 'application/json') as sortie:
+            sortie.write(b'[')
+            raise ValueError
+        self.assertFalse(os.path.exists(os.path.join(settings.JOBS_DIR, str(job.pk), 'partiel.json')))
+        self.assertEqual(job.fichier, '')
+
+        with fichier_resultat(job, 'complet.json', 'application/json') as sortie:
+            sortie.write(b'[]')
+        recent = Job.objects.create(type='export', statut='terminé', fin=timezone.now())
+        Job.objects.filter(pk=job.pk).update(statut='terminé', fin=timezone.now() - timedelta(days=8))
+        self.assertEqual(purger(timedelta(days=7)), 1)
+        self.assertFalse(os.path.exists(os.path.join(settings.JOBS_DIR, str(job.pk))))
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [recent.pk])
+
+
+class EcrivainPdfTest(TestCase):
+    """The streaming PDF writer produces a file a strict reader accepts"""
+
+    def test_lecture(self):
+        pdf = EcrivainPdf(200, 100, {'F1': 'Helvetica'})
+        contenu = [pdf.entete({'Pied': 'BT /F1 8 Tf 1 0 0 1 10 0 Tm (Pied) Tj ET'})]
+        for numero in range(3):
+            contenu.append(pdf.page(f'BT /F1 12 Tf 1 0 0 1 10 50 Tm (Page {numero + 1} \\(\xe9t\xe9\\)) Tj ET\n'
+                                    'q 1 0 0 1 0 10 cm /Pied Do Q'))
+        contenu.append(pdf.fin())
+        fichier = b''.join(contenu)
+
+        # Table des références : chaque entrée pointe sur le début de son objet
+        # (un lecteur répare une table fausse sans erreur)
+        debut_table = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', fichier).group(1))
+        entrees = fichier[debut_table:].split(b'trailer')[0].splitlines()[3:]
+        for numero, entree in enumerate(entrees, start=1):
+            self.assertTrue(fichier[int(entree[:10]):].startswith(b'%d 0 obj' % numero))
+
+        lecteur = PdfReader(io.BytesIO(fichier), strict=True)
+        self.assertEqual(len(lecteur.pages), 3)
+        self.assertEqual([float(v) for v in lecteur.pages[0].mediabox], [0, 0, 200, 100])
+        for numero, page in enumerate(lecteur.pages, start=1):
+            self.assertIn(f'Page {numero} (été)', page.extract_text())
+            self.assertIn('Pied', page.extract_text())
+
+
+class ReleveCompteTest(TestCase):
+    """Client statements list invoices and payments by date with running balances, written page by page"""
+
+    def paiements(self, facture, paiements):
+        # date_paiement est posée à la création : corrigée ensuite
+        for montant, jour, reference in paiements:
+            Paiement.objects.create(facture=facture, montant=montant, reference_paiement=reference)
+            Paiement.objects.filter(reference_paiement=reference).update(date_paiement=jour)
+
+    def setUp(self):
+        self.client_releve = Person.objects.create(type='client', nom='Zeta', email='z@z.com', telephone='1')
+        autre = Person.objects.create(type='client', nom='Autre', email='o@o.com', telephone='2')
+        self.ancienne = self.facture(self.client_releve, date(2024, 12, 20), 100)
+        self.courante = self.facture(self.client_releve, date(2025, 1, 10), 200)
+        self.facture(autre, date(2025, 1, 12), 999)
+        self.paiements(self.ancienne, [(40, date(2024, 12, 28), 'R0'), (60, date(2025, 1, 15), 'R2')])
+        self.paiements(self.courante, [(50, date(2025, 1, 10), 'R1')])
+        self.url = f'/api/persons/{self.client_releve.pk}/releve/?mois=2025-01'
+
+    def facture(self, client, jour, montant):
+        facture = Facture.objects.get(commande=Commande.objects.create(client=client))
+        Facture.objects.filter(pk=facture.pk).update(date_facture=jour, montant_total=montant)
+        return facture
+
+    def telecharger(self, url):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Relu par un lecteur PDF strict : pages et texte de chaque page
+        return PdfReader(io.BytesIO(b''.join(response.streaming_content)), strict=True).pages
+
+    def test_mouvements_et_soldes(self):
+        self.assertEqual(solde_au(self.client_releve.pk, date(2025, 1, 1)), Decimal('60.00'))
+        with CaptureQueriesContext(connection) as requetes:
+            lignes = list(mouvements(self.client_releve.pk, date(2025, 1, 1), date(2025, 1, 31)))
+        self.assertEqual(len(requetes.captured_queries), 1)
+        self.assertEqual(
+            [(jour, nature, facture, reference, montant) for jour, nature, _, facture, reference, montant in lignes],
+            [
+                (date(2025, 1, 10), 0, self.courante.pk, '', Decimal('200.00')),
+                (date(2025, 1, 10), 1, self.courante.pk, 'R1', Decimal('50.00')),
+                (date(2025, 1, 15), 1, self.ancienne.pk, 'R2', Decimal('60.00')),
+            ],
+        )
+        page, = self.telecharger(self.url)
+        texte = page.extract_text()
+        for attendu in ('RELEVÉ DE COMPTE', 'Client : Zeta', 'Solde initial', f'Facture N°{self.courante.pk}',
+                        'R1', '260.00', 'Solde final', '150.00'):
+            self.assertIn(attendu, texte)
+
+    def test_pages_et_erreurs(self):
+        Paiement.objects.bulk_create([
+            Paiement(facture=self.courante, montant=1, reference_paiement=f'P{i}') for i in range(150)
+        ])
+        Paiement.objects.filter(reference_paiement__startswith='P').update(date_paiement=date(2025, 1, 20))
+        pages = self.telecharger(self.url)
+        self.assertGreaterEqual(len(pages), 3)
+        for numero, page in enumerate(pages, start=1):
+            # En-tête de colonnes et pied de page (form XObjects) sur chaque page
+            self.assertIn('Débit', page.extract_text())
+            self.assertIn(f'page {numero}', page.extract_text())
+        self.assertIn('Solde final', pages[-1].extract_text())
+
+        fournisseur = Person.objects.create(type='fournisseur', nom='F', email='f@f.com', telephone='3')
+        self.assertEqual(APIClient().get(f'/api/persons/{fournisseur.pk}/releve/').status_code, 404)
+        self.assertEqual(APIClient().get(f'/api/persons/{self.client_releve.pk}/releve/?mois=2025').status_code, 400)
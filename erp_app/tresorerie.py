@@ -0,0 +1,115 @@
+# erp_app/tresorerie.py
+"""
+Soldes des comptes bancaires : chaque mouvement met à jour `CompteBancaire.solde`
+et le solde de clôture du jour (SoldeJournalier), tous deux par F(). L'historique
+d'un compte se lit ensuite dans les soldes journaliers, sans parcourir les
+transactions de trésorerie.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Subquery, Sum
+from django.utils.timezone import localdate
+
+from .models import CompteBancaire, SoldeJournalier, TransactionTresorerie
+
+HISTORIQUE_MAX_JOURS = 3660
+SIGNES = {"entrée": 1, "sortie": -1}
+
+
+def mouvementer_compte(compte_id, montant, jour=None):
+    """
+    Applique un mouvement signé (`montant` > 0 : entrée) au solde du compte et
+    à son solde journalier. L'UPDATE du compte verrouille sa ligne : deux
+    mouvements concurrents sur le même compte sont sérialisés.
+    """
+    if not compte_id or not montant:
+        return
+    antidate = jour is not None and jour < localdate()
+    jour = jour or localdate()
+    with transaction.atomic(savepoint=False):
+        CompteBancaire.objects.filter(pk=compte_id).update(solde=F("solde") + montant)
+        soldes = SoldeJournalier.objects.filter(compte_id=compte_id)
+        if antidate:
+            # Les clôtures des jours suivants sont décalées aussi
+            soldes.filter(date__gt=jour).update(solde=F("solde") + montant)
+        if not soldes.filter(date=jour).update(solde=F("solde") + montant, variation=F("variation") + montant):
+            # Premier mouvement du jour : clôture = solde du compte moins les jours suivants
+            suivants = 0
+            if antidate:
+                suivants = soldes.filter(date__gt=jour).aggregate(total=Sum("variation"))["total"] or 0
+            SoldeJournalier.objects.create(
+                compte_id=compte_id,
+                date=jour,
+                variation=montant,
+                solde=Subquery(CompteBancaire.objects.filter(pk=compte_id).values("solde")[:1]) - suivants,
+            )
+
+
+def mouvementer_transaction(transaction_tresorerie, sens=1):
+    """
+    Mouvement d'une transaction de trésorerie sur son compte, à sa date :
+    `sens=1` à l'enregistrement, `sens=-1` pour l'annuler (modification,
+    suppression).
+    """
+    t = transaction_tresorerie
+    mouvementer_compte(t.compte_id, sens * SIGNES.get(t.type, 0) * t.montant, t.date_transaction)
+
+
+def historique_soldes(compte, debut, fin):
+    """
+    Solde de clôture de chaque jour de [debut, fin] : le dernier solde
+    journalier avant `debut`, puis les jours à mouvement de la période
+    reportés de jour en jour. Coût proportionnel au nombre de jours.
+    """
+    soldes = SoldeJournalier.objects.filter(compte=compte)
+    lignes = list(soldes.filter(date__range=(debut, fin)).order_by("date").values_list("date", "variation", "solde"))
+    precedent = soldes.filter(date__lt=debut).order_by("-date").values_list("solde", flat=True).first()
+
+    if precedent is not None:
+        solde = precedent
+    elif lignes:
+        solde = lignes[0][2] - lignes[0][1]
+    else:
+        suivant = soldes.filter(date__gt=fin).order_by("date").values_list("variation", "solde").first()
+        solde = suivant[1] - suivant[0] if suivant else compte.solde
+
+    par_jour = {jour: solde_jour for jour, _, solde_jour in lignes}
+    historique = []
+    jour = debut
+    while jour <= fin:
+        solde = par_jour.get(jour, solde)
+        historique.append({"date": jour, "solde": solde})
+        jour += timedelta(days=1)
+    return historique
+
+
+def reconstruire_soldes(comptes=None):
+    """
+    Recalcule les soldes journaliers depuis les transactions de trésorerie, en
+    remontant le temps à partir du solde actuel de chaque compte. Retourne le
+    nombre de soldes journaliers écrits.
+    """
+    comptes = CompteBancaire.objects.all() if comptes is None else comptes
+    variations = defaultdict(lambda: defaultdict(Decimal))
+    for compte_id, jour, type, total in (
+        TransactionTresorerie.objects.filter(compte__in=comptes)
+        .values_list("compte_id", "date_transaction", "type")
+        .annotate(total=Sum("montant")).order_by().iterator()
+    ):
+        variations[compte_id][jour] += SIGNES.get(type, 0) * total
+
+    a_creer = []
+    for compte_id, solde in comptes.values_list("pk", "solde"):
+        for jour in sorted(variations[compte_id], reverse=True):
+            variation = variations[compte_id][jour]
+            a_creer.append(SoldeJournalier(compte_id=compte_id, date=jour, variation=variation, solde=solde))
+            solde -= variation
+
+    with transaction.atomic():
+        SoldeJournalier.objects.filter(compte__in=comptes).delete()
+        SoldeJournalier.objects.bulk_create(a_creer, batch_size=1000)
+    return len(a_creer)
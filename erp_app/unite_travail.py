@@ -0,0 +1,452 @@
+# erp_app/unite_travail.py
+"""
+Unité de travail : regroupe les recalculs déclenchés par les signaux (total et
+statut des factures, stock et journal des mouvements, historique des ventes)
+et les exécute une seule fois, dédupliqués, en fin de transaction.
+
+Hors transaction, chaque demande est exécutée immédiatement. Dans un bloc
+`transaction.atomic()` (requêtes HTTP via ATOMIC_REQUESTS, commandes de gestion),
+les demandes sont cumulées par niveau de savepoint : un savepoint annulé
+emporte ses demandes avec lui.
+
+Les lots sont appliqués par `vider`, dans la transaction, juste avant le
+COMMIT : par `UniteTravailMixin` à la fin des vues DRF et par `atomique()`
+dans les services. Une erreur annule alors la transaction entière, lignes
+comprises. Un lot que personne n'a vidé (admin, shell) est appliqué après
+le COMMIT, en dernier recours : un échec y est journalisé, les totaux des
+factures se corrigent par `manage.py verifier_factures --corriger`. Les
+versions des objets modifiés (ETag, voir erp_app.versions) sont incrémentées
+après le COMMIT dans tous les cas.
+
+Les demandes reçues et les recalculs exécutés sont comptés dans le cache,
+partagés entre processus ; `statistiques()` les restitue avec le nombre de
+recalculs économisés, exposé sur /api/unite-travail/.
+"""
+
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Case, DateField, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import Facture, MouvementStock, Paiement, Produit, VenteHistorique
+from .versions import cles_versions, incrementer_versions
+
+logger = logging.getLogger(__name__)
+
+MONTANT = DecimalField(max_digits=12, decimal_places=2)
+
+_local = threading.local()
+
+COMPTEURS = ("demandes", "recalculs")
+
+
+def _compter(compteur, n):
+    """Compteurs dans le cache, partagés entre processus comme ceux d'erp_app.cache_reponses."""
+    if not n:
+        return
+    cle = f"unite_travail:{compteur}"
+    try:
+        cache.incr(cle, n)
+    except ValueError:
+        # Absente : créée à n, ou incrémentée si un autre processus vient de la créer
+        if not cache.add(cle, n, None):
+            cache.incr(cle, n)
+
+
+def statistiques():
+    """Demandes reçues, recalculs réellement exécutés et recalculs économisés."""
+    valeurs = cache.get_many([f"unite_travail:{c}" for c in COMPTEURS])
+    demandes, recalculs = (valeurs.get(f"unite_travail:{c}", 0) for c in COMPTEURS)
+    return {"demandes": demandes, "recalculs": recalculs, "economises": demandes - recalculs}
+
+
+# ---------------------------------------------------------------------------
+# Expressions partagées
+# ---------------------------------------------------------------------------
+
+def champs_statut(total, paye=None, echeance=None):
+    """
+    Expressions UPDATE du statut et de l'échéance restante d'une facture pour un
+    montant total donné (expression SQL), à partir du `montant_paye` stocké ou de
+    l'expression `paye`. `echeance` remplace la date d'échéance restante tant
+    que la facture n'est pas soldée.
+    """
+    paye = F("montant_paye") if paye is None else paye
+    soldee = GreaterThanOrEqual(paye, total)
+    if echeance is None:
+        echeance = Coalesce(F("date_echeance_restant"), Value(date.today() + timedelta(days=7)))
+    else:
+        echeance = Value(echeance)
+    return {
+        "statut": Case(
+            When(soldee, then=Value("payée")),
+            When(GreaterThan(paye, 0), then=Value("partielle")),
+            default=Value("impayée"),
+        ),
+        "date_echeance_restant": Case(
+            When(soldee, then=Value(None)),
+            default=echeance,
+            output_field=DateField(),
+        ),
+    }
+
+
+def somme_correlee(queryset, champ, reference, expression):
+    """Sous-requête SUM(expression) des lignes dont `champ` = `reference` de la facture, 0 si aucune."""
+    total = (
+        queryset.filter(**{champ: OuterRef(reference)})
+        .order_by().values(champ)
+        .annotate(total=Sum(expression, output_field=MONTANT))
+        .values("total")
+    )
+    return Coalesce(Subquery(total, output_field=MONTANT), Value(Decimal(0)), output_field=MONTANT)
+
+
+# ---------------------------------------------------------------------------
+# Application en lot
+# ---------------------------------------------------------------------------
+
+def _mois_precedent(mois: date) -> date:
+    if mois.month == 1:
+        return date(mois.year - 1, 12, 1)
+    return date(mois.year, mois.month - 1, 1)
+
+
+def repartition_vente(mois_existants, mois, quantite):
+    """
+    Règle historique de `update_vente_historique` : si le seul historique du
+    produit est le mois courant, la quantité est répartie 50/50 avec le mois
+    précédent. Retourne la liste des incréments (mois, quantité).
+    """
+    if mois_existants == {mois}:
+        q1 = quantite // 2
+        return [(_mois_precedent(mois), q1), (mois, quantite - q1)]
+    return [(mois, quantite)]
+
+
+def enregistrer_ventes(ventes):
+    """
+    Applique en lot une suite ordonnée de ventes (produit_id, mois, quantité)
+    sur VenteHistorique. Une quantité négative est un retrait : la ligne
+    d'historique est décrémentée et supprimée si elle tombe à zéro.
+    """
+    if not ventes:
+        return
+
+    produit_ids = {produit_id for produit_id, _, _ in ventes}
+    existants = {
+        (h.produit_id, h.mois): h
+        for h in VenteHistorique.objects.filter(produit_id__in=produit_ids)
+    }
+    mois_par_produit = defaultdict(set)
+    for produit_id, mois in existants:
+        mois_par_produit[produit_id].add(mois)
+
+    a_creer, modifies, a_supprimer = {}, set(), []
+    for produit_id, mois_vente, quantite in ventes:
+        if quantite < 0:
+            increments = [(mois_vente, quantite)]
+        else:
+            increments = repartition_vente(mois_par_produit[produit_id], mois_vente, quantite)
+
+        for mois, qte in increments:
+            cle = (produit_id, mois)
+            objet = existants.get(cle) or a_creer.get(cle)
+            if objet is None:
+                if qte < 0:
+                    continue  # rien à retirer
+                objet = a_creer[cle] = VenteHistorique(produit_id=produit_id, mois=mois, quantite=0)
+                mois_par_produit[produit_id].add(mois)
+            objet.quantite += qte
+
+            if qte < 0 and objet.quantite <= 0:
+                mois_par_produit[produit_id].discard(mois)
+                if cle in a_creer:
+                    del a_creer[cle]
+                else:
+                    a_supprimer.append(existants.pop(cle).pk)
+                    modifies.discard(cle)
+            elif cle in existants:
+                modifies.add(cle)
+
+    VenteHistorique.objects.bulk_create(a_creer.values())
+    VenteHistorique.objects.bulk_update([existants[cle] for cle in modifies], ["quantite"])
+    if a_supprimer:
+        VenteHistorique.objects.filter(pk__in=a_supprimer).delete()
+
+
+def recalculer_paiements(facture_ids):
+    """Montant payé (somme des paiements) puis statut des factures, en deux UPDATE."""
+    if not facture_ids:
+        return
+    factures = Facture.objects.filter(pk__in=facture_ids)
+    factures.update(montant_paye=somme_correlee(Paiement.objects, "facture", "pk", F("montant")))
+    factures.update(**champs_statut(F("montant_total")))
+
+
+def appliquer_stocks(stocks, taille_lot=500):
+    """
+    Applique les écarts de stock {produit_id: delta} : un UPDATE par lot de
+    `taille_lot` produits (le CASE est évalué pour chaque ligne du lot).
+    """
+    deltas = [(produit_id, delta) for produit_id, delta in stocks.items() if delta]
+    for debut in range(0, len(deltas), taille_lot):
+        lot = dict(deltas[debut:debut + taille_lot])
+        delta = Case(
+            *[When(pk=produit_id, then=Value(d)) for produit_id, d in lot.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        Produit.objects.filter(pk__in=lot.keys()).update(stock=F("stock") + delta)
+
+
+# ---------------------------------------------------------------------------
+# Lot de travail
+# ---------------------------------------------------------------------------
+
+class LotDeTravail:
+    """
+    Demandes cumulées pour un niveau de transaction, appliquées une fois
+    (`appliquer`) ; appelé au commit, il incrémente les versions.
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+        self.deltas = Counter()        # (parent, parent_id) -> écart de montant_total
+        self.liens = defaultdict(set)  # (parent, parent_id) -> lignes à lier à la facture
+        self.factures = set()          # factures dont montant_paye / statut est à recalculer
+        self.stocks = Counter()        # produit_id -> écart de stock
+        self.ventes = []               # (produit_id, mois, quantité), dans l'ordre
+        self.mouvements = []           # MouvementStock à insérer
+        self.versions = set()          # clés de version (ETag) à incrémenter, voir erp_app.versions
+        self.demandes = 0
+        self.applique = False
+        self.factures_modifiees = set()
+
+    def __call__(self):
+        """Après le commit : application de dernier recours, puis versions."""
+        try:
+            self.appliquer()
+        except Exception:
+            logger.exception(
+                "Unité de travail appliquée après le commit et en échec (%s factures, %s produits, %s ventes) : "
+                "lancer `manage.py verifier_factures --corriger`",
+                len(self.deltas) + len(self.factures), len(self.stocks), len(self.ventes),
+            )
+        self.publier_versions()
+
+    def executer(self):
+        """Hors transaction : écriture et versions aussitôt."""
+        self.appliquer()
+        self.publier_versions()
+
+    def publier_versions(self):
+        # Après l'écriture : une version neuve ne désigne jamais des données anciennes
+        incrementer_versions(
+            self.versions
+            | set(cles_versions(Produit, self.stocks))
+            | set(cles_versions(Facture, self.factures_modifiees))
+        )
+
+    def appliquer(self):
+        if self.applique:
+            return
+        self.applique = True
+
+        if any((self.stocks, self.mouvements, self.ventes, self.deltas, self.liens, self.factures)):
+            with transaction.atomic(using=self.using):
+                appliquer_stocks(self.stocks)
+                MouvementStock.objects.bulk_create(self.mouvements)
+                enregistrer_ventes(self.ventes)
+                self.factures_modifiees = self._appliquer_factures()
+
+        recalculs = (
+            len(set(self.deltas) | {("facture", pk) for pk in self.factures})
+            + len(self.stocks)
+            + len(self.mouvements)
+            + len({produit_id for produit_id, _, _ in self.ventes})
+        )
+        _compter("demandes", self.demandes)
+        _compter("recalculs", recalculs)
+        logger.debug("Unité de travail : %s demandes, %s recalculs", self.demandes, recalculs)
+
+    def _appliquer_factures(self):
+        # Le statut des factures ayant aussi un écart est recalculé ci-dessous
+        recalculer_paiements(self.factures)
+
+        liens = {cle: ids for cle, ids in self.liens.items() if ids}
+        # Factures touchées, lues une fois : liaisons à créer et versions (ETag)
+        factures = {}
+        if liens or self.deltas:
+            filtre = Q()
+            for parent, parent_id in set(liens) | set(self.deltas):
+                filtre |= Q(**{f"{parent}_id": parent_id})
+            for facture_id, commande_id, achat_id in Facture.objects.filter(filtre).values_list(
+                "pk", "commande_id", "achat_id"
+            ):
+                factures[("commande", commande_id) if commande_id else ("achat", achat_id)] = facture_id
+        if liens:
+            lignes = defaultdict(list)
+            for (parent, parent_id), facture_id in factures.items():
+                lignes[parent] += [(facture_id, pk) for pk in liens.get((parent, parent_id), ())]
+            for parent, couples in lignes.items():
+                through = Facture._meta.get_field(f"{parent}_lignes").remote_field.through
+                lien = "lignecommande_id" if parent == "commande" else "ligneachat_id"
+                through.objects.bulk_create([
+                    through(facture_id=facture_id, **{lien: pk}) for facture_id, pk in couples
+                ])
+
+        for parent in ("commande", "achat"):
+            deltas = {pid: d for (p, pid), d in self.deltas.items() if p == parent}
+            if not deltas:
+                continue
+            total = F("montant_total") + Case(
+                *[When(**{f"{parent}_id": pid}, then=Value(d)) for pid, d in deltas.items()],
+                default=Value(Decimal(0)),
+                output_field=MONTANT,
+            )
+            Facture.objects.filter(**{f"{parent}_id__in": deltas.keys()}).update(
+                montant_total=total, **champs_statut(total)
+            )
+        return set(self.factures) | set(factures.values())
+
+
+def _est_programme(lot, connection):
+    return any(func is lot for _, func, *_ in connection.run_on_commit)
+
+
+def _lot_programme(connection):
+    """Lot en attente du niveau de transaction courant, s'il y en a un."""
+    lot = _local.__dict__.get("lots", {}).get((connection.alias, tuple(connection.savepoint_ids)))
+    if lot is None or lot.applique or not _est_programme(lot, connection):
+        return None
+    return lot
+
+
+@contextmanager
+def _lot(using=None):
+    """
+    Fournit le lot du niveau de transaction courant ; hors transaction, un lot
+    éphémère exécuté immédiatement.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        lot = LotDeTravail(using)
+        yield lot
+        lot.demandes += 1
+        lot.executer()
+        return
+
+    lot = _lot_programme(connection)
+    if lot is None:
+        lots = _local.__dict__.setdefault("lots", {})
+        cle = (connection.alias, tuple(connection.savepoint_ids))
+        # Nouveau lot : on oublie ceux dont la transaction a été annulée
+        for autre_cle, autre in list(lots.items()):
+            if autre_cle[0] == connection.alias and not _est_programme(autre, connection):
+                del lots[autre_cle]
+        lot = lots[cle] = LotDeTravail(using)
+        transaction.on_commit(lot, using=using, robust=True)
+    yield lot
+    lot.demandes += 1
+
+
+def vider(using=None):
+    """
+    Applique maintenant, dans la transaction en cours, les lots en attente de
+    son commit (tous niveaux de savepoint). Les demandes suivantes ouvrent un
+    nouveau lot.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block or connection.needs_rollback:
+        return
+    for _, fonction, *_ in list(connection.run_on_commit):
+        if isinstance(fonction, LotDeTravail):
+            fonction.appliquer()
+
+
+@contextmanager
+def atomique(using=None):
+    """`transaction.atomic()` dont les lots sont appliqués en fin de bloc, avant le commit."""
+    with transaction.atomic(using=using):
+        yield
+        vider(using)
+
+
+class UniteTravailMixin:
+    """
+    Vues DRF : les lots de la requête sont appliqués avant la réponse, donc
+    dans la transaction d'ATOMIC_REQUESTS. Une erreur d'application remonte
+    et annule toute la requête au lieu d'arriver après un COMMIT.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            vider()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Enregistrement des demandes
+# ---------------------------------------------------------------------------
+
+def ajouter_delta_facture(parent, parent_id, delta, lier=None, delier=None):
+    """Écart de montant_total pour la facture de `parent` ("commande" / "achat"), avec (dé)liaison de ligne."""
+    with _lot() as lot:
+        cle = (parent, parent_id)
+        lot.deltas[cle] += delta
+        if lier is not None:
+            lot.liens[cle].add(lier)
+        if delier is not None:
+            lot.liens[cle].discard(delier)
+
+
+def marquer_facture(facture_id):
+    """Montant payé et statut de la facture à recalculer depuis ses paiements."""
+    with _lot() as lot:
+        lot.factures.add(facture_id)
+
+
+def ajuster_stock(produit_id, delta):
+    with _lot() as lot:
+        lot.stocks[produit_id] += delta
+
+
+def enregistrer_mouvement(produit_id, type, quantite, **lignes):
+    """Mouvement de stock à journaliser (`lignes` : ligne_commande_id / ligne_achat_id)."""
+    with _lot() as lot:
+        lot.mouvements.append(
+            MouvementStock(produit_id=produit_id, type=type, quantite=quantite, **lignes)
+        )
+
+
+def enregistrer_vente(produit_id, mois, quantite):
+    """Vente (ou retrait si `quantite` < 0) à reporter sur VenteHistorique."""
+    with _lot() as lot:
+        lot.ventes.append((produit_id, mois, quantite))
+
+
+def modifier_versions(modele, pks=(), using=None):
+    """
+    Versions (ETag) de `modele` et des objets `pks` à incrémenter après le
+    commit : avec le lot en attente s'il y en a un, sinon seules.
+    """
+    cles = cles_versions(modele, pks)
+    connection = transaction.get_connection(using)
+    lot = _lot_programme(connection) if connection.in_atomic_block else None
+    if lot is not None:
+        lot.versions.update(cles)
+    else:
+        transaction.on_commit(partial(incrementer_versions, cles), using=using)
@@ -3,9 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     PersonViewSet, ProduitViewSet, AchatViewSet, LigneAchatViewSet,
     CommandeViewSet, LigneCommandeViewSet, FactureViewSet, PaiementViewSet,
-    CompteBancaireViewSet, TransactionTresorerieViewSet, RelancePaiementViewSet,
+    CompteBancaireViewSet, TransactionTresorerieViewSet, RelancePaiementViewSet, JobViewSet,
     home, download_facture_pdf, predict_ventes ,historique_ventes,predict_plot,ventes_prediction_plot,
-    api_predire_risque
+    api_predire_risque, api_cache_reponses, api_unite_travail, commandes_stats
 )
 
 router = DefaultRouter()
@@ -20,9 +20,12 @@ router.register(r'paiements', PaiementViewSet)
 router.register(r'comptes-bancaires', CompteBancaireViewSet)
 router.register(r'transactions-tresorerie', TransactionTresorerieViewSet)
 router.register(r'relances-paiement', RelancePaiementViewSet)
+router.register(r'jobs', JobViewSet)
 
 urlpatterns = [
     path('', home),
+    # Avant le routeur : « stats » serait lu comme l'id d'une commande
+    path('api/commandes/stats/', commandes_stats, name='commandes-stats'),
     path('api/', include(router.urls)),
     path('api/factures/<int:pk>/pdf/', download_facture_pdf, name='facture-pdf'),
     path('api/predict-ventes/<int:produit_id>/', predict_ventes),
@@ -30,5 +33,7 @@ urlpatterns = [
     path('api/predict-plot/<int:produit_id>/', predict_plot),
     path('api/prediction-global/', ventes_prediction_plot, name='prediction_global'),  # ✅ corrigé ici
     path('api/risque-client/<int:client_id>/', api_predire_risque, name='risque-client'),
+    path('api/cache-reponses/', api_cache_reponses, name='cache-reponses'),
+    path('api/unite-travail/', api_unite_travail, name='unite-travail'),
 
 ]
\ No newline at end of file
@@ -1,6 +1,6 @@
 # erp_app/utils.py - Fixed version with all 7 features
 
-from .ml.prediction import predict_statut_risque
+from .ml.prediction import predict_statut_risque, MODEL_PATH
 from .models import Facture, Commande, Person, RelancePaiement
 from django.db.models import Sum, Count
 from django.core.exceptions import ObjectDoesNotExist
@@ -0,0 +1,115 @@
+# erp_app/versions.py
+"""
+Versions de modification par modèle et par objet, tenues dans le cache Django,
+pour les GET conditionnels (ETag / If-None-Match) de l'API.
+
+Les écritures demandent l'incrément des versions touchées à l'unité de travail
+(`unite_travail.modifier_versions`) : par les signaux post_save / post_delete
+et, pour les `.update()` qui n'en émettent pas, par un appel explicite. Les
+versions sont incrémentées après le commit, une fois par transaction. Une
+version absente du cache (jamais lue, évincée) est initialisée à l'horloge en
+nanosecondes : elle ne reprend jamais une valeur déjà servie.
+
+Le cache doit être partagé par tous les processus (voir CACHES) : avec le
+cache mémoire local, une écriture faite par un autre processus n'est pas vue,
+et ses ETag resteraient valides indéfiniment. Sur un tel cache, les GET
+conditionnels (et le cache des réponses qui en dépend) sont donc désactivés,
+sauf réglage explicite `VERSIONS_CACHE_PARTAGE = True` (un seul processus,
+tests) ; le contrôle `erp_app.W001` le signale au démarrage.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def versions_partagees():
+    """Les versions sont-elles vues par tous les processus ? Sinon, pas d'ETag."""
+    reglage = getattr(settings, "VERSIONS_CACHE_PARTAGE", None)
+    if reglage is not None:
+        return reglage
+    # Mémoire locale : propre au processus ; factice : rien n'est conservé
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def etag_demande(request, etag):
+    """`etag` est-il dans l'en-tête If-None-Match de `request` (comparaison faible, `*` compris) ?"""
+    demandes = [v.strip().removeprefix("W/") for v in request.headers.get("If-None-Match", "").split(",")]
+    return etag in demandes or "*" in demandes
+
+
+def cle_version(modele, pk=None):
+    nom = modele._meta.label_lower
+    return f"version:{nom}" if pk is None else f"version:{nom}:{pk}"
+
+
+def lire_versions(cles):
+    valeurs = cache.get_many(cles)
+    manquantes = [cle for cle in cles if cle not in valeurs]
+    if manquantes:
+        for cle in manquantes:
+            cache.add(cle, time.time_ns(), None)
+        valeurs.update(cache.get_many(manquantes))
+    return [valeurs.get(cle) for cle in cles]
+
+
+def cles_versions(modele, pks=()):
+    """Clé de version du modèle et de chacun des objets `pks`."""
+    return [cle_version(modele)] + [cle_version(modele, pk) for pk in pks if pk is not None]
+
+
+def incrementer_versions(cles):
+    for cle in cles:
+        try:
+            cache.incr(cle)
+        except ValueError:
+            # Absente : la prochaine lecture l'initialise à une valeur neuve
+            pass
+
+
+class VersionEtagMixin:
+    """
+    GET conditionnel des listes et fiches. L'ETag combine l'URL demandée, le
+    format accepté et les versions de `modeles_etag` : celle de l'objet pour le
+    premier modèle d'une fiche, celle du modèle sinon. Les modèles suivants sont
+    ceux dont la représentation dépend (noms du client, du fournisseur...).
+    Un If-None-Match à jour reçoit une 304 sans requête SQL ni sérialisation.
+    Sans cache partagé (`versions_partagees`), les réponses n'ont pas d'ETag.
+    """
+    modeles_etag = ()
+
+    def etag(self, request):
+        principal, *dependances = self.modeles_etag
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        cles = [cle_version(principal, pk)] + [cle_version(modele) for modele in dependances]
+        empreinte = "|".join(
+            [request.get_full_path(), request.headers.get("Accept", "")]
+            + [str(version) for version in lire_versions(cles)]
+        )
+        return '"%s"' % hashlib.sha1(empreinte.encode()).hexdigest()
+
+    def _conditionnel(self, handler, request, *args, **kwargs):
+        if not versions_partagees():
+            return handler(request, *args, **kwargs)
+        etag = self.etag(request)
+        if etag_demande(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response = self._repondre(handler, request, etag, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+        return response
+
+    def _repondre(self, handler, request, etag, *args, **kwargs):
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self._conditionnel(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditionnel(super().retrieve, request, *args, **kwargs)
@@ -1,20 +1,21 @@
 from rest_framework import viewsets
 from rest_framework.exceptions import ValidationError
-from django.http import HttpResponse, FileResponse
-from django.shortcuts import render
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, FileResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.shortcuts import get_object_or_404, render
 from reportlab.lib import colors
-import io
 from django.utils.timezone import localdate   # ✅ ajoute ceci
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.parsers import MultiPartParser
 from .ml.prediction import predire_vente_mois_prochain
 import matplotlib.pyplot as plt
 from io import BytesIO
 import base64
 import numpy as np
 from sklearn.linear_model import LinearRegression
-from datetime import datetime
+from datetime import datetime, timedelta
 from .utils import predire_risque_facture
 import matplotlib
 matplotlib.use('Agg') 
@@ -24,18 +25,88 @@ from rest_framework import status
 from django.utils.timezone import now
 from .models import (
     Person, Produit, Achat, LigneAchat, Commande, LigneCommande, Facture,
-    Paiement, CompteBancaire, TransactionTresorerie, RelancePaiement,VenteHistorique
+    Paiement, CompteBancaire, TransactionTresorerie, RelancePaiement,VenteHistorique,
+    MouvementStock, Job
 )
 from .serializers import (
     PersonSerializer, ProduitSerializer, AchatSerializer, LigneAchatSerializer,
-    CommandeSerializer, LigneCommandeSerializer, FactureSerializer,
-    PaiementSerializer, CompteBancaireSerializer, TransactionTresorerieSerializer, RelancePaiementSerializer
+    CommandeSerializer, CommandeBulkSerializer, LigneCommandeSerializer, FactureSerializer,
+    PaiementSerializer, CompteBancaireSerializer, TransactionTresorerieSerializer, RelancePaiementSerializer,
+    MouvementStockSerializer, ImportReleveSerializer, JobSerializer
+)
+from .stock import stock_a_date
+from .sequences import prochaine_reference
+from .rapprochement import ReleveInvalide, importer_releve
+from .synchronisation import SynchronisationPersonnes, SynchronisationProduits
+from .tableau_de_bord import statistiques_commandes
+from .unite_travail import UniteTravailMixin, statistiques as statistiques_unite_travail
+from .tresorerie import HISTORIQUE_MAX_JOURS, historique_soldes, mouvementer_transaction
+from .pagination import CurseurPagination, ExportFluxMixin
+from .renderers import JSONFluxRenderer, NDJSONRenderer
+from .versions import VersionEtagMixin, etag_demande
+from .balance_agee import balance_agee
+from .cache_pdf import empreinte as empreinte_pdf, ouvrir_pdf
+from .pdf_factures import donnees_facture, factures_pour_pdf, flux_zip
+from .graphiques import prevision_ventes_png
+from .jobs import soumettre
+from .releve import flux_releve, periode_du_mois
+from .cache_reponses import ReponseCacheMixin, statistiques as statistiques_cache
+from .filtres import (
+    FiltreFactureSerializer, FiltreParametresBackend, FiltrePaiementSerializer, FiltreTransactionSerializer,
 )
 
 
+def _asynchrone(request):
+    """?async=1 : le traitement est confié au worker (voir erp_app.jobs)."""
+    return request.GET.get('async', '').lower() in ('1', 'true', 'oui')
+
+
+def _reponse_job(request, job):
+    """202 Accepted : l'état du job se suit à l'adresse donnée (corps et en-tête Location)."""
+    url = request.build_absolute_uri(reverse('job-detail', args=[job.pk]))
+    return JsonResponse({'id': job.pk, 'statut': job.statut, 'url': url}, status=202, headers={'Location': url})
+
+
+def _filtres(request, filtre_class):
+    """Paramètres de filtre de la requête, transmis tels quels au job (revalidés par le worker)."""
+    noms = set(filtre_class().fields)
+    return {k: v for k, v in request.query_params.items() if k in noms}
+
+
+def _date_param(request, nom):
+    valeur = request.query_params.get(nom)
+    if not valeur:
+        return None
+    try:
+        return datetime.strptime(valeur, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValidationError({nom: "Format de date attendu : AAAA-MM-JJ."})
+
+
+def _mois_param(request, nom='mois'):
+    """Premier jour du mois ?mois=AAAA-MM, ou du mois en cours."""
+    valeur = request.query_params.get(nom)
+    if not valeur:
+        return localdate().replace(day=1)
+    try:
+        return datetime.strptime(valeur, '%Y-%m').date()
+    except ValueError:
+        raise ValidationError({nom: "Format de mois attendu : AAAA-MM."})
+
+
+class ChampsDemandesMixin:
+    """Jointures et préchargements limités aux champs rendus (?fields= / ?expand=)."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return self.get_serializer_class().optimiser_queryset(queryset, self.request)
+
+
 # 🌿 ViewSets normaux
-class PersonViewSet(viewsets.ModelViewSet):
+class PersonViewSet(UniteTravailMixin, ChampsDemandesMixin, ReponseCacheMixin, ExportFluxMixin, viewsets.ModelViewSet):
     serializer_class = PersonSerializer
+    ordering = ('id',)
+    modeles_etag = (Person,)
 
     def get_queryset(self):
         queryset = Person.objects.all()
@@ -44,36 +115,135 @@ class PersonViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(type=person_type)
         return queryset
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Upsert en masse sur (type, cle_externe) : liste d'objets, erreurs rapportées par index."""
+        return Response(SynchronisationPersonnes().executer(request.data).en_dict())
 
-class ProduitViewSet(viewsets.ModelViewSet):
-    queryset = Produit.objects.all()
-    serializer_class = ProduitSerializer
+    @action(detail=True, methods=['get'])
+    def releve(self, request, pk=None):
+        """Relevé de compte PDF du client pour un mois (?mois=AAAA-MM, mois en cours par défaut), émis page par page."""
+        client = get_object_or_404(Person, pk=pk, type='client')
+        debut, fin = periode_du_mois(_mois_param(request))
+        if _asynchrone(request):
+            return _reponse_job(request, soumettre('releve', client=client.pk, mois=f"{debut:%Y-%m}"))
+        response = StreamingHttpResponse(flux_releve(client, debut, fin), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="releve_{client.pk}_{debut:%Y-%m}.pdf"'
+        return response
 
 
-class AchatViewSet(viewsets.ModelViewSet):
+class ProduitViewSet(UniteTravailMixin, ChampsDemandesMixin, ReponseCacheMixin, ExportFluxMixin, viewsets.ModelViewSet):
+    queryset = Produit.objects.all()
+    serializer_class = ProduitSerializer
+    ordering = ('id',)
+    modeles_etag = (Produit,)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Upsert en masse sur cle_externe : liste d'objets, erreurs rapportées par index."""
+        return Response(SynchronisationProduits().executer(request.data).en_dict())
+
+    @action(detail=True, methods=['get'], url_path='stock-a-date', url_name='stock-a-date')
+    def stock_au_jour(self, request, pk=None):
+        """Stock en fin de journée : ?date=AAAA-MM-JJ (défaut : aujourd'hui)."""
+        produit = self.get_object()
+        jour = _date_param(request, 'date') or localdate()
+        return Response({'produit': produit.pk, 'date': jour, 'stock': stock_a_date(produit.pk, jour)})
+
+    @action(detail=True, methods=['get'], serializer_class=MouvementStockSerializer)
+    def mouvements(self, request, pk=None):
+        """Mouvements de stock du produit, paginés par curseur : ?from=AAAA-MM-JJ&to=AAAA-MM-JJ."""
+        mouvements = MouvementStock.objects.filter(produit_id=pk)
+        debut, fin = _date_param(request, 'from'), _date_param(request, 'to')
+        if debut:
+            mouvements = mouvements.filter(date_mouvement__gte=debut)
+        if fin:
+            mouvements = mouvements.filter(date_mouvement__lte=fin)
+
+        # Ordre propre au journal (index produit, date), pas celui des produits
+        paginator = CurseurPagination()
+        paginator.ordering = ('date_mouvement', 'id')
+        page = paginator.paginate_queryset(mouvements, request)
+        if page is None:  # ?page_size=all
+            return self.reponse_flux(mouvements.order_by(*paginator.ordering))
+        return paginator.get_paginated_response(MouvementStockSerializer(page, many=True).data)
+
+
+class AchatViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = Achat.objects.all()
     serializer_class = AchatSerializer
+    ordering = ('-date_achat', '-id')
 
 
-class LigneAchatViewSet(viewsets.ModelViewSet):
+class LigneAchatViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = LigneAchat.objects.all()
     serializer_class = LigneAchatSerializer
+    ordering = ('id',)
 
 
-class CommandeViewSet(viewsets.ModelViewSet):
+class CommandeViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = Commande.objects.all()
     serializer_class = CommandeSerializer
+    ordering = ('-date_commande', '-id')
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Création en masse : lignes insérées en un lot, stock/historique/facture calculés une fois."""
+        serializer = CommandeBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        commande = serializer.save()
+        return Response(
+            CommandeSerializer(commande).data,
+            status=status.HTTP_201_CREATED
+        )
 
-class LigneCommandeViewSet(viewsets.ModelViewSet):
+
+class LigneCommandeViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = LigneCommande.objects.all()
     serializer_class = LigneCommandeSerializer
+    ordering = ('id',)
 
 
 # 🌿 Facture ViewSet bloquant création/modification manuelle
-class FactureViewSet(viewsets.ModelViewSet):
+class FactureViewSet(UniteTravailMixin, ChampsDemandesMixin, VersionEtagMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = Facture.objects.all()
     serializer_class = FactureSerializer
+    ordering = ('-date_facture', '-id')
+    # Noms et ids du client / fournisseur viennent de la commande ou de l'achat
+    modeles_etag = (Facture, Commande, Achat, Person)
+    filter_backends = [FiltreParametresBackend, SearchFilter, OrderingFilter]
+    filtre_class = FiltreFactureSerializer
+    search_fields = ['commande__client__nom', 'achat__fournisseur__nom']
+    ordering_fields = ['date_facture', 'montant_total', 'montant_paye', 'statut', 'id']
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONFluxRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Toutes les factures filtrées, en flux : JSON ou NDJSON (?format=ndjson) ; ?async=1 pour un job."""
+        if _asynchrone(request):
+            self.filter_queryset(Facture.objects.none())  # filtres invalides : 400 tout de suite
+            return _reponse_job(request, soumettre(
+                'export', ressource='factures', format=request.accepted_renderer.format,
+                filtres=_filtres(request, FiltreFactureSerializer),
+            ))
+        return self.reponse_flux(self.filter_queryset(self.get_queryset()), nom_fichier='factures')
+
+    @action(detail=False, methods=['get'], url_path='balance-agee')
+    def balance_agee(self, request):
+        """Reste dû des factures clients par tranche de retard, par client et au total (?date=AAAA-MM-JJ)."""
+        return Response(balance_agee(_date_param(request, 'date')))
+
+    @action(detail=False, methods=['get'], url_path='pdf-zip')
+    def pdf_zip(self, request):
+        """PDF des factures filtrées (mêmes filtres que la liste), dans une archive ZIP émise en flux."""
+        factures = self.filter_queryset(Facture.objects.all())
+        if _asynchrone(request):
+            return _reponse_job(request, soumettre('factures_zip', filtres=_filtres(request, FiltreFactureSerializer)))
+        # Pas de pool de cœurs par requête : le rendu parallèle passe par ?async=1
+        response = StreamingHttpResponse(
+            flux_zip(factures, processus=settings.PDF_PROCESSUS_REQUETE), content_type='application/zip',
+        )
+        response['Content-Disposition'] = 'attachment; filename="factures.zip"'
+        return response
 
     def create(self, request, *args, **kwargs):
         raise ValidationError("La création manuelle de factures n'est pas autorisée.")
@@ -88,190 +258,48 @@ class FactureViewSet(viewsets.ModelViewSet):
 # 🌿 Génération de PDF
 
 def download_facture_pdf(request, pk):
-    try:
-        facture = Facture.objects.get(pk=pk)
-    except Facture.DoesNotExist:
+    if _asynchrone(request):
+        if not Facture.objects.filter(pk=pk).exists():
+            return HttpResponse("Facture non trouvée.", status=404)
+        return _reponse_job(request, soumettre('facture_pdf', facture=pk))
+
+    facture = factures_pour_pdf(Facture.objects.filter(pk=pk)).first()
+    if facture is None:
         return HttpResponse("Facture non trouvée.", status=404)
 
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    margin = 50
-    y = height - margin
+    # PDF adressé par le contenu de la facture : l'empreinte sert d'ETag
+    donnees = donnees_facture(facture)
+    etag = f'"{empreinte_pdf(donnees)}"'
+    if etag_demande(request, etag):
+        return HttpResponseNotModified(headers={"ETag": etag})
 
     try:
-        # 🧩 En-tête titre centré
-        p.setFont("Helvetica-Bold", 20)
-        p.drawCentredString(width / 2, y, f"FACTURE N°{facture.id}")
-        y -= 40
-
-        # 🧾 Infos client ou fournisseur
-        p.setFont("Helvetica", 12)
-        if facture.commande:
-            p.drawString(margin, y, f"Client : {facture.commande.client.nom}")
-        elif facture.achat:
-            p.drawString(margin, y, f"Fournisseur : {facture.achat.fournisseur.nom}")
-        y -= 20
-        p.drawString(margin, y, f"Date facture : {facture.date_facture.strftime('%d/%m/%Y')}")
-        y -= 20
-        p.drawString(margin, y, f"Statut facture : {facture.statut}")
-        y -= 20
-        # Montant payé et reste
-        p.drawString(margin, y, f"Montant total     : {facture.montant_total:.2f} DH")
-        y -= 15
-        p.drawString(margin, y, f"Montant payé      : {facture.montant_paye:.2f} DH")
-        y -= 15
-        reste = facture.montant_total - facture.montant_paye
-        p.drawString(margin, y, f"Reste à payer     : {reste:.2f} DH")
-        y -= 15
-        # Date d'échéance si présente
-        if facture.date_echeance_restant:
-            p.drawString(margin, y, f"Date d'échéance    : {facture.date_echeance_restant.strftime('%d/%m/%Y')}")
-            y -= 20
-        else:
-            y -= 10
-
-        # 🔹 Séparateur
-        p.setStrokeColorRGB(0.6, 0.6, 0.6)
-        p.setLineWidth(1)
-        p.line(margin, y, width - margin, y)
-        y -= 25
-
-        # 🧾 En-tête des colonnes pour les lignes
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(margin, y, "Désignation")
-        p.drawString(250, y, "Quantité")
-        p.drawString(330, y, "Prix Unitaire")
-        p.drawString(450, y, "Total ligne")
-        y -= 20
-
-        p.setFont("Helvetica", 10)
-        lignes = facture.commande.lignecommande_set.all() if facture.commande else facture.achat.lignes.all()
-
-        for ligne in lignes:
-            if y < margin + 100:
-                p.showPage()
-                y = height - margin
-                p.setFont("Helvetica-Bold", 12)
-                p.drawString(margin, y, "Désignation")
-                p.drawString(250, y, "Quantité")
-                p.drawString(330, y, "Prix Unitaire")
-                p.drawString(450, y, "Total ligne")
-                y -= 20
-                p.setFont("Helvetica", 10)
-
-            total_ligne = (ligne.quantite or 0) * (ligne.prix_unitaire or 0)
-            p.drawString(margin, y, ligne.produit.nom)
-            p.drawString(250, y, str(ligne.quantite))
-            p.drawString(330, y, f"{ligne.prix_unitaire:.2f} DH")
-            p.drawString(450, y, f"{total_ligne:.2f} DH")
-            y -= 18
-
-        # 🔹 Séparateur avant section paiements
-        y -= 10
-        p.setLineWidth(0.5)
-        p.line(margin, y, width - margin, y)
-        y -= 25
-
-        # 🧾 Section paiements passés
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(margin, y, "Historique des paiements :")
-        y -= 18
-        p.setFont("Helvetica", 10)
-
-        paiements = facture.paiement_set.order_by('date_paiement')
-        if paiements.exists():
-            p.drawString(margin, y, "Date       Montant   Méthode      Référence")
-            y -= 15
-            for pay in paiements:
-                if y < margin + 50:
-                    p.showPage()
-                    y = height - margin
-                    p.setFont("Helvetica-Bold", 12)
-                    p.drawString(margin, y, "Historique des paiements :")
-                    y -= 18
-                    p.setFont("Helvetica", 10)
-                    p.drawString(margin, y, "Date       Montant   Méthode      Référence")
-                    y -= 15
-
-                p.drawString(margin, y, pay.date_paiement.strftime('%d/%m/%Y'))
-                p.drawString(100, y, f"{pay.montant:.2f} DH")
-                p.drawString(180, y, f"{pay.methode}")
-                p.drawString(270, y, pay.reference_paiement)
-                y -= 15
-        else:
-            p.drawString(margin, y, "Aucun paiement enregistré.")
-            y -= 15
-
-        # 🔹 Séparateur avant section relances
-        y -= 10
-        p.setLineWidth(0.5)
-        p.line(margin, y, width - margin, y)
-        y -= 25
-
-        # 🧾 Section relances
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(margin, y, "Historique des relances :")
-        y -= 18
-        p.setFont("Helvetica", 10)
-
-        relances = facture.relances.order_by('numero')
-        if relances.exists():
-            p.drawString(margin, y, "N°  Date       Statut   Note")
-            y -= 15
-            for rel in relances:
-                if y < margin + 50:
-                    p.showPage()
-                    y = height - margin
-                    p.setFont("Helvetica-Bold", 12)
-                    p.drawString(margin, y, "Historique des relances :")
-                    y -= 18
-                    p.setFont("Helvetica", 10)
-                    p.drawString(margin, y, "N°  Date       Statut   Note")
-                    y -= 15
-
-                p.drawString(margin, y, str(rel.numero))
-                p.drawString(30, y, rel.date_relance.strftime('%d/%m/%Y'))
-                p.drawString(100, y, rel.statut)
-                p.drawString(160, y, rel.note)
-                y -= 15
-        else:
-            p.drawString(margin, y, "Aucune relance.")
-            y -= 15
-
-        # 🔹 Ligne de séparation finale
-        y -= 20
-        p.setLineWidth(0.5)
-        p.line(margin, y, width - margin, y)
-        y -= 20
-
-        # Footer signature
-        p.setFont("Helvetica-Oblique", 10)
-        p.drawString(margin, y, "Merci pour votre confiance.")
-        y -= 15
-        p.drawString(margin, y, "Facture générée automatiquement par le système.")
-
-        # Génération finale
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-
-        return FileResponse(buffer, as_attachment=True, filename=f"facture_{pk}.pdf")
-
+        fichier = ouvrir_pdf(donnees, etag.strip('"'))
     except Exception as e:
         return HttpResponse(f"Erreur génération PDF : {str(e)}", status=500)
 
+    response = FileResponse(fichier, as_attachment=True, filename=f"facture_{pk}.pdf")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
 
 # 🌿 Autres ViewSets
 
-class PaiementViewSet(viewsets.ModelViewSet):
+class PaiementViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     """
     - Gère la création des paiements (partiels ou complets).
     - Génère automatiquement une référence unique par jour : PAI-YYYYMMDD-NNNN
-    - Met à jour la date d'échéance restante de la facture pour les paiements partiels.
+    - Met à jour la date d'échéance restante de la facture pour les paiements partiels
+      (voir services.comptabiliser_paiement).
     """
     queryset         = Paiement.objects.all().select_related('facture')
     serializer_class = PaiementSerializer
+    ordering         = ('-date_paiement', '-id')
+    filter_backends  = [FiltreParametresBackend, SearchFilter, OrderingFilter]
+    filtre_class     = FiltrePaiementSerializer
+    search_fields    = ['reference_paiement']
+    ordering_fields  = ['date_paiement', 'montant', 'id']
 
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
@@ -297,47 +325,125 @@ class PaiementViewSet(viewsets.ModelViewSet):
 
         data["facture"] = facture.pk
 
-        # ---------------- Génération de la référence paiement ---------- #
-        if not data.get("reference_paiement"):
-            today = localdate()  # ex. 2025-06-06
-            seq   = (
-                Paiement.objects.filter(date_paiement=today)
-                                .count() + 1
-            )
-            data["reference_paiement"] = f"PAI-{today:%Y%m%d}-{seq:04d}"
-
         # ---------------- Sérialisation & sauvegarde ------------------- #
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        paiement = serializer.save()   # montant_paye mis à jour via signal ou surchargé en modèle
 
-        # ---------------- Gestion date échéance (paiement partiel) ----- #
-        paiement_complet = bool(data.get("paiement_complet", True))
-        date_echeance_solde = data.get("date_echeance_solde")
+        # ---------------- Génération de la référence paiement ---------- #
+        # Compteur journalier verrouillé jusqu'au commit : attribué après
+        # validation pour garder le verrou le moins longtemps possible.
+        extra = {}
+        if not serializer.validated_data.get("reference_paiement"):
+            extra["reference_paiement"] = prochaine_reference()
 
-        if not paiement_complet and date_echeance_solde:
-            facture.date_echeance_restant = date_echeance_solde
-            facture.save(update_fields=["date_echeance_restant"])
+        # Trésorerie, solde du compte, montant payé, statut et échéance
+        # restante (paiement partiel) : comptabilisés par Paiement.save
+        paiement = serializer.save(**extra)
 
         return Response(
             self.get_serializer(paiement).data,
             status=status.HTTP_201_CREATED
         )
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def importer(self, request):
+        """
+        Import d'un relevé bancaire (multipart : fichier, compte, simulation).
+        Retourne les lignes rapprochées, ambiguës et non rapprochées.
+        """
+        serializer = ImportReleveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            rapport = importer_releve(
+                serializer.validated_data['fichier'],
+                compte=serializer.validated_data.get('compte'),
+                simulation=serializer.validated_data['simulation'],
+            )
+        except ReleveInvalide as e:
+            raise ValidationError({'fichier': str(e)})
+        return Response(rapport.en_dict())
 
-class CompteBancaireViewSet(viewsets.ModelViewSet):
+
+class CompteBancaireViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = CompteBancaire.objects.all()
     serializer_class = CompteBancaireSerializer
+    ordering = ('id',)
+
+    @action(detail=True, methods=['get'])
+    def historique(self, request, pk=None):
+        """Solde de clôture jour par jour : ?from=AAAA-MM-JJ&to=AAAA-MM-JJ (défaut : 30 derniers jours)."""
+        compte = self.get_object()
+        fin = _date_param(request, 'to') or localdate()
+        debut = _date_param(request, 'from') or fin - timedelta(days=29)
+        if debut > fin:
+            raise ValidationError({'from': "Doit précéder 'to'."})
+        if (fin - debut).days >= HISTORIQUE_MAX_JOURS:
+            raise ValidationError({'from': f"Période limitée à {HISTORIQUE_MAX_JOURS} jours."})
+        return Response({
+            'compte': compte.pk,
+            'soldes': historique_soldes(compte, debut, fin),
+        })
 
 
-class TransactionTresorerieViewSet(viewsets.ModelViewSet):
+class TransactionTresorerieViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = TransactionTresorerie.objects.all()
     serializer_class = TransactionTresorerieSerializer
+    ordering = ('-date_transaction', '-id')
+    filter_backends = [FiltreParametresBackend, SearchFilter, OrderingFilter]
+    filtre_class = FiltreTransactionSerializer
+    search_fields = ['description']
+    ordering_fields = ['date_transaction', 'montant', 'id']
+
+    # Solde du compte et soldes journaliers suivent chaque écriture, comme pour les paiements
+    def perform_create(self, serializer):
+        mouvementer_transaction(serializer.save())
+
+    def perform_update(self, serializer):
+        mouvementer_transaction(serializer.instance, sens=-1)
+        mouvementer_transaction(serializer.save())
+
+    def perform_destroy(self, instance):
+        mouvementer_transaction(instance, sens=-1)
+        instance.delete()
+
+    @action(detail=False, methods=['get'], renderer_classes=[JSONFluxRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Toutes les transactions filtrées, en flux : JSON ou NDJSON (?format=ndjson) ; ?async=1 pour un job."""
+        if _asynchrone(request):
+            self.filter_queryset(TransactionTresorerie.objects.none())
+            return _reponse_job(request, soumettre(
+                'export', ressource='transactions', format=request.accepted_renderer.format,
+                filtres=_filtres(request, FiltreTransactionSerializer),
+            ))
+        return self.reponse_flux(self.filter_queryset(self.get_queryset()), nom_fichier='transactions')
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Tâches de fond : état (/api/jobs/{id}/) et résultat (/api/jobs/{id}/resultat/)."""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    ordering = ('-id',)
+
+    @action(detail=True, methods=['get'])
+    def resultat(self, request, pk=None):
+        """Fichier produit par le job, ou son résultat JSON ; 409 tant qu'il n'est pas terminé."""
+        job = self.get_object()
+        if job.statut != 'terminé':
+            return Response(
+                {'detail': "Le job n'est pas terminé.", 'statut': job.statut, 'erreur': job.erreur},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if job.fichier:
+            return FileResponse(
+                open(job.fichier, 'rb'), as_attachment=True, filename=job.nom_fichier, content_type=job.type_contenu,
+            )
+        return Response(job.resultat)
 
 
-class RelancePaiementViewSet(viewsets.ModelViewSet):
+class RelancePaiementViewSet(UniteTravailMixin, ChampsDemandesMixin, ExportFluxMixin, viewsets.ModelViewSet):
     queryset = RelancePaiement.objects.all()
     serializer_class = RelancePaiementSerializer
+    ordering = ('-date_relance', '-id')
 
 
 # 🌿 Home
@@ -404,41 +510,30 @@ def ventes_prediction_plot(request):
 
 
 def predict_plot(request, produit_id):
+    if _asynchrone(request):
+        if not VenteHistorique.objects.filter(produit_id=produit_id).exists():
+            return HttpResponse("Pas de données", status=404)
+        return _reponse_job(request, soumettre('prevision_ventes', produit=produit_id))
     try:
-        historique = VenteHistorique.objects.filter(produit_id=produit_id).order_by('mois')
-        if not historique.exists():
+        png = prevision_ventes_png(produit_id)
+        if png is None:
             return HttpResponse("Pas de données", status=404)
+        return HttpResponse(png, content_type='image/png')
 
-        X = np.array(range(len(historique))).reshape(-1, 1)
-        y = np.array([h.quantite for h in historique])
-
-        model = LinearRegression().fit(X, y)
-        y_pred = model.predict(X)
-
-        # Prévision mois suivant
-        next_month = model.predict([[len(X)]])
+    except Exception as e:
+        return HttpResponse(f"Erreur: {str(e)}", status=500)
 
-        # Graph
-        plt.figure(figsize=(8, 4))
-        plt.plot(X, y, 'bo-', label='Ventes réelles')
-        plt.plot(X, y_pred, 'r--', label='Régression')
-        plt.plot(len(X), next_month, 'go', label='Prévision')
-        plt.title(f"Prévision des ventes - Produit ID {produit_id}")
-        plt.xlabel("Mois (index)")
-        plt.ylabel("Quantité vendue")
-        plt.legend()
-        plt.grid(True)
 
-        # Génère l'image dans un buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close()
-        buf.seek(0)
+@api_view(['GET'])
+def api_cache_reponses(request):
+    """Succès / échecs du cache des réponses (produits, personnes)."""
+    return Response(statistiques_cache())
 
-        return HttpResponse(buf.getvalue(), content_type='image/png')
 
-    except Exception as e:
-        return HttpResponse(f"Erreur: {str(e)}", status=500)
+@api_view(['GET'])
+def api_unite_travail(request):
+    """Demandes de recalcul reçues, recalculs exécutés et économisés par l'unité de travail."""
+    return Response(statistiques_unite_travail())
 
 
 @api_view(['GET'])
@@ -449,49 +544,8 @@ def api_predire_risque(request, client_id):
         'niveau': res['niveau']
     })
 
-# Dans views.py
-from django.http import JsonResponse
-from django.db.models import Count, Sum
-from .models import Commande
-from datetime import datetime, timedelta
 
+@api_view(['GET'])
 def commandes_stats(request):
-    try:
-        # 1. Total des commandes
-        total = Commande.objects.count()
-        
-        # 2. Données mensuelles
-        monthly_data = Commande.objects.annotate(
-            month=TruncMonth('date')
-        ).values('month').annotate(
-            count=Count('id'),
-            total_amount=Sum('montant')
-        ).order_by('-month')[:12]
-        
-        # 3. Statistiques par statut
-        status_stats = Commande.objects.values('statut').annotate(
-            count=Count('id')
-        )
-        
-        # 4. Commandes récentes
-        recent_orders = Commande.objects.select_related('client').order_by('-date')[:5]
-        
-        return JsonResponse({
-            'total': total,
-            'monthlyData': list(monthly_data),
-            'statusStats': list(status_stats),
-            'recentOrders': [
-                {
-                    'id': o.id,
-                    'date': o.date,
-                    'montant': o.montant,
-                    'client': {
-                        'nom': o.client.nom,
-                        'email': o.client.email
-                    }
-                } for o in recent_orders
-            ]
-        })
-        
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+    """Tableau de bord des ventes : total, CA mensuel, statuts, dernières commandes."""
+    return Response(statistiques_commandes())
@@ -95,10 +95,42 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', 'ilyas'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Une transaction par requête : les recalculs (factures, stock,
+        # historique) sont regroupés par erp_app.unite_travail au commit
+        'ATOMIC_REQUESTS': True,
         "default": env.db()
     }
 }
 
+# Cache partagé par tous les processus (versions des ETag de l'API) :
+# CACHE_URL=rediscache://127.0.0.1:6379/1 ou filecache:///var/tmp/erp_cache
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# Avec le cache mémoire local par défaut, les ETag et le cache des réponses
+# sont désactivés (voir erp_app.versions) ; True les force pour un processus unique
+VERSIONS_CACHE_PARTAGE = env.bool('VERSIONS_CACHE_PARTAGE', default=None)
+
+# Cache disque des PDF de factures (voir erp_app.cache_pdf), partagé par les
+# processus d'une même machine ; taille maximale en octets
+PDF_CACHE_DIR = env('PDF_CACHE_DIR', default=str(BASE_DIR / 'var' / 'pdf_factures'))
+PDF_CACHE_TAILLE_MAX = env.int('PDF_CACHE_TAILLE_MAX', default=500 * 1024 * 1024)
+# Flux PDF en ASCII85 (réglage ReportLab, pour tout le processus) : désactivé,
+# les flux compressés sont écrits en binaire, 25 % plus légers et sans
+# l'encodeur en Python pur, le plus coûteux du rendu sans l'extension rl_accel
+PDF_ASCII85 = env.bool('PDF_ASCII85', default=False)
+# Processus de rendu d'une archive ZIP servie en direct par une requête HTTP :
+# 1 = rendu dans le processus web, sans pool (la commande et le worker en ont un)
+PDF_PROCESSUS_REQUETE = env.int('PDF_PROCESSUS_REQUETE', default=1)
+
+# Fichiers produits par les tâches de fond (voir erp_app.jobs), lus par les
+# processus web : dossier partagé avec le worker
+JOBS_DIR = env('JOBS_DIR', default=str(BASE_DIR / 'var' / 'jobs'))
+# Processus de rendu d'une archive PDF par job, et durée de conservation des
+# jobs finis et de leurs fichiers
+JOBS_PROCESSUS_PDF = env.int('JOBS_PROCESSUS_PDF', default=2)
+JOBS_CONSERVATION_JOURS = env.int('JOBS_CONSERVATION_JOURS', default=7)
+
 
 
 # Password validation
@@ -147,4 +179,10 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5346",   # ← ajoute ce port
 
 ]
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+# Pagination par curseur (keyset) sur toutes les listes de l'API :
+# ?page_size=N (max 500), ?page_size=all pour un export en flux
+REST_FRAMEWORK = {
+    "DEFAULT_PAGINATION_CLASS": "erp_app.pagination.CurseurPagination",
+    "PAGE_SIZE": 50,
+}
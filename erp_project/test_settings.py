@@ -1,9 +1,33 @@
+import atexit
+import os
+import shutil
+import tempfile
+
 from .settings import *
 
-# Use in-memory SQLite database for tests
+# Base de test SQLite dans un fichier (supprimé en fin de tests) et non en
+# mémoire : les tests de concurrence ouvrent une connexion par thread, qui
+# attend le verrou d'écriture des autres jusqu'à `timeout` secondes
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
+        'ATOMIC_REQUESTS': True,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'NAME': os.path.join(tempfile.gettempdir(), f'erp_test_{os.getpid()}.sqlite3')},
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+# Un seul processus : le cache mémoire local est partagé par toutes les requêtes
+VERSIONS_CACHE_PARTAGE = True
+
+# Dossiers propres au processus de test, supprimés à sa sortie
+PDF_CACHE_DIR = tempfile.mkdtemp(prefix='erp_pdf_')
+JOBS_DIR = tempfile.mkdtemp(prefix='erp_jobs_')
+for _dossier in (PDF_CACHE_DIR, JOBS_DIR):
+    atexit.register(shutil.rmtree, _dossier, ignore_errors=True)